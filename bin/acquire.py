@@ -0,0 +1,206 @@
+"""
+Headless acquisition from a MIP board, without Kivy.
+
+The script finds the board, on the given port or by probing all the
+ports, configures its sample rate and temperature and humidity sensor,
+streams the data to the exporter and prints the acquisition statistics
+periodically, until the duration elapses or it is interrupted with
+Ctrl-C or SIGTERM. If the link is lost, the board is looked for again
+and streaming resumes in the same file.
+
+It uses `mip.communication.board.MIPSerialBase` and
+`mip.export.exporter.CSVExporterBase`, which do not depend on Kivy: no
+window or OpenGL context is created, so that it can run unattended on
+small Linux boxes next to the rigs.
+
+Usage: python bin/acquire.py [--port PORT] [--sample-rate RATE] [--temp-rh-rate RATE]
+                             [--temp-rh-repeatability REP] [--duration SECONDS] [--output DIR]
+                             [--format txt|csv] [--header TEXT] [--stats-interval SECONDS]
+"""
+import time
+
+START_TIME = time.perf_counter()
+
+import argparse
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mip.communication.board import (MIPSerialBase, BOARD_CONNECTED, READ_MODE_BLOCKING, READ_MODE_POLLING,
+                                     READ_MODE_ASYNCIO)
+from mip.communication.commands import SAMPLE_RATES, TEMP_RH_SAMPLE_RATES
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+PORT_ENV_VAR = 'MIP_PORT'
+"""
+Environment variable with the port of the board, as for the GUI.
+See `mip.communication.board_manager`, which is not imported as it depends on Kivy.
+"""
+
+STATS_INTERVAL = 10
+"""
+Default time, in seconds, between two lines of statistics.
+"""
+
+TEMP_RH_REPEATABILITIES = ['Low', 'Med', 'High']
+"""
+Repeatabilities of the temperature and humidity sensor, as in the GUI settings.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Acquire data from a MIP board without the GUI.')
+    parser.add_argument('--port', default=os.environ.get(PORT_ENV_VAR),
+                        help=f'port of the board, also from {PORT_ENV_VAR}, found by probing all the ports if not given')
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--read-mode', default=READ_MODE_BLOCKING,
+                        choices=[READ_MODE_BLOCKING, READ_MODE_POLLING, READ_MODE_ASYNCIO])
+    parser.add_argument('--sample-rate', choices=SAMPLE_RATES, help='data sample rate, unchanged if not given')
+    parser.add_argument('--temp-rh-rate', choices=TEMP_RH_SAMPLE_RATES,
+                        help='temperature and humidity sample rate, unchanged if not given')
+    parser.add_argument('--temp-rh-repeatability', choices=TEMP_RH_REPEATABILITIES,
+                        help='temperature and humidity repeatability, unchanged if not given')
+    parser.add_argument('--duration', type=float, help='acquisition time, in seconds, until interrupted if not given')
+    parser.add_argument('--output', help='folder of the exported files, from the GUI settings if not given')
+    parser.add_argument('--format', choices=['txt', 'csv'], help='format of the exported files')
+    parser.add_argument('--header', default='', help='custom header of the exported files')
+    parser.add_argument('--no-export', action='store_true', help='do not write the data to files')
+    parser.add_argument('--capture', action='store_true', help='capture the raw bytes received from the board')
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL,
+                        help='time, in seconds, between two lines of statistics')
+    parser.add_argument('--log-level', default='INFO', help='minimum level of the log messages')
+    return parser.parse_args()
+
+
+def connect(board, port_name):
+    """
+    Connect to the board on the given port, or on the first port
+    where a board answers, waiting until one is found.
+
+    Returns:
+        - True if connected
+    """
+    if (port_name is not None):
+        board.port_name = port_name
+        return board.connect() == 0
+    print('Looking for the board...')
+    board.find_port()
+    return board.connected == BOARD_CONNECTED
+
+
+def configure(board, args):
+    """
+    Send the requested settings to the board and configure the exporter.
+
+    Returns:
+        - True if the board acknowledged all the settings
+    """
+    configured = True
+    if (args.sample_rate is not None):
+        try:
+            board.set_sample_rate(args.sample_rate).result()
+        except (TimeoutError, ConnectionError, ValueError) as exc:
+            logger.error(f'Could not set sample rate {args.sample_rate}: {exc}')
+            configured = False
+    if (args.temp_rh_rate is not None or args.temp_rh_repeatability is not None):
+        sample_rate = args.temp_rh_rate or board.configured_temp_rh_sample_rate
+        repeatability = args.temp_rh_repeatability or board.configured_temp_rh_sample_rep
+        try:
+            board.set_temperature_settings(sample_rate, repeatability).result()
+        except (TimeoutError, ConnectionError, ValueError) as exc:
+            logger.error(f'Could not set temperature settings {sample_rate} {repeatability}: {exc}')
+            configured = False
+    exporter = board.exporter
+    exporter.save_data = not args.no_export
+    if (args.output is not None):
+        Path(args.output).mkdir(parents=True, exist_ok=True)
+        exporter.set_output_path(None, args.output)
+    if (args.format is not None):
+        exporter.set_output_format(None, args.format)
+    exporter.custom_header = args.header
+    return configured
+
+
+def format_stats(board, elapsed):
+    """
+    Return a line with the statistics of the acquisition.
+    """
+    rate_stats = board.rate_stats().get('data', {})
+    exporter = board.exporter
+    file_name = Path(exporter.file_name).name if (exporter.save_data and hasattr(exporter, 'file_name')) else '-'
+    link = 'up' if (board.connected == BOARD_CONNECTED) else 'DOWN'
+    return (f'{elapsed:8.0f} s | link {link} | {board.samples_read} samples '
+            f'at {board.data_sample_rate:.1f} Hz (interval p99 {1000 * rate_stats.get("interval_p99", 0):.1f} ms) | '
+            f'T/RH {board.temperature_sample_rate:.2f} Hz | lost {board.missing_packets} '
+            f'({board.packet_loss_per_minute:.0f}/min) | CRC errors {board.crc_errors} | '
+            f'battery {board.battery_voltage:.2f} V | file {file_name}')
+
+
+def print_resources():
+    if (resource is not None):
+        # Kilobytes on Linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f'Peak resident memory: {max_rss / 1024:.1f} MB')
+
+
+def acquire(args):
+    board = MIPSerialBase(baudrate=args.baudrate, read_mode=args.read_mode, discover=False, capture=args.capture)
+    print(f'Started in {time.perf_counter() - START_TIME:.2f} s')
+    if (not connect(board, args.port)):
+        print(f'Could not connect to the board on {args.port}')
+        return 1
+    print(f'Connected to the board on {board.port_name}')
+    if (not configure(board, args)):
+        print('The board did not acknowledge all the settings')
+    print(f'Sample rate {board.configured_sample_rate}, temperature and humidity '
+          f'{board.configured_temp_rh_sample_rate} {board.configured_temp_rh_sample_rep}')
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    board.start_streaming()
+    start = time.monotonic()
+    board.wait_export_session()
+    if (board.exporter.save_data):
+        print(f'Exporting to {board.exporter.file_name}')
+    try:
+        while (not stop_event.is_set()):
+            elapsed = time.monotonic() - start
+            wait = args.stats_interval
+            if (args.duration is not None):
+                if (elapsed >= args.duration):
+                    break
+                wait = min(wait, args.duration - elapsed)
+            if (stop_event.wait(wait)):
+                break
+            print(format_stats(board, time.monotonic() - start), flush=True)
+    except KeyboardInterrupt:
+        pass
+    # The export session is closed once the exporter has written all the packets received
+    if (board.connected == BOARD_CONNECTED):
+        board.stop_streaming()
+    else:
+        # Link lost: close the export session without the board
+        board.is_streaming = False
+    board.wait_export_session()
+    print(format_stats(board, time.monotonic() - start))
+    board.disconnect()
+    print_resources()
+    return 0
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    sys.exit(acquire(args))
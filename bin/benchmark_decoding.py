@@ -0,0 +1,68 @@
+"""
+Benchmark of the NumPy batch decoder against the scalar conversion functions.
+
+Random data frames are converted both one sample at a time with the
+scalar functions and in a single call with `decode_data_frames`.
+The script checks that the two give exactly the same values and
+reports the number of frames converted per second.
+
+Usage: python bin/benchmark_decoding.py [n_frames]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mip.communication.decoding import (convert_capacitance, convert_humidity, convert_temperature,
+                                        decode_data_frames, has_temperature_data)
+from mip.communication.framing import (DATA_FRAME, DATA_FRAME_LEN, DATA_PACKET_HEADER, DATA_PACKET_TAIL,
+                                       DATA_TEMPERATURE_SLICE, DATA_HUMIDITY_SLICE, DATA_CAPDAC_SLICE,
+                                       DATA_CAPACITANCE_SLICES)
+
+
+def build_frames(n_frames):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, size=(n_frames, DATA_FRAME_LEN), dtype=np.uint8)
+    frames[:, 0] = DATA_PACKET_HEADER
+    frames[:, -1] = DATA_PACKET_TAIL
+    # Some frames without temperature and humidity data
+    frames[::3, 3:7] = 0
+    return frames.tobytes()
+
+
+def decode_scalar(buffer):
+    temperature, humidity, valid, capacitance = [], [], [], []
+    for fields in DATA_FRAME.iter_unpack(buffer):
+        temp = convert_temperature(fields[DATA_TEMPERATURE_SLICE])
+        hum = convert_humidity(fields[DATA_HUMIDITY_SLICE])
+        temperature.append(temp)
+        humidity.append(hum)
+        valid.append(has_temperature_data(temp, hum))
+        capdac = fields[DATA_CAPDAC_SLICE]
+        capacitance.append([convert_capacitance(fields[cap_slice], capdac[idx])
+                            for idx, cap_slice in enumerate(DATA_CAPACITANCE_SLICES)])
+    return temperature, humidity, valid, capacitance
+
+
+if __name__ == '__main__':
+    n_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    buffer = build_frames(n_frames)
+
+    start = time.perf_counter()
+    temperature, humidity, valid, capacitance = decode_scalar(buffer)
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = decode_data_frames(buffer)
+    batch_time = time.perf_counter() - start
+
+    assert np.array_equal(decoded.temperature, np.array(temperature))
+    assert np.array_equal(decoded.humidity, np.array(humidity))
+    assert np.array_equal(decoded.has_temp_data, np.array(valid))
+    assert np.array_equal(decoded.capacitance, np.array(capacitance))
+    print(f'{n_frames} frames, batch results match scalar results exactly')
+    print(f'scalar: {scalar_time:.3f} s -> {n_frames / scalar_time:,.0f} frames/s')
+    print(f' batch: {batch_time:.3f} s -> {n_frames / batch_time:,.0f} frames/s')
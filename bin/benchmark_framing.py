@@ -0,0 +1,171 @@
+"""
+Microbenchmark of the frame scanner against the byte-at-a-time state machine.
+
+The same synthetic stream of data, voltage and sample rate frames is
+decoded by both implementations, and the number of frames decoded
+per second is reported. The state machine is a copy of the one that
+was used in `MIPSerial.read_data`, without the 1 ms sleep, reading
+from an in-memory port.
+
+Usage: python bin/benchmark_framing.py [n_frames] [chunk_size]
+"""
+import io
+import struct
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mip.communication.framing import (FrameScanner, crc8, DATA_PACKET_HEADER, DATA_PACKET_TAIL,
+                                       VOLTAGE_PACKET_HEADER, VOLTAGE_PACKET_TAIL,
+                                       SAMPLE_RATE_PACKET_HEADER, SAMPLE_RATE_PACKET_TAIL)
+
+
+class MemoryPort():
+    """
+    Minimal in-memory replacement of `serial.Serial` for reading.
+    """
+    def __init__(self, data, chunk_size):
+        self.stream = io.BytesIO(data)
+        self.size = len(data)
+        self.chunk_size = chunk_size
+        self.available = 0
+
+    @property
+    def in_waiting(self):
+        # Bytes become available in chunks, as they would from the OS buffer
+        if (self.available == 0):
+            left = self.size - self.stream.tell()
+            self.available = min(self.chunk_size, left)
+        return self.available
+
+    def read(self, size=1):
+        data = self.stream.read(size)
+        self.available = max(0, self.available - len(data))
+        return data
+
+
+def build_stream(n_frames):
+    stream = bytearray()
+    for idx in range(n_frames):
+        if (idx % 100 == 0):
+            stream += bytes([VOLTAGE_PACKET_HEADER, 0x01, 0x90, VOLTAGE_PACKET_TAIL])
+        if (idx % 1000 == 0):
+            stream += bytes([SAMPLE_RATE_PACKET_HEADER, 0x04, 0x21, 0x26, SAMPLE_RATE_PACKET_TAIL])
+        payload = bytearray([idx & 0xFF])
+        payload += bytes([0x66, 0x66, 0x80, 0x00])
+        payload += bytes([0x04, 0x05, 0x06, 0x07])
+        payload += bytes(range(12))
+        payload += bytes(4)
+        stream += bytes([DATA_PACKET_HEADER, crc8(payload)])
+        stream += payload
+        stream += bytes([DATA_PACKET_TAIL])
+    return bytes(stream)
+
+
+def convert_temperature(raw_temperature):
+    temp = raw_temperature[0] << 8 | raw_temperature[1]
+    return -45 + 175 * temp / ((2 << 15) - 1)
+
+
+def convert_humidity(raw_humidity):
+    temp = raw_humidity[0] << 8 | raw_humidity[1]
+    return 100 * temp / ((2 << 15) - 1)
+
+
+def convert_capacitance(capacitance, capdac):
+    capacitance_v = capacitance[0] << 16 | capacitance[1] << 8 | capacitance[2]
+    return capacitance_v / (2 << 18) + capdac * 3.125
+
+
+def run_state_machine(port):
+    frames = 0
+    read_state = 0
+    packet_type = ''
+    while (port.in_waiting > 0):
+        if (read_state == 0):
+            b = struct.unpack('B', port.read(1))[0]
+            if (b == DATA_PACKET_HEADER or b == VOLTAGE_PACKET_HEADER or b == SAMPLE_RATE_PACKET_HEADER):
+                read_state = 1
+                if (b == VOLTAGE_PACKET_HEADER):
+                    packet_type = 'voltage'
+                elif (b == SAMPLE_RATE_PACKET_HEADER):
+                    packet_type = 'sample rate'
+                else:
+                    packet_type = 'data'
+        elif (read_state == 1):
+            if (packet_type == 'data'):
+                crc = port.read(1)
+            elif (packet_type == 'voltage'):
+                temp_voltage = port.read(2)
+            elif (packet_type == 'sample rate'):
+                temp_sample_rate = port.read(3)
+            read_state = 2
+        elif (read_state == 2):
+            if (packet_type == 'data'):
+                packet_counter = struct.unpack('B', port.read(1))[0]
+                read_state = 3
+            elif (packet_type == 'voltage'):
+                if (struct.unpack('B', port.read(1))[0] == VOLTAGE_PACKET_TAIL):
+                    struct.unpack('2B', temp_voltage)
+                    frames += 1
+                    read_state = 0
+            elif (packet_type == 'sample rate'):
+                if (struct.unpack('B', port.read(1))[0] == SAMPLE_RATE_PACKET_TAIL):
+                    struct.unpack('3B', temp_sample_rate)
+                    frames += 1
+                    read_state = 0
+        elif (read_state == 3):
+            temperature = convert_temperature(struct.unpack('2B', port.read(2)))
+            humidity = convert_humidity(struct.unpack('2B', port.read(2)))
+            read_state = 4
+        elif (read_state == 4):
+            capdac = struct.unpack('4B', port.read(4))
+            cap = port.read(12)
+            cap_values = [convert_capacitance(struct.unpack('3B', cap[3 * idx:3 * idx + 3]), capdac[idx])
+                          for idx in range(4)]
+            read_state = 5
+        elif (read_state == 5):
+            current = port.read(2)
+            aux = port.read(2)
+            read_state = 6
+        elif (read_state == 6):
+            if (struct.unpack('B', port.read(1))[0] == DATA_PACKET_TAIL):
+                frames += 1
+            read_state = 0
+    return frames
+
+
+def run_scanner(port):
+    frames = 0
+    scanner = FrameScanner()
+    while (port.in_waiting > 0):
+        for header, fields, valid in scanner.feed(port.read(port.in_waiting)):
+            if (header == DATA_PACKET_HEADER):
+                convert_temperature(fields[3:5])
+                convert_humidity(fields[5:7])
+                capdac = fields[7:11]
+                cap_values = [convert_capacitance(fields[11 + 3 * idx:14 + 3 * idx], capdac[idx])
+                              for idx in range(4)]
+            frames += 1
+    return frames
+
+
+def benchmark(name, function, data, chunk_size):
+    port = MemoryPort(data, chunk_size)
+    start = time.perf_counter()
+    frames = function(port)
+    elapsed = time.perf_counter() - start
+    print(f'{name:>15}: {frames} frames in {elapsed:.3f} s -> {frames / elapsed:,.0f} frames/s')
+    return frames / elapsed
+
+
+if __name__ == '__main__':
+    n_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    data = build_stream(n_frames)
+    print(f'{len(data)} bytes, read in chunks of up to {chunk_size} bytes')
+    old_rate = benchmark('state machine', run_state_machine, data, chunk_size)
+    new_rate = benchmark('frame scanner', run_scanner, data, chunk_size)
+    print(f'Speedup: {new_rate / old_rate:.1f}x')
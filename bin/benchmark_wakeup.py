@@ -0,0 +1,88 @@
+"""
+Measure idle CPU use and wake-up latency of the serial reader modes.
+
+A pseudo-terminal stands in for the board: a writer thread sends
+single bytes on the master side at random intervals, while a reader
+on the slave side, opened with pyserial, waits for them either by
+polling `in_waiting` every millisecond or by blocking in the kernel
+with a read timeout. For each mode the script reports the CPU time
+used by the process while the link is idle and the delay between
+each byte being written and the reader waking up with it.
+
+Linux/macOS only.
+
+Usage: python bin/benchmark_wakeup.py [n_bytes] [idle_seconds]
+"""
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tty
+
+import serial
+
+# Same values as in mip.communication.mserial, which requires Kivy
+READ_MODE_BLOCKING = 'blocking'
+READ_MODE_POLLING = 'polling'
+READ_TIMEOUT = 0.5
+
+
+def reader(port, read_mode, n_bytes, arrivals, stop_event):
+    received = 0
+    while (received < n_bytes and not stop_event.is_set()):
+        if (read_mode == READ_MODE_BLOCKING):
+            data = port.read(port.in_waiting or 1)
+        else:
+            n_waiting = port.in_waiting
+            data = port.read(n_waiting) if (n_waiting > 0) else b''
+            time.sleep(0.001)
+        if (len(data) > 0):
+            now = time.perf_counter_ns()
+            arrivals.extend([now] * len(data))
+            received += len(data)
+
+
+def run(read_mode, n_bytes, idle_seconds):
+    master, slave = os.openpty()
+    tty.setraw(master)
+    port = serial.Serial(os.ttyname(slave), timeout=READ_TIMEOUT)
+    arrivals = []
+    stop_event = threading.Event()
+    thread = threading.Thread(target=reader, args=(port, read_mode, n_bytes, arrivals, stop_event))
+    thread.start()
+
+    # Idle phase: nothing is written, measure CPU time of the process
+    cpu_start = time.process_time()
+    time.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - cpu_start) / idle_seconds * 100
+
+    # Latency phase: single bytes at random intervals
+    departures = []
+    for _ in range(n_bytes):
+        time.sleep(random.uniform(0.005, 0.02))
+        departures.append(time.perf_counter_ns())
+        os.write(master, b'\xa1')
+    thread.join(timeout=5)
+    stop_event.set()
+    if (read_mode == READ_MODE_BLOCKING):
+        port.cancel_read()
+    thread.join()
+    port.close()
+    os.close(master)
+    os.close(slave)
+
+    latencies = [(arrival - departure) / 1000 for departure, arrival in zip(departures, arrivals)]
+    latencies.sort()
+    print(f'{read_mode:>9}: idle CPU {idle_cpu:5.2f} %, '
+          f'wake-up latency median {statistics.median(latencies):7.1f} us, '
+          f'p99 {latencies[int(len(latencies) * 0.99) - 1]:7.1f} us, '
+          f'max {latencies[-1]:7.1f} us')
+
+
+if __name__ == '__main__':
+    n_bytes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    idle_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    run(READ_MODE_POLLING, n_bytes, idle_seconds)
+    run(READ_MODE_BLOCKING, n_bytes, idle_seconds)
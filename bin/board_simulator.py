@@ -0,0 +1,36 @@
+"""
+Run a simulated MIP board on a pseudo-terminal.
+
+The script prints the name of the pty, which can be used to connect the
+GUI to the simulator (`MIP_PORT=<pty> python main.py`), then reports the
+simulator counters every few seconds until interrupted with Ctrl-C.
+
+Linux/macOS only.
+
+Usage: python bin/board_simulator.py [stream_rate_hz] [drop_rate] [corrupt_rate]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mip.communication.simulator import BoardSimulator
+
+STATS_INTERVAL = 5
+
+
+if __name__ == '__main__':
+    stream_rate = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    drop_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    corrupt_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    simulator = BoardSimulator(stream_rate=stream_rate, drop_rate=drop_rate, corrupt_rate=corrupt_rate)
+    print(f'Simulated board on {simulator.port_name}')
+    print(f'Connect with: MIP_PORT={simulator.port_name} python main.py')
+    try:
+        while (True):
+            time.sleep(STATS_INTERVAL)
+            print(simulator.stats())
+    except KeyboardInterrupt:
+        pass
+    simulator.close()
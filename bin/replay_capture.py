@@ -0,0 +1,65 @@
+"""
+Replay a raw capture through a `replay://` port and measure the throughput.
+
+The capture is read through `serial.serial_for_url`, exactly as
+`MIPSerial.connect` opens the port, and every chunk is passed to the
+frame scanner and the batch decoder. An exported recording, in txt or
+csv format, is first converted into a capture next to it. The script
+reports the bytes and frames per second and the achieved replay speed.
+
+Usage: python bin/replay_capture.py capture_or_recording [speed|max] [start_seconds]
+"""
+import sys
+import time
+from pathlib import Path
+
+import serial
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mip.communication  # registers the replay:// ports
+from mip.communication.capture import CAPTURE_FILE_EXTENSION
+from mip.communication.commands import START_STREAMING_CMD
+from mip.communication.decoding import decode_data_frames
+from mip.communication.framing import FrameScanner, DATA_FRAME, DATA_PACKET_HEADER
+from mip.utils.file_conversion import recording_to_capture
+
+
+def replay(capture_path, speed, start):
+    port = serial.serial_for_url(f'replay://{capture_path.resolve()}?speed={speed}&start={start}', timeout=0.5)
+    scanner = FrameScanner()
+    n_frames = 0
+    n_invalid = 0
+    start_time = time.perf_counter()
+    port.write(START_STREAMING_CMD.encode('utf-8'))
+    while (not port.player.finished()):
+        data = port.read(port.in_waiting or 1)
+        frames = scanner.feed(data)
+        data_frames = [DATA_FRAME.pack(*fields) for header, fields, valid in frames
+                       if header == DATA_PACKET_HEADER and valid]
+        n_invalid += sum(1 for _, _, valid in frames if not valid)
+        if (len(data_frames) > 0):
+            decode_data_frames(b''.join(data_frames))
+            n_frames += len(data_frames)
+    elapsed = time.perf_counter() - start_time
+    stats = port.replay_stats()
+    port.close()
+    print(f'{stats["bytes_played"]} bytes, {n_frames} data frames, {n_invalid} invalid frames '
+          f'in {elapsed:.2f} s')
+    print(f'{stats["bytes_per_second"] / 1e3:,.1f} kB/s, {n_frames / elapsed:,.0f} frames/s, '
+          f'{stats["speed"]:.1f}x real time')
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) < 2):
+        print(__doc__)
+        sys.exit(1)
+    input_path = Path(sys.argv[1])
+    speed = sys.argv[2] if len(sys.argv) > 2 else 'max'
+    start = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    if (input_path.suffix != CAPTURE_FILE_EXTENSION):
+        capture_path = input_path.with_suffix(CAPTURE_FILE_EXTENSION)
+        if (not capture_path.exists()):
+            recording_to_capture(input_path, capture_path)
+        input_path = capture_path
+    replay(input_path, speed, start)
@@ -1,12 +1,21 @@
 """
 Main file to run the MIP GUI.
+
+Usage: python main.py [--profile THREADS] [--profile-sampling [MS]] [--profile-dir DIR]
+
+The options enable the profiling of the threads of the application,
+see `mip.utils.profiling`.
 """
+import argparse
+# Imported first, so that Kivy leaves the command line to the application
+import mip
 from kivy.app import App
 from kivy.config import Config
 from kivy.lang import Builder
 from mip.widgets.container import ContainerLayout
 import random
 import mip.widgets.dialogs
+from mip.utils import profiling
 from kivy.core.window import Window
 
 Config.set('kivy', 'exit_on_escape', '0')
@@ -41,4 +50,14 @@ class MIPBoard(App):
         self.exit_check_opened = False
 
 if __name__ == '__main__':
-    MIPBoard().run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Run the MIP GUI.')
+    parser.add_argument('--profile', metavar='THREADS',
+                        help=f"comma separated threads to profile, among {', '.join(profiling.PROFILED_THREADS)}, or all")
+    parser.add_argument('--profile-sampling', metavar='MS', type=float, nargs='?',
+                        const=profiling.DEFAULT_SAMPLING_INTERVAL,
+                        help='sample the stacks of all the threads every MS milliseconds')
+    parser.add_argument('--profile-dir', metavar='DIR', help='folder of the profiles')
+    args = parser.parse_args()
+    if (args.profile is not None or args.profile_sampling is not None):
+        profiling.configure(profiling.parse_threads(args.profile or ''), args.profile_sampling, args.profile_dir)
+    profiling.profiled(profiling.THREAD_UI, MIPBoard().run)()
\ No newline at end of file
@@ -4,4 +4,11 @@ over a serial port with the MIP device.
 It defines several functions to read data from
 the device, and to write new configuration 
 settings to it.
-"""
\ No newline at end of file
+
+Importing the package registers the `replay://` ports of
+`mip.communication.protocol_replay` with `serial.serial_for_url`.
+"""
+import serial
+
+if ('mip.communication' not in serial.protocol_handler_packages):
+    serial.protocol_handler_packages.append('mip.communication')
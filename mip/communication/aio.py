@@ -0,0 +1,694 @@
+"""
+asyncio transport for the link with MIP boards.
+
+The file descriptor of the serial port is watched by the event loop,
+so that a single thread can serve any number of boards without one
+blocked reader thread per board. The module provides:
+    - `SerialTransport`, an `asyncio.Transport` over an open pyserial port
+    - `MIPProtocol`, which decodes the received bytes into frames and
+      resolves the waits for the replies of the board
+    - `AsyncMIPBoard`, with async `connect`, `start_streaming`,
+      `stop_streaming` and an async iterator of decoded frames
+    - `probe_mip_port_async` and `find_mip_ports_async` for discovery
+    - `LinkLoop`, an event loop running in a background thread, used by
+      `mip.communication.board.MIPSerialBase` in `READ_MODE_ASYNCIO`
+
+`MIPSerialBase` only uses the transport steps of `AsyncMIPBoard`,
+`open` and `request_connection`: the rest of the handshake, the link
+watchdog, the reconnection and the exclusion of the ports in use by
+other boards are shared with the threaded read modes. A standalone
+`AsyncMIPBoard` does not reconnect by itself.
+
+Usage:
+>>> async def main():
+...     board = AsyncMIPBoard('/dev/rfcomm0')
+...     await board.connect()
+...     await board.start_streaming()
+...     async for header, fields, valid in board:
+...         ...
+
+The transport needs a serial port with a file descriptor that can be
+watched by the event loop, which is the case on Linux and macOS.
+
+This module does not depend on Kivy.
+"""
+import asyncio
+from datetime import datetime
+import os
+import threading
+import time
+
+import serial
+from loguru import logger
+
+from mip.communication.commands import (CONN_REQUEST_CMD, CONN_REPLY, START_STREAMING_CMD, STOP_STREAMING_CMD,
+                                        RETRIEVE_SAMPLE_RATE_CMD, READY_REPLY_TIMEOUT,
+                                        SAMPLE_RATE_REPLY_TIMEOUT, build_time_command)
+from mip.communication.discovery import PROBE_REPLY_TIMEOUT, list_candidate_ports
+from mip.communication.framing import FrameScanner, CRC_POLICY_FLAG, SAMPLE_RATE_PACKET_HEADER
+from mip.utils.profiling import profiled, THREAD_READER
+
+READ_CHUNK_SIZE = 4096
+"""
+Maximum number of bytes read from the port each time
+the event loop reports it as readable.
+"""
+
+FRAME_QUEUE_SIZE = 4096
+"""
+Maximum number of decoded frames waiting to be consumed
+by the async iterator. When full, the oldest frames are dropped.
+"""
+
+
+class SerialTransport(asyncio.Transport):
+    """
+    asyncio transport over an open pyserial port.
+
+    Reads and writes are performed directly on the non-blocking file
+    descriptor of the port when the event loop reports it as ready.
+    The port is closed when the connection is lost.
+
+    Args:
+        - loop: the event loop serving the port
+        - protocol: the `asyncio.Protocol` receiving the data
+        - port: the open `serial.Serial` object
+    """
+
+    def __init__(self, loop, protocol, port):
+        super().__init__()
+        self.loop = loop
+        self.protocol = protocol
+        self.port = port
+        self.fd = port.fileno()
+        self.write_buffer = bytearray()
+        self.closing = False
+        self.lost = False
+        self.reading = True
+        self.protocol.connection_made(self)
+        self.loop.add_reader(self.fd, self.read_ready)
+
+    def get_extra_info(self, name, default=None):
+        if (name == 'serial'):
+            return self.port
+        return default
+
+    def read_ready(self):
+        try:
+            data = os.read(self.fd, READ_CHUNK_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as exc:
+            self.abort(exc)
+            return
+        if (len(data) == 0):
+            # Readable with no data: the device is gone
+            self.abort(ConnectionError(f'Port {self.port.port} closed by the device'))
+            return
+        self.protocol.data_received(data)
+
+    def write(self, data):
+        if (self.closing):
+            return
+        if (len(self.write_buffer) == 0):
+            try:
+                n_written = os.write(self.fd, data)
+            except (BlockingIOError, InterruptedError):
+                n_written = 0
+            except OSError as exc:
+                self.abort(exc)
+                return
+            if (n_written == len(data)):
+                return
+            data = data[n_written:]
+            self.loop.add_writer(self.fd, self.write_ready)
+        self.write_buffer += data
+
+    def write_ready(self):
+        try:
+            n_written = os.write(self.fd, self.write_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as exc:
+            self.abort(exc)
+            return
+        del self.write_buffer[:n_written]
+        if (len(self.write_buffer) == 0):
+            self.loop.remove_writer(self.fd)
+            if (self.closing):
+                self.call_connection_lost(None)
+
+    def get_write_buffer_size(self):
+        return len(self.write_buffer)
+
+    def can_write_eof(self):
+        return False
+
+    def is_closing(self):
+        return self.closing
+
+    def is_reading(self):
+        return self.reading and not self.closing
+
+    def pause_reading(self):
+        if (self.is_reading()):
+            self.reading = False
+            self.loop.remove_reader(self.fd)
+
+    def resume_reading(self):
+        if (not self.reading and not self.closing):
+            self.reading = True
+            self.loop.add_reader(self.fd, self.read_ready)
+
+    def close(self):
+        """
+        Close the transport once the pending writes are flushed.
+        """
+        if (self.closing):
+            return
+        self.closing = True
+        self.loop.remove_reader(self.fd)
+        if (len(self.write_buffer) == 0):
+            self.loop.call_soon(self.call_connection_lost, None)
+
+    def abort(self, exc=None):
+        """
+        Close the transport right away, dropping the pending writes.
+
+        Args:
+            - exc: the exception that caused the abort, if any
+        """
+        self.closing = True
+        self.write_buffer.clear()
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.loop.call_soon(self.call_connection_lost, exc)
+
+    def call_connection_lost(self, exc):
+        if (self.lost):
+            return
+        self.lost = True
+        try:
+            self.protocol.connection_lost(exc)
+        finally:
+            try:
+                self.port.close()
+            except (serial.SerialException, OSError):
+                pass
+
+
+class MIPProtocol(asyncio.Protocol):
+    """
+    Protocol decoding the bytes received from a MIP board.
+
+    Decoded frames are either passed to a callback, in the event
+    loop thread, or stored in a bounded queue read by the async
+    iterator of `AsyncMIPBoard`. Coroutines can wait for a given
+    reply string or for the next frame with a given header.
+
+    Args:
+        - scanner: the `FrameScanner` decoding the frames, a new one if None
+        - frame_callback: optional function called with each list of decoded
+          frames and the `time.monotonic_ns()` at which their chunk was received
+        - connection_lost_callback: optional function called with the
+          exception, or None, when the connection is lost
+        - data_callback: optional function called with each chunk of
+          received bytes, before decoding, and its `time.monotonic_ns()`
+    """
+
+    def __init__(self, scanner=None, frame_callback=None, connection_lost_callback=None, data_callback=None):
+        self.scanner = scanner if (scanner is not None) else FrameScanner(crc_policy=CRC_POLICY_FLAG)
+        self.frame_callback = frame_callback
+        self.connection_lost_callback = connection_lost_callback
+        self.data_callback = data_callback
+        self.transport = None
+        self.frames = asyncio.Queue(FRAME_QUEUE_SIZE)
+        self.dropped_frames = 0
+        self.reset_requested = False
+        self.reply_waiters = []
+        self.frame_waiters = []
+        self.last_frame_time = 0
+        self.closed = asyncio.Event()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.last_frame_time = time.monotonic()
+
+    def request_reset(self):
+        """
+        Discard any partial frame before decoding the next data.
+        Can be called from any thread.
+        """
+        self.reset_requested = True
+
+    def data_received(self, data):
+        timestamp = time.monotonic_ns()
+        if (self.data_callback is not None):
+            self.data_callback(data, timestamp)
+        if (self.reset_requested):
+            self.reset_requested = False
+            self.scanner.reset()
+        if (len(self.reply_waiters) > 0):
+            self.check_replies(data)
+        frames = self.scanner.feed(data)
+        if (len(frames) == 0):
+            return
+        if (any(valid for _, _, valid in frames)):
+            self.last_frame_time = time.monotonic()
+        if (len(self.frame_waiters) > 0):
+            self.check_frame_waiters(frames)
+        if (self.frame_callback is not None):
+            self.frame_callback(frames, timestamp)
+        else:
+            for frame in frames:
+                self.queue_frame(frame)
+
+    def queue_frame(self, frame):
+        """
+        Store a frame in the queue, dropping the oldest one if it is full.
+        """
+        if (self.frames.full()):
+            self.frames.get_nowait()
+            self.dropped_frames += 1
+        self.frames.put_nowait(frame)
+
+    def check_replies(self, data):
+        for waiter in list(self.reply_waiters):
+            reply, future, received = waiter
+            received += data
+            if (reply in received):
+                if (not future.done()):
+                    future.set_result(True)
+                self.reply_waiters.remove(waiter)
+            else:
+                # Keep only the bytes that could be the start of the reply
+                del received[:-len(reply)]
+
+    def check_frame_waiters(self, frames):
+        for header, fields, valid in frames:
+            if (not valid):
+                continue
+            for waiter in list(self.frame_waiters):
+                waiter_header, future = waiter
+                if (waiter_header == header):
+                    if (not future.done()):
+                        future.set_result(fields)
+                    self.frame_waiters.remove(waiter)
+
+    async def wait_for_reply(self, reply, timeout):
+        """
+        Wait until a reply string is received.
+
+        Args:
+            - reply: the expected reply, as a string or bytes
+            - timeout: maximum waiting time, in seconds
+
+        Returns:
+            - True if the reply was received before the timeout
+        """
+        if (isinstance(reply, str)):
+            reply = reply.encode('utf-8')
+        waiter = (reply, asyncio.get_running_loop().create_future(), bytearray())
+        self.reply_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if (waiter in self.reply_waiters):
+                self.reply_waiters.remove(waiter)
+
+    async def wait_for_frame(self, header, timeout):
+        """
+        Wait for the next valid frame with a given header.
+
+        Args:
+            - header: the header byte of the expected frame
+            - timeout: maximum waiting time, in seconds
+
+        Returns:
+            - the fields of the frame, or None if the timeout expired
+        """
+        waiter = (header, asyncio.get_running_loop().create_future())
+        self.frame_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if (waiter in self.frame_waiters):
+                self.frame_waiters.remove(waiter)
+
+    def connection_lost(self, exc):
+        error = exc if (exc is not None) else ConnectionError('Connection closed')
+        for _, future, _ in self.reply_waiters:
+            if (not future.done()):
+                future.set_exception(error)
+        for _, future in self.frame_waiters:
+            if (not future.done()):
+                future.set_exception(error)
+        self.reply_waiters.clear()
+        self.frame_waiters.clear()
+        # None marks the end of the frames for the async iterator
+        self.queue_frame(None)
+        self.closed.set()
+        if (self.connection_lost_callback is not None):
+            self.connection_lost_callback(exc)
+
+
+async def open_serial_connection(port_name, baudrate, protocol):
+    """
+    Open a serial port and connect it to a protocol.
+
+    The port is opened in the default executor, since opening a
+    Bluetooth port may block while the link is established, with
+    an exclusive lock, as in `mip.communication.discovery`.
+
+    Args:
+        - port_name: name of the port
+        - baudrate: baudrate of the port
+        - protocol: the protocol receiving the data
+
+    Returns:
+        - the `SerialTransport` of the port
+
+    Raises:
+        - serial.SerialException: if the port could not be opened
+    """
+    loop = asyncio.get_running_loop()
+    port = await loop.run_in_executor(
+        None, lambda: serial.Serial(port=port_name, baudrate=baudrate, timeout=0, exclusive=True))
+    port.reset_input_buffer()
+    return SerialTransport(loop, protocol, port)
+
+
+class AsyncMIPBoard():
+    """
+    Link with a single MIP board, served by the running event loop.
+
+    Args:
+        - port_name: name of the port of the board
+        - baudrate: baudrate of the port
+        - scanner: the `FrameScanner` decoding the frames, a new one if None
+        - frame_callback: optional function called, in the event loop thread,
+          with each list of decoded frames and the `time.monotonic_ns()` at
+          which their chunk was received, in place of the async iterator
+        - connection_lost_callback: optional function called with the
+          exception, or None, when the connection is lost
+        - data_callback: optional function called, in the event loop thread,
+          with each chunk of received bytes, before decoding, and its timestamp
+    """
+
+    def __init__(self, port_name=None, baudrate=115200, scanner=None, frame_callback=None,
+                    connection_lost_callback=None, data_callback=None):
+        self.port_name = port_name
+        self.baudrate = baudrate
+        self.scanner = scanner
+        self.frame_callback = frame_callback
+        self.connection_lost_callback = connection_lost_callback
+        self.data_callback = data_callback
+        self.transport = None
+        self.protocol = None
+        self.sample_rate_fields = None
+
+    async def connect(self, port_name=None):
+        """
+        Open the port and perform the connection handshake.
+
+        Each step waits only until the board answers, with an upper
+        timeout, as in `mip.communication.board.MIPSerialBase.connect`.
+        The duration of each phase is logged.
+
+        Args:
+            - port_name: name of the port, the one given to the constructor if None
+
+        Returns:
+            - True if the board answered to the connection request
+
+        Raises:
+            - serial.SerialException: if the port could not be opened
+        """
+        start_time = time.monotonic()
+        await self.open(port_name)
+        open_time = time.monotonic()
+        ready = await self.request_connection()
+        if (not ready):
+            logger.warning(f'No reply to connection request on {self.port_name}')
+        ready_time = time.monotonic()
+        self.sample_rate_fields = await self.request_configuration()
+        if (self.sample_rate_fields is None):
+            logger.warning('No reply to sample rate configuration request')
+        end_time = time.monotonic()
+        logger.debug(f'Connected to {self.port_name} in {end_time - start_time:.3f} s: '
+                     f'open {open_time - start_time:.3f} s, '
+                     f'ready {ready_time - open_time:.3f} s, '
+                     f'configuration {end_time - ready_time:.3f} s')
+        return ready
+
+    async def open(self, port_name=None):
+        """
+        Open the port, without any handshake.
+
+        Args:
+            - port_name: name of the port, the one given to the constructor if None
+
+        Raises:
+            - serial.SerialException: if the port could not be opened
+        """
+        if (port_name is not None):
+            self.port_name = port_name
+        self.protocol = MIPProtocol(self.scanner, self.frame_callback, self.connection_lost_callback,
+                                    self.data_callback)
+        self.transport = await open_serial_connection(self.port_name, self.baudrate, self.protocol)
+
+    async def request_connection(self):
+        """
+        Send the connection request and wait for the reply of the board.
+
+        Returns:
+            - True if the board answered before the timeout
+        """
+        self.write(CONN_REQUEST_CMD)
+        return await self.protocol.wait_for_reply(CONN_REPLY, READY_REPLY_TIMEOUT)
+
+    async def request_configuration(self):
+        """
+        Send the updated time and request the sample rate configuration.
+
+        Returns:
+            - the fields of the sample rate frame, or None if the timeout expired
+        """
+        self.write(build_time_command(datetime.now()))
+        self.write(RETRIEVE_SAMPLE_RATE_CMD)
+        return await self.protocol.wait_for_frame(SAMPLE_RATE_PACKET_HEADER, SAMPLE_RATE_REPLY_TIMEOUT)
+
+    def is_connected(self):
+        """
+        Return True if the port is open.
+        """
+        return self.transport is not None and not self.transport.is_closing()
+
+    def write(self, data):
+        """
+        Queue a command for writing on the port.
+
+        Args:
+            - data: the command, as a string or bytes
+        """
+        if (isinstance(data, str)):
+            data = data.encode('utf-8')
+        if (not self.is_connected()):
+            raise ConnectionError('Board is not connected')
+        self.transport.write(bytes(data))
+
+    async def start_streaming(self):
+        """
+        Start data streaming from the board.
+        """
+        self.write(START_STREAMING_CMD)
+        logger.debug('Starting data streaming')
+
+    async def stop_streaming(self):
+        """
+        Stop data streaming from the board. Any partial frame
+        left in the scanner is discarded.
+        """
+        self.write(STOP_STREAMING_CMD)
+        self.protocol.request_reset()
+        logger.debug('Stopping data streaming')
+
+    async def close(self):
+        """
+        Close the port once the pending writes are flushed.
+        """
+        if (self.transport is not None):
+            self.transport.close()
+            await self.protocol.closed.wait()
+
+    async def frames(self):
+        """
+        Async iterator of the `(header, fields, valid)` tuples
+        decoded from the board, until the connection is closed.
+        Not available when a frame callback is used.
+        """
+        while (True):
+            frame = await self.protocol.frames.get()
+            if (frame is None):
+                return
+            yield frame
+
+    def __aiter__(self):
+        return self.frames()
+
+
+async def probe_mip_port_async(port_name, baudrate=115200, timeout=PROBE_REPLY_TIMEOUT):
+    """
+    Check if a MIP device is connected to a port.
+    See `mip.communication.discovery.probe_mip_port`.
+
+    Args:
+        - port_name: name of the port to be checked
+        - baudrate: baudrate of the port
+        - timeout: maximum time, in seconds, to wait for the reply
+
+    Returns:
+        - True if the device answered on the port before the timeout
+    """
+    protocol = MIPProtocol()
+    try:
+        transport = await open_serial_connection(port_name, baudrate, protocol)
+    except (serial.SerialException, OSError, ValueError):
+        return False
+    try:
+        transport.write(CONN_REQUEST_CMD.encode('utf-8'))
+        return await protocol.wait_for_reply(CONN_REPLY, timeout)
+    except ConnectionError:
+        return False
+    finally:
+        transport.abort()
+
+
+async def find_mip_ports_async(port_names=None, baudrate=115200, first_only=True, exclude=()):
+    """
+    Probe several ports concurrently looking for MIP devices.
+    See `mip.communication.discovery.find_mip_ports`.
+
+    Args:
+        - port_names: names of the ports to be probed, all the candidate ports if None
+        - baudrate: baudrate of the ports
+        - first_only: if True, stop at the first port that answers and cancel the other probes
+        - exclude: names of the ports that must not be probed, such as the ports in use
+
+    Returns:
+        - list of the names of the ports that answered, in order of answer
+    """
+    if (port_names is None):
+        port_names = list_candidate_ports()
+    port_names = [port_name for port_name in port_names if port_name not in exclude]
+    if (len(port_names) == 0):
+        return []
+    tasks = {asyncio.ensure_future(probe_mip_port_async(port_name, baudrate)): port_name
+             for port_name in port_names}
+    found_ports = []
+    pending = set(tasks)
+    try:
+        while (len(pending) > 0):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if (not task.cancelled() and task.exception() is None and task.result()):
+                    found_ports.append(tasks[task])
+            if (first_only and len(found_ports) > 0):
+                return found_ports[:1]
+    finally:
+        for task in pending:
+            task.cancel()
+    return found_ports
+
+
+class LinkLoop():
+    """
+    Event loop running in a daemon thread, shared by all the
+    boards connected through the asyncio transport.
+
+    Usage:
+    >>> loop = LinkLoop.get()
+    >>> loop.run(board.connect(), timeout=10)
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=profiled(THREAD_READER, self.loop.run_forever, 'reader_link'),
+                                       name='mip-link-loop', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def get(cls):
+        """
+        Return the shared loop, starting it on first use.
+        """
+        with cls._lock:
+            if (cls._instance is None):
+                cls._instance = LinkLoop()
+            return cls._instance
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine in the loop and wait for its result from another thread.
+
+        Args:
+            - coro: the coroutine to be run
+            - timeout: maximum waiting time, in seconds
+
+        Returns:
+            - the result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def call_soon(self, callback, *args):
+        """
+        Schedule a function call in the loop from another thread.
+        """
+        self.loop.call_soon_threadsafe(callback, *args)
+
+
+class LinkPort():
+    """
+    Thread-safe stand-in for `serial.Serial` over an `AsyncMIPBoard`
+    served by a `LinkLoop`, so that code written for the threaded
+    port can write commands through the asyncio transport.
+
+    Args:
+        - link_loop: the `LinkLoop` serving the board
+        - board: the connected `AsyncMIPBoard`
+    """
+
+    def __init__(self, link_loop, board):
+        self.link_loop = link_loop
+        self.board = board
+        self.port = board.port_name
+        self.in_waiting = 0
+
+    @property
+    def is_open(self):
+        return self.board.is_connected()
+
+    def isOpen(self):
+        return self.is_open
+
+    def write(self, data):
+        if (not self.is_open):
+            raise serial.SerialException('Port not open')
+        self.link_loop.call_soon(self.board.transport.write, bytes(data))
+        return len(data)
+
+    def cancel_read(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        if (self.board.transport is not None):
+            self.link_loop.call_soon(self.board.transport.close)
@@ -0,0 +1,1434 @@
+"""
+Serial communication with a single MIP board, without Kivy.
+
+`MIPSerialBase` holds all the logic of the communication with a board:
+discovery, connection handshake, reading and decoding of the frames,
+delivery of the data to the subscribers, commands, link watchdog and
+reconnection. Its state is held in `mip.communication.observable`
+properties, so that it can run in processes without Kivy, such as the
+headless acquisition of `bin/acquire.py`. The GUI uses its subclass
+`mip.communication.mserial.MIPSerial`, whose properties are Kivy
+properties with the same names.
+
+This module does not depend on Kivy.
+"""
+from datetime import datetime
+import asyncio
+import serial
+import struct
+import threading
+from pathlib import Path
+import time
+from loguru import logger
+from mip.communication.observable import Observable, ObservableProperty
+from mip.export.exporter import CSVExporterBase
+from mip.communication.framing import (FrameScanner, CRC_POLICY_FLAG, VOLTAGE_PACKET_HEADER, DATA_PACKET_HEADER,
+                                       SAMPLE_RATE_PACKET_HEADER, DATA_COUNTER_IDX)
+from mip.communication.sequence import SequenceTracker
+from mip.communication import decoding
+from mip.communication.ring_buffer import RingBuffer, RING_BUFFER_CAPACITY
+from mip.communication.packets import DataPacketBatch
+from mip.communication.subscribers import Subscriber, POLICY_BLOCK, SUBSCRIBER_QUEUE_SIZE, SUBSCRIBER_DRAIN_TIMEOUT
+from mip.communication.writer import CommandWriter
+from mip.communication.commands import (CONN_REQUEST_CMD, CONN_REPLY, START_STREAMING_CMD, STOP_STREAMING_CMD,
+                                        RETRIEVE_SAMPLE_RATE_CMD, SAMPLE_RATES, SAMPLE_RATE_CMDS,
+                                        TEMP_RH_SAMPLE_RATES, TEMP_RH_CONFIG, READY_REPLY_TIMEOUT,
+                                        SAMPLE_RATE_REPLY_TIMEOUT, PendingCommands, SampleRateConfiguration,
+                                        SD_CARD_REC_CMDS, build_time_command, build_temp_rh_command,
+                                        build_sd_card_header_command, failed_future)
+from mip.communication.discovery import (RESCAN_INTERVAL, find_mip_ports, probe_mip_port, wait_for_reply,
+                                         port_registry)
+from mip.communication.port_cache import PortCache
+from mip.communication.aio import AsyncMIPBoard, LinkLoop, LinkPort
+from mip.communication.protocol_replay import is_replay_port
+from mip.communication.capture import CaptureWriter, CAPTURE_FILE_EXTENSION
+from mip.communication.timing import DeviceClock
+from mip.communication.rate import RateEstimator, RATE_UPDATE_INTERVAL
+from mip.communication import latency
+from mip.utils.profiling import profiled, THREAD_READER, THREAD_EXPORTER
+
+#############################################
+#                 Constants                 #
+#############################################
+
+BOARD_DISCONNECTED = 0 
+"""
+Board disconnected status.
+"""
+
+BOARD_FOUND = 1
+"""
+Board found but not connected status.
+"""
+
+BOARD_CONNECTED = 2
+"""
+Board connected status.
+"""
+
+READ_MODE_BLOCKING = 'blocking'
+"""
+Read mode in which the reader thread blocks in the kernel
+until bytes arrive on the port, a read timeout expires or
+the read is cancelled.
+"""
+
+READ_MODE_POLLING = 'polling'
+"""
+Read mode in which the reader thread polls the number of
+bytes waiting on the port every millisecond.
+"""
+
+READ_MODE_ASYNCIO = 'asyncio'
+"""
+Read mode in which the port is served by the shared asyncio
+event loop thread of `mip.communication.aio.LinkLoop`, with
+no reader thread for each board.
+"""
+
+READ_TIMEOUT = 0.5
+"""
+Upper bound, in seconds, of a blocking read on the port.
+"""
+
+CONNECT_ATTEMPTS = 5
+"""
+Number of attempts to open the port when connecting to the board.
+"""
+
+CONNECT_RETRY_INTERVAL = 0.1
+"""
+Time, in seconds, between two attempts to open the port.
+"""
+
+LINK_TIMEOUT = 13
+"""
+Maximum time, in seconds, without valid packets before the link
+with the board is considered lost. The board sends a battery
+voltage packet about every 10 seconds, even when not streaming.
+"""
+
+STREAMING_LINK_TIMEOUT = 3
+"""
+Maximum time, in seconds, without valid packets before the link
+with the board is considered lost while streaming. Data packets
+are sent at least once per second.
+"""
+
+RESUME_TIMEOUT = 60
+"""
+Maximum time, in seconds, to get the link back while streaming.
+After this time the export session is closed, and streaming is
+not resumed when the board is found again.
+"""
+
+class Singleton(type):
+    """
+    This class allows to implement the Singleton pattern.
+    Using the Singleton class as metaclass allows to implement
+    the Singleton pattern in each class.
+
+    Usage:
+
+    
+    >>> class CustomSingleton(metaclass=Singleton):
+    ...     pass
+    
+
+    This way, only one instance is created of the class, and 
+    every time the class is instantiated in an object, the 
+    same instance is returned.
+    """
+    _instances = {}
+    def __call__(cls, *args, **kwargs):
+        if cls not in cls._instances:
+            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+        return cls._instances[cls]
+
+class MIPSerialBase(Observable):
+    """
+    Main class for serial communication with a single board.
+
+    Several instances can be created to communicate with several
+    boards at the same time, each one with its own port, reader
+    thread, streaming state and exporter. See
+    `mip.communication.board_manager.BoardManager`.
+
+    Args:
+        - baudrate: baudrate of the port
+        - read_mode: `READ_MODE_BLOCKING`, `READ_MODE_POLLING` or `READ_MODE_ASYNCIO`
+        - crc_policy: policy for data packets with a wrong CRC
+        - board_id: number identifying the board, used in the name of the exported files
+        - discover: if True, start looking for the board on all the ports right away
+        - capture: if True, capture all the bytes received from the board, see `start_capture`
+        - device_time: if True, reconstruct the sampling time of each data packet
+          from its sequence number, see `mip.communication.timing.DeviceClock`
+    """
+
+    exporter_class = CSVExporterBase
+    """
+    Class of the exporter of the board, see `configure_exporter`.
+    """
+
+    connected = ObservableProperty(BOARD_DISCONNECTED)
+    """
+    Property holding the current board connection status.
+    It is possible to bind this property to all the widgets that
+    need to detect any change in the board connection status.
+    """
+
+    message_string = ObservableProperty('')
+
+    battery_voltage = ObservableProperty(0.0)
+    """
+    Property holding the last battery voltage read
+    from the device. It is possible to bind this property
+    to all the widgets that need to show the current 
+    battery status of the device.
+    """
+
+    data_sample_rate = ObservableProperty(0.0)
+    """
+    Property holding the rate of the data packets received
+    during the last seconds, see `mip.communication.rate`.
+    """
+
+    temperature_sample_rate = ObservableProperty(0.0)
+    """
+    Property holding the rate of the data packets with
+    temperature and humidity data received during the last seconds.
+    """
+
+    is_streaming = ObservableProperty(False)
+    configured_sample_rate = ObservableProperty('')
+    sample_rate_num_samples = ObservableProperty(0)
+    configured_temp_rh_sample_rate = ObservableProperty('')
+    configured_temp_rh_sample_rep = ObservableProperty('')
+
+    crc_errors = ObservableProperty(0)
+    """
+    Property holding the number of data packets received
+    with a wrong CRC.
+    """
+
+    tail_errors = ObservableProperty(0)
+    """
+    Property holding the number of packets discarded
+    because they did not end with the expected tail byte.
+    """
+
+    resyncs = ObservableProperty(0)
+    """
+    Property holding the number of times bytes had to
+    be skipped to find the start of the next packet.
+    """
+
+    missing_packets = ObservableProperty(0)
+    """
+    Property holding the number of data packets lost
+    since streaming started, based on the packet counter.
+    """
+
+    longest_gap = ObservableProperty(0)
+    """
+    Property holding the largest number of consecutive
+    data packets lost since streaming started.
+    """
+
+    packet_loss_per_minute = ObservableProperty(0)
+    """
+    Property holding the number of data packets lost
+    during the last minute.
+    """
+
+    def __init__(self, baudrate=115200, read_mode=READ_MODE_BLOCKING, crc_policy=CRC_POLICY_FLAG,
+                    board_id=0, discover=True, capture=False, device_time=True):
+        self.port_name = ""
+        self.baudrate = baudrate
+        self.board_id = board_id
+        self.read_mode = read_mode
+        self.scanner = FrameScanner(crc_policy=crc_policy)
+        self.scanner_reset_requested = False
+        self.sequence_tracker = SequenceTracker()
+        self.voltage_received_packet_time = 0
+        self.samples_read = 0
+        self.temp_rh_samples_read = 0
+        self.data_rate = RateEstimator()
+        self.temp_rh_rate = RateEstimator()
+        self.next_rate_update = 0
+        self.last_rate_stats = {}
+        self.subscribers = {}
+        self.packet_ring = RingBuffer(RING_BUFFER_CAPACITY)
+        self.port = None
+        self.command_writer = None
+        self.pending_commands = PendingCommands()
+        self.device_clock = DeviceClock() if (device_time) else None
+        self.port_cache = PortCache()
+        self.capture_enabled = capture
+        self.capture_path = None
+        self.capture = None
+        self.last_frame_time = 0
+        self.first_byte_time = 0
+        self.link_lost_time = None
+        self.available_sample_rates = list(SAMPLE_RATES)
+        self.available_temp_rh_sample_rates = list(TEMP_RH_SAMPLE_RATES)
+        self.configure_exporter()
+        if (discover):
+            find_port_thread = threading.Thread(target=self.find_port, daemon=True)
+            find_port_thread.start()
+
+    def configure_exporter(self):
+        if (self.board_id > 0):
+            self.exporter = self.exporter_class(file_suffix=f'_board{self.board_id}')
+        else:
+            self.exporter = self.exporter_class()
+        self.bind(is_streaming=self.update_export_session)
+        self.bind(configured_sample_rate=self.exporter.setter('data_sample_rate'))
+        self.bind(configured_temp_rh_sample_rate=self.exporter.setter('temp_rh_sample_rate'))
+        self.bind(configured_temp_rh_sample_rep=self.exporter.setter('temp_rh_rep'))
+        self.exporter_subscriber = self.add_subscriber(self.exporter.add_batch, False, POLICY_BLOCK,
+                                                       SUBSCRIBER_QUEUE_SIZE, profile_thread=THREAD_EXPORTER,
+                                                       profile_name=f'exporter{self.exporter.file_suffix}')
+
+    def update_export_session(self, instance, streaming):
+        """
+        Open or close the export session when streaming starts or stops.
+        The session is updated by the thread of the exporter, once it has
+        written all the packets received so far, so that the caller does
+        not wait for it: observe `exporter.session_open`, or call
+        `wait_export_session`, to know when the file is complete.
+        """
+        self.export_session_update = self.exporter_subscriber.call_after_delivered(
+            self.exporter.is_streaming, instance, streaming)
+
+    def wait_export_session(self, timeout=SUBSCRIBER_DRAIN_TIMEOUT):
+        """
+        Wait until the last opening or closing of the export session is done.
+        Must not be called from the thread of the exporter.
+
+        Args:
+            - timeout: maximum waiting time, in seconds
+
+        Returns:
+            - True if the export session was updated before the timeout
+        """
+        update = getattr(self, 'export_session_update', None)
+        if (update is None):
+            return True
+        try:
+            update.result(timeout)
+        except TimeoutError:
+            logger.warning(f'Export session not updated after {timeout} s')
+            return False
+        except Exception:
+            return False
+        return True
+
+    def add_callback(self, callback, policy=POLICY_BLOCK, max_queued=SUBSCRIBER_QUEUE_SIZE):
+        """
+        Append callback to the list of callbacks that 
+        are called upon the complete reception of a 
+        data packet from the device. Each callback is called
+        from its own thread, not from the thread reading from
+        the port, so that a slow callback only delays itself.
+        See `mip.communication.subscribers`.
+
+        Args:
+            callback: the callback to be appended to the list
+            policy: backpressure policy, see `mip.communication.subscribers.POLICIES`
+            max_queued: maximum number of batches of packets waiting, for the drop policies
+
+        Returns:
+            the `mip.communication.subscribers.Subscriber` calling the callback
+        """
+        return self.add_subscriber(callback, True, policy, max_queued)
+
+    def add_batch_callback(self, callback, policy=POLICY_BLOCK, max_queued=SUBSCRIBER_QUEUE_SIZE):
+        """
+        Append callback to the list of callbacks that are called
+        with each `mip.communication.packets.DataPacketBatch` of
+        data packets received from the device, usually all the
+        packets read from the port at once. Each callback is called
+        from its own thread, as in `add_callback`.
+
+        Args:
+            callback: the callback to be appended to the list
+            policy: backpressure policy, see `mip.communication.subscribers.POLICIES`
+            max_queued: maximum number of batches waiting, for the drop policies
+
+        Returns:
+            the `mip.communication.subscribers.Subscriber` calling the callback
+        """
+        return self.add_subscriber(callback, False, policy, max_queued)
+
+    def add_subscriber(self, callback, per_packet, policy, max_queued, profile_thread=None, profile_name=None):
+        if (callback in self.subscribers):
+            return self.subscribers[callback]
+        subscriber = Subscriber(self.packet_ring, callback, per_packet=per_packet,
+                                policy=policy, max_queued=max_queued,
+                                profile_thread=profile_thread, profile_name=profile_name)
+        self.subscribers[callback] = subscriber
+        subscriber.start()
+        return subscriber
+
+    def remove_callback(self, callback):
+        """
+        Remove a callback added with `add_callback` or `add_batch_callback`.
+        """
+        subscriber = self.subscribers.pop(callback, None)
+        if (subscriber is not None):
+            subscriber.stop()
+
+    def subscriber_stats(self):
+        """
+        Return the statistics of the callbacks, see `mip.communication.subscribers.Subscriber.stats`.
+        """
+        return [subscriber.stats() for subscriber in self.subscribers.values()]
+
+    def find_port(self):
+        """!
+        Find the serial port to which the device is connected.
+
+        This function first probes the ports stored in the port
+        cache, where the board was last found. If none of them
+        answers, it probes all the available serial ports in
+        parallel until one of them answers. Once found, it
+        attempts to connect to it. The ports in use by other
+        boards are never probed.
+        """
+        while (self.connected != BOARD_CONNECTED):
+            found_ports = self.find_cached_port()
+            if (len(found_ports) == 0):
+                found_ports = find_mip_ports(baudrate=self.baudrate, first_only=True,
+                                             exclude=port_registry.in_use(owner=self))
+            if (len(found_ports) == 0):
+                time.sleep(RESCAN_INTERVAL)
+                continue
+            self.connected = BOARD_FOUND
+            self.port_name = found_ports[0]
+            if (self.connect() != 0):
+                self.connected = BOARD_DISCONNECTED
+
+    def find_cached_port(self):
+        """
+        Probe the ports on which boards were last found, except
+        the ones in use by other boards.
+
+        Returns:
+            - list with the name of the first cached port that answered, empty if none did
+        """
+        port_names = self.port_cache.candidates(exclude=port_registry.in_use(owner=self))
+        if (len(port_names) == 0):
+            return []
+        logger.debug(f'Trying cached ports: {port_names}')
+        return find_mip_ports(port_names, baudrate=self.baudrate, first_only=True)
+
+    def check_mip_port(self, port_name):
+        """
+        Check if the port is the correct one.
+
+        This function checks whether the port passed in as
+        parameter correspons to a proper device.
+        @param port_name name of the port to be checked.
+        @return True if the port was found to be corrected.
+        @return False if the port was not found to be corrected.
+        """
+        if (probe_mip_port(port_name, self.baudrate)):
+            self.connected = BOARD_FOUND
+            return True
+        return False
+
+    def connect(self):
+        """
+        Connect to the board on the port stored in `port_name`.
+
+        Each step of the handshake waits only until the board answers,
+        with an upper timeout: the port is opened, the board must answer
+        to the connection request, then the updated time is sent together
+        with the request of the sample rate configuration, whose reply
+        also tells that the time command was processed. The duration
+        of each phase is logged.
+
+        The handshake is the same in all the read modes: only opening
+        the port, waiting for the reply to the connection request and
+        starting to read depend on the transport, see `open_port`,
+        `request_connection` and `start_reading`.
+
+        Returns:
+            - 0 if the connection succeeded, 1 otherwise
+        """
+        if (not port_registry.claim(self.port_name, self)):
+            logger.warning(f'Port {self.port_name} is in use by another board')
+            return 1
+        start_time = time.monotonic()
+        for attempt in range(CONNECT_ATTEMPTS):
+            try:
+                self.open_port()
+                break
+            except (serial.SerialException, OSError):
+                # The port may not be released yet by the previous probe
+                time.sleep(CONNECT_RETRY_INTERVAL)
+        else:
+            port_registry.release(self.port_name, self)
+            return 1
+        open_time = time.monotonic()
+        self.open_capture()
+        try:
+            if (not self.request_connection()):
+                logger.warning(f'No reply to connection request on {self.port_name}')
+        except (serial.SerialException, OSError, ConnectionError):
+            self.close_port()
+            return 1
+        ready_time = time.monotonic()
+        logger.debug('Device connected')
+        self.command_writer = CommandWriter(self.port, self.port_name)
+        self.last_frame_time = time.monotonic()
+        self.connected = BOARD_CONNECTED
+        self.start_reading()
+        self.send_updated_time_to_board()
+        try:
+            self.retrieve_sample_rate_from_board().result()
+        except (TimeoutError, ConnectionError):
+            logger.warning('No reply to sample rate configuration request')
+        end_time = time.monotonic()
+        if (not is_replay_port(self.port_name)):
+            self.port_cache.remember(self.port_name)
+        logger.debug(f'Connected to {self.port_name} in {end_time - start_time:.3f} s: '
+                     f'open {open_time - start_time:.3f} s ({attempt + 1} attempts), '
+                     f'ready {ready_time - open_time:.3f} s, '
+                     f'configuration {end_time - ready_time:.3f} s')
+        return 0
+
+    def uses_link_loop(self):
+        """
+        Return True if the port is served by the asyncio transport.
+        Replayed captures are always read by a reader thread.
+        """
+        return self.read_mode == READ_MODE_ASYNCIO and not is_replay_port(self.port_name)
+
+    def open_port(self):
+        """
+        Open the port stored in `port_name`.
+
+        With the asyncio transport, the port is served by the shared
+        event loop thread, which decodes the frames and hands them to
+        `handle_frames`, and `self.port` is a thread-safe stand-in, so
+        that all the commands are written as in the other read modes.
+
+        Raises:
+            - serial.SerialException: if the port could not be opened
+        """
+        if (self.uses_link_loop()):
+            link_loop = LinkLoop.get()
+            self.link = AsyncMIPBoard(self.port_name, self.baudrate, scanner=self.scanner,
+                                      frame_callback=self.handle_frames,
+                                      connection_lost_callback=self.on_link_closed,
+                                      data_callback=self.capture_data)
+            link_loop.run(self.link.open())
+            self.port = LinkPort(link_loop, self.link)
+            return
+        self.port = serial.serial_for_url(self.port_name, baudrate=self.baudrate,
+                                            timeout=READ_TIMEOUT, exclusive=True)
+        if (not self.port.isOpen()):
+            raise serial.SerialException(f'Could not open {self.port_name}')
+
+    def request_connection(self):
+        """
+        Send the connection request and wait for the reply of the board.
+
+        Returns:
+            - True if the board answered before the timeout
+        """
+        if (self.uses_link_loop()):
+            return self.port.link_loop.run(self.link.request_connection())
+        self.port.reset_input_buffer()
+        self.port.write(CONN_REQUEST_CMD.encode('utf-8'))
+        return wait_for_reply(self.port, CONN_REPLY, READY_REPLY_TIMEOUT)
+
+    def start_reading(self):
+        """
+        Start reading from the port: a reader thread, see `read_data`,
+        or the link watchdog of the asyncio transport, see `watch_link`.
+        """
+        if (self.uses_link_loop()):
+            link_loop = self.port.link_loop
+            link_loop.call_soon(link_loop.loop.create_task, self.watch_link())
+            return
+        read_thread = threading.Thread(target=profiled(THREAD_READER, self.read_data,
+                                                       f'reader{self.exporter.file_suffix}'),
+                                       name=f'reader {self.port_name}')
+        read_thread.daemon = True
+        read_thread.start()
+
+    async def watch_link(self):
+        """
+        Link watchdog for the asyncio transport, see `read_data`.
+        """
+        while (self.connected == BOARD_CONNECTED):
+            await asyncio.sleep(READ_TIMEOUT)
+            if (self.connected == BOARD_CONNECTED and self.link_timed_out()):
+                self.link.transport.abort()
+                self.on_link_lost()
+                return
+            self.update_computed_sample_rate()
+
+    def on_link_closed(self, exc):
+        """
+        Called in the event loop thread when the asyncio transport is closed.
+
+        Args:
+            - exc: the exception that closed the transport, None if closed on request
+        """
+        if (exc is not None and self.connected == BOARD_CONNECTED):
+            logger.warning(f'Port error: {exc}')
+            self.on_link_lost()
+
+    def send_updated_time_to_board(self):
+        """!
+        @brief Update time and date on the board.
+        
+        This function sends updated time and date values to the board.
+        See `mip.communication.commands.build_time_command` for the
+        structure of the packet.
+        """
+        logger.debug('Sending updated time and date to device')
+        self.write_command(build_time_command(datetime.now()), 'time and date')
+    
+    def start_streaming(self):
+        """!
+        @brief Start data streaming from the board.
+
+        This function starts data streaming from the board.
+        It also sets up a running thread to retrieve the
+        data from the board, parse it and send it to the
+        data receivers. 
+        """
+        if (self.connected == BOARD_CONNECTED):
+            self.is_streaming = True
+            self.samples_read = 0
+            self.temp_rh_samples_read = 0
+            self.reset_rate_estimators()
+            self.sequence_tracker.reset()
+            self.reset_device_clock()
+            self.missing_packets = 0
+            self.longest_gap = 0
+            self.packet_loss_per_minute = 0
+            self.data_sample_rate = 0.0
+            self.temperature_sample_rate = 0.0
+            self.write_command(START_STREAMING_CMD.encode('utf-8'), 'start streaming command')
+            logger.debug('Starting data streaming')
+        else:
+            logger.critical('Board is not connected')
+            
+    def stop_streaming(self):
+        """!
+        @brief Stop data streaming from the board.
+        This function stops data streaming from the
+        board. This function sends the appropriate command
+        to the board and stops the running thread.
+        """
+        if (self.connected == BOARD_CONNECTED):
+            self.write_command(STOP_STREAMING_CMD.encode('utf-8'), 'stop streaming command')
+            logger.debug('Stopping data streaming')
+            self.is_streaming = False
+            self.scanner_reset_requested = True
+            self.wake_reader()
+            self.log_subscriber_stats()
+            self.command_writer.log_stats()
+        else:
+            logger.critical('Board is not connected')
+
+    def read_data(self):
+        """
+        Read data from the board until it gets disconnected.
+
+        All the bytes waiting on the port are read with a single call
+        and passed to the frame scanner, which carries any partial
+        frame over to the next read. In blocking read mode the thread
+        sleeps in the kernel until a byte arrives, the read timeout
+        expires or the read is cancelled by `wake_reader`, then reads
+        the rest of the frame before feeding the scanner, see `read_frame`.
+        Each chunk is stamped with the time at which its bytes were
+        known to be waiting: the start of the read, or the arrival of
+        the first byte in blocking read mode.
+
+        The thread also acts as link watchdog: if no valid packet is
+        received for longer than the link timeout, or the port fails,
+        the link is considered lost and a reconnection is started.
+        """
+        self.last_frame_time = time.monotonic()
+        link_lost = False
+        while (self.connected == BOARD_CONNECTED):
+            if (self.scanner_reset_requested):
+                self.scanner_reset_requested = False
+                self.scanner.reset()
+            monitor = latency.monitor
+            try:
+                n_bytes = self.port.in_waiting
+                if (n_bytes > 0):
+                    read_start = time.monotonic_ns()
+                    data = self.port.read(n_bytes)
+                elif (self.read_mode == READ_MODE_BLOCKING):
+                    data = self.read_frame()
+                    # The wait for the first byte is idle time, not part of the read
+                    read_start = self.first_byte_time
+                else:
+                    data = b''
+                if (monitor is not None and len(data) > 0):
+                    monitor.record(latency.STAGE_READ, time.monotonic_ns() - read_start)
+                if (self.read_mode == READ_MODE_POLLING):
+                    time.sleep(0.001)
+            except (serial.SerialException, OSError, TypeError):
+                # Port closed while reading, or device gone
+                link_lost = (self.connected == BOARD_CONNECTED)
+                break
+            if (len(data) > 0):
+                timestamp = read_start
+                self.capture_data(data, timestamp)
+                self.handle_frames(self.scanner.feed(data), timestamp)
+            else:
+                self.update_computed_sample_rate()
+            if (self.link_timed_out()):
+                link_lost = True
+                break
+        self.close_port()
+        if (link_lost):
+            self.on_link_lost()
+
+    def read_frame(self):
+        """
+        Wait for the next byte on the port, then read the rest of the
+        frame it starts, or completes, together with any other byte
+        already received, so that the whole frame is fed to the scanner
+        at once. The time at which the first byte arrived is stored
+        in `first_byte_time`, as `time.monotonic_ns()`.
+
+        Returns:
+            - the bytes read, empty if the read timed out or was cancelled
+        """
+        data = self.port.read(1)
+        if (len(data) > 0):
+            self.first_byte_time = time.monotonic_ns()
+            n_bytes = max(self.port.in_waiting, self.scanner.bytes_needed(data))
+            if (n_bytes > 0):
+                data += self.port.read(n_bytes)
+        return data
+
+    def handle_frames(self, frames, timestamp=None):
+        """
+        Handle the frames decoded from a chunk of received bytes.
+
+        Args:
+            - frames: list of `(header, fields, valid)` tuples returned by the scanner
+            - timestamp: `time.monotonic_ns()` at which the chunk was read, now if None
+        """
+        if (len(frames) == 0):
+            return
+        if (timestamp is None):
+            timestamp = time.monotonic_ns()
+        if (any(valid for _, _, valid in frames)):
+            self.last_frame_time = time.monotonic()
+        monitor = latency.monitor
+        if (monitor is not None):
+            decode_start = time.perf_counter_ns()
+        self.process_frames(frames, timestamp)
+        if (monitor is not None):
+            monitor.record(latency.STAGE_DECODE, time.perf_counter_ns() - decode_start)
+        self.packet_ring.notify()
+        self.update_error_counters()
+        self.update_computed_sample_rate(timestamp)
+
+    def link_timed_out(self):
+        """
+        Return True if no valid packet was received for longer than the link timeout.
+        A replayed capture is never considered silent, as it may be paused or over.
+        """
+        if (is_replay_port(self.port_name)):
+            return False
+        link_timeout = STREAMING_LINK_TIMEOUT if (self.is_streaming) else LINK_TIMEOUT
+        return time.monotonic() - self.last_frame_time > link_timeout
+
+    def on_link_lost(self):
+        """
+        Handle the loss of the link with the board.
+
+        This function closes the port, if not already closed, with the
+        command writer, so that commands sent while the link is down fail
+        right away. It then switches the state to disconnected and starts
+        a reconnection in a new thread. The streaming state is left
+        unchanged, so that the export session goes on in the same file
+        once streaming resumes.
+        """
+        self.link_lost_time = time.monotonic()
+        # The reader thread already closed the port, the asyncio transport did not
+        self.close_port()
+        logger.warning(f'Link with board on {self.port_name} lost, '
+                       f'{self.link_lost_time - self.last_frame_time:.1f} s since last valid packet')
+        self.scanner.reset()
+        self.sequence_tracker.resync()
+        self.reset_device_clock()
+        self.pending_commands.fail_all(ConnectionError('Link with board lost'))
+        self.message_string = 'Device disconnected'
+        self.connected = BOARD_DISCONNECTED
+        reconnect_thread = threading.Thread(target=self.reconnect, args=(self.is_streaming,), daemon=True)
+        reconnect_thread.start()
+
+    def reconnect(self, resume_streaming):
+        """
+        Connect again to the board after the link was lost.
+
+        The port on which the board was connected is probed first,
+        then the ports in the port cache, and only then all the ports,
+        except the ones in use by other boards, which may have taken
+        the port of this board meanwhile. If streaming was active, it
+        is resumed once connected.
+
+        Args:
+            - resume_streaming: if True, resume data streaming once connected
+        """
+        while (self.connected != BOARD_CONNECTED):
+            if (resume_streaming and time.monotonic() - self.link_lost_time > RESUME_TIMEOUT):
+                logger.critical(f'Board not found within {RESUME_TIMEOUT} s, closing export session')
+                resume_streaming = False
+                self.is_streaming = False
+            used_ports = port_registry.in_use(owner=self)
+            port_names = [self.port_name] + self.port_cache.candidates(exclude=used_ports | {self.port_name})
+            found_ports = find_mip_ports(port_names, baudrate=self.baudrate, first_only=True, exclude=used_ports)
+            if (len(found_ports) == 0):
+                found_ports = find_mip_ports(baudrate=self.baudrate, first_only=True, exclude=used_ports)
+            if (len(found_ports) == 0):
+                time.sleep(RESCAN_INTERVAL)
+                continue
+            self.connected = BOARD_FOUND
+            self.port_name = found_ports[0]
+            if (self.connect() != 0):
+                self.connected = BOARD_DISCONNECTED
+        if (resume_streaming and self.is_streaming):
+            self.resume_streaming()
+        self.message_string = 'Device reconnected'
+        logger.info(f'Link with board on {self.port_name} recovered in '
+                    f'{time.monotonic() - self.link_lost_time:.2f} s')
+
+    def reset_device_clock(self):
+        """
+        Restart the reconstruction of the device time, when the sequence
+        numbers no longer follow the sampling times of the board.
+        """
+        if (self.device_clock is not None):
+            self.device_clock.reset()
+
+    def resume_streaming(self):
+        """
+        Resume data streaming after a reconnection, in the same
+        export session. Packet loss statistics are kept, and the
+        sample rate is computed again from the first new packet.
+        """
+        self.samples_read = 0
+        self.temp_rh_samples_read = 0
+        self.reset_rate_estimators()
+        self.write_command(START_STREAMING_CMD.encode('utf-8'), 'start streaming command')
+        logger.debug('Resuming data streaming')
+
+    def wake_reader(self):
+        """
+        Wake up the reader thread if it is blocked on a read.
+        """
+        if (self.uses_link_loop()):
+            # Frames are decoded in the event loop thread
+            if (self.scanner_reset_requested):
+                self.scanner_reset_requested = False
+                self.link.protocol.request_reset()
+        elif (self.read_mode == READ_MODE_BLOCKING):
+            try:
+                self.port.cancel_read()
+            except (AttributeError, serial.SerialException, OSError):
+                pass
+
+    def disconnect(self):
+        """
+        Disconnect from the board.
+
+        This function stops the reader thread, waking it up if it
+        is blocked on a read. The port is closed by the reader
+        thread once it exits. With the asyncio transport, which
+        has no reader thread, the port is closed right away.
+        """
+        if (self.connected == BOARD_DISCONNECTED):
+            return
+        logger.debug('Disconnecting from device')
+        self.connected = BOARD_DISCONNECTED
+        if (self.uses_link_loop()):
+            self.close_port()
+        else:
+            self.wake_reader()
+        self.pending_commands.fail_all(ConnectionError('Board disconnected'))
+        self.close_capture()
+
+    ###########################################
+    #              Raw capture                #
+    ###########################################
+
+    def start_capture(self, file_path=None):
+        """
+        Capture all the bytes received from the board to a file.
+
+        The capture goes on across reconnections, appending to the
+        same file, until `stop_capture` is called or the board is
+        disconnected. See `mip.communication.capture` for the format.
+
+        Args:
+            - file_path: path of the capture file, by default a new file
+              in the data folder of the exporter
+        """
+        self.capture_enabled = True
+        self.capture_path = file_path
+        if (self.connected == BOARD_CONNECTED):
+            self.open_capture()
+
+    def stop_capture(self):
+        """
+        Stop capturing the bytes received from the board.
+        """
+        self.capture_enabled = False
+        self.close_capture()
+
+    def open_capture(self):
+        """
+        Open the capture file, if capture is enabled and the file is not open yet.
+        """
+        if (not self.capture_enabled or self.capture is not None):
+            return
+        if (self.capture_path is None):
+            file_name = datetime.strftime(datetime.now(), "%Y%m%d_%H%M%S") + self.exporter.file_suffix
+            self.capture_path = Path(self.exporter.data_path) / (file_name + CAPTURE_FILE_EXTENSION)
+        try:
+            Path(self.capture_path).parent.mkdir(parents=True, exist_ok=True)
+            self.capture = CaptureWriter(self.capture_path, self.port_name, self.baudrate)
+        except OSError:
+            logger.critical(f'Could not open capture file {self.capture_path}')
+
+    def close_capture(self):
+        """
+        Write the pending bytes and close the capture file.
+        """
+        capture = self.capture
+        if (capture is not None):
+            self.capture = None
+            if (not self.capture_enabled):
+                self.capture_path = None
+            capture.close()
+
+    def capture_data(self, data, timestamp=None):
+        """
+        Store a chunk of received bytes in the capture file, if capturing.
+
+        Args:
+            - data: the bytes read from the port
+            - timestamp: `time.monotonic_ns()` at which the chunk was read, now if None
+        """
+        capture = self.capture
+        if (capture is not None):
+            capture.write(data, timestamp)
+
+    def close_port(self):
+        """
+        Stop the command writer and close the port, ignoring
+        errors if it is already closed.
+        """
+        command_writer = self.command_writer
+        if (command_writer is not None):
+            self.command_writer = None
+            command_writer.close()
+        try:
+            self.port.close()
+        except (AttributeError, serial.SerialException, OSError):
+            pass
+        port_registry.release(self.port_name, self)
+
+    def update_error_counters(self):
+        """
+        Copy the error counters of the frame scanner to the
+        class properties, when they change.
+        """
+        scanner = self.scanner
+        if (self.crc_errors != scanner.crc_errors):
+            self.crc_errors = scanner.crc_errors
+        if (self.tail_errors != scanner.tail_errors):
+            self.tail_errors = scanner.tail_errors
+        if (self.resyncs != scanner.resyncs):
+            self.resyncs = scanner.resyncs
+
+    def process_frames(self, frames, timestamp):
+        """
+        Handle the frames decoded by the frame scanner.
+
+        Args:
+            - frames: list of `(header, fields, valid)` tuples returned by the scanner
+            - timestamp: `time.monotonic_ns()` at which the chunk holding the frames was read
+        """
+        data_frames = []
+        for header, fields, valid in frames:
+            if (header == DATA_PACKET_HEADER):
+                data_frames.append((fields, valid))
+            elif (header == VOLTAGE_PACKET_HEADER):
+                self.voltage_received_packet_time = timestamp
+                self.battery_voltage = decoding.convert_battery_voltage(fields[1])
+            elif (header == SAMPLE_RATE_PACKET_HEADER):
+                self.parse_sample_rate(fields[1])
+                self.pending_commands.acknowledge(SampleRateConfiguration(
+                    self.configured_sample_rate, self.configured_temp_rh_sample_rate,
+                    self.configured_temp_rh_sample_rep))
+        if (len(data_frames) > 0):
+            self.process_data_frames(data_frames, timestamp)
+
+    def process_data_frame(self, fields, valid=True, timestamp=None):
+        """
+        Convert a single data frame, see `process_data_frames`.
+
+        Args:
+            - fields: the tuple unpacked from the data frame
+            - valid: False if the CRC check of the frame failed
+            - timestamp: `time.monotonic_ns()` at which the frame was read, now if None
+        """
+        if (timestamp is None):
+            timestamp = time.monotonic_ns()
+        self.process_data_frames([(fields, valid)], timestamp)
+
+    def process_data_frames(self, data_frames, timestamp):
+        """
+        Convert the data frames read from a chunk of bytes into a
+        `DataPacketBatch` and store it in the ring buffer, from which
+        the subscribers deliver it to the receiver callbacks.
+
+        The values of the frames are converted together, see
+        `mip.communication.packets.DataPacketBatch.from_frames`; only
+        sequence numbers, device times and statistics are computed
+        here one frame at a time. Frames that failed the CRC check take
+        the next expected sequence number, and never update the packet
+        loss statistics nor the device clock estimates.
+
+        Args:
+            - data_frames: list of `(fields, valid)` tuples of the data frames
+            - timestamp: `time.monotonic_ns()` at which the chunk was read
+        """
+        sequence_tracker = self.sequence_tracker
+        device_clock = self.device_clock
+        frames = []
+        crc_valid = []
+        sequences = []
+        missing = []
+        device_times = [] if (device_clock is not None) else None
+        for fields, valid in data_frames:
+            if (valid):
+                sequence, missing_before = sequence_tracker.update(fields[DATA_COUNTER_IDX])
+                self.update_packet_loss(missing_before)
+            else:
+                # The counter of a corrupted frame cannot be trusted
+                sequence, missing_before = sequence_tracker.skip()
+            frames.append(fields)
+            crc_valid.append(valid)
+            sequences.append(sequence)
+            missing.append(missing_before)
+            if (device_clock is not None):
+                if (valid):
+                    device_times.append(device_clock.timestamp(sequence, timestamp))
+                else:
+                    device_times.append(device_clock.predict(sequence, timestamp))
+        batch = DataPacketBatch.from_frames(frames, crc_valid=crc_valid, sequence=sequences,
+                                            missing_before=missing, timestamp=timestamp,
+                                            device_time=device_times)
+        # The frames of a chunk arrived together
+        self.data_rate.add(timestamp, len(batch))
+        n_temp_rh = int(batch.has_temp_data.sum())
+        self.temp_rh_rate.add(timestamp, n_temp_rh)
+        self.temp_rh_samples_read += n_temp_rh
+        self.samples_read += len(batch)
+        self.packet_ring.append(batch)
+
+    def log_subscriber_stats(self):
+        """
+        Log the statistics of the callbacks, that can be used to find
+        slow consumers and to size the ring buffer for the sample rate
+        in use, and reset them.
+        """
+        for subscriber in list(self.subscribers.values()):
+            subscriber.log_stats()
+
+    def update_packet_loss(self, missing_before):
+        """
+        Update the packet loss properties after a data packet.
+
+        Args:
+            - missing_before: number of packets lost right before the last one
+        """
+        tracker = self.sequence_tracker
+        if (missing_before > 0):
+            logger.warning(f'Lost {missing_before} packets before packet {tracker.sequence}')
+            self.missing_packets = tracker.missing_packets
+            self.longest_gap = tracker.longest_gap
+        loss_per_minute = tracker.loss_per_minute()
+        if (loss_per_minute != self.packet_loss_per_minute):
+            self.packet_loss_per_minute = loss_per_minute
+
+    ###########################################
+    #               Sample rate               #
+    ###########################################
+
+    def parse_sample_rate(self, sample_rate_packet):
+        sample_rate_packet = struct.unpack('3B', sample_rate_packet)
+        if (sample_rate_packet[0] < len(self.available_sample_rates)):
+            self.configured_sample_rate = self.available_sample_rates[sample_rate_packet[0]]
+            logger.debug(f'Current sample rate: {self.configured_sample_rate}')
+            self.compute_num_samples_sample_rate(self.configured_sample_rate)
+        else:
+            logger.critical('Error in received sample rate')
+        self.configured_temp_rh_sample_rate, self.configured_temp_rh_sample_rep = self.get_temp_hum_config_value(sample_rate_packet[1], 
+                                                                                                                sample_rate_packet[2])
+
+    def compute_num_samples_sample_rate(self, sample_rate):
+        """
+        Compute number of samples per second (frequency) based on the
+        sample rate string. This is used to set the Numeric Property
+        and propagate the change to all the widgets that depend
+        on the sample rate of the received data (e.g. plots).
+
+        Args:
+            - sample_rate the sample rate string, in format 'xx Hz'
+        """
+        # Get only the first part of the string --> frequency
+        frequency = sample_rate.split(' ')[0]
+        self.sample_rate_num_samples = int(frequency)
+        if (self.device_clock is not None):
+            self.device_clock.set_sample_rate(self.sample_rate_num_samples)
+
+    def reset_rate_estimators(self):
+        """
+        Restart the measurement of the sample rates from the next packet.
+        """
+        self.data_rate.reset()
+        self.temp_rh_rate.reset()
+        self.next_rate_update = 0
+
+    def update_computed_sample_rate(self, now=None):
+        """
+        Update the measured sample rates, at most once every
+        `RATE_UPDATE_INTERVAL` seconds. This function is called
+        after every chunk of frames and at every wake-up of the
+        reader, so that the rates drop when the stream stalls.
+
+        Args:
+            - now: current `time.monotonic_ns()`, if already available
+        """
+        if (now is None):
+            now = time.monotonic_ns()
+        if (now < self.next_rate_update or not self.is_streaming):
+            return
+        self.next_rate_update = now + int(RATE_UPDATE_INTERVAL * 1e9)
+        self.last_rate_stats = {
+            'data': self.data_rate.stats(now),
+            'temp_rh': self.temp_rh_rate.stats(now),
+        }
+        self.data_sample_rate = self.last_rate_stats['data']['rate']
+        self.temperature_sample_rate = self.last_rate_stats['temp_rh']['rate']
+
+    def rate_stats(self):
+        """
+        Return the last statistics of the data and of the temperature and
+        humidity streams, updated every `RATE_UPDATE_INTERVAL` seconds while
+        streaming. See `mip.communication.rate.RateEstimator.stats`.
+
+        Usage:
+        >>> stats = board.rate_stats()
+        >>> stats['data']['rate'], stats['data']['interval_p99']
+        (100.0, 0.0103)
+        """
+        return self.last_rate_stats
+
+    def set_sample_rate(self, sample_rate, timeout=SAMPLE_RATE_REPLY_TIMEOUT):
+        """!
+        @brief Send command to set sample rate on the board.
+        
+        This function sends the appropriate command to the board
+        to set the sample rate to a new value. It then sends a 
+        command to the board to retrieve the sample rate value that
+        was set, that is checked inside the read data function
+        and the class property is then updated accordingly.
+        @param sample_rate string identifying the new sample rate to be set.
+        @param timeout maximum time, in seconds, to wait for the acknowledge.
+        @return future resolved with the `SampleRateConfiguration` reported
+        by the board, see `send_command`.
+        """
+        
+        if (sample_rate not in self.available_sample_rates):
+            logger.critical(f'{sample_rate} is not a valid sample rate')
+            return failed_future(ValueError(f'{sample_rate} is not a valid sample rate'))
+        logger.debug(f'Setting sample rate to {sample_rate}')
+        sample_rate_cmd = self.get_sample_rate_cmd(sample_rate)
+        return self.send_command(sample_rate_cmd.encode('utf-8'), f'sample rate {sample_rate}', timeout,
+                                 SampleRateConfiguration(sample_rate, None, None))
+
+    def get_sample_rate_cmd(self, sample_rate):
+        """
+        Get command to set sample rate.
+
+        This function returns the correct command to send to the
+        board to set the proper sample rate.
+
+        Args:
+            - sample_rate: string with desired sample rate value
+        
+        Returns:
+            - command corresponding to the sample rate to be set
+        """
+        return SAMPLE_RATE_CMDS[sample_rate]
+    
+    def retrieve_sample_rate_from_board(self, timeout=SAMPLE_RATE_REPLY_TIMEOUT):
+        """
+        Send command to the board to retrieve current sample rate configuration.
+
+        This function sends a command to the board to retrieve the current
+        sample rate configuration for both capacitance data and temperature and relative
+        humidity sensor.
+        The response from the board is parsed in the main read data function.
+
+        Args:
+            - timeout: maximum time, in seconds, to wait for the reply
+
+        Returns:
+            - future resolved with the `SampleRateConfiguration` reported by the board
+        """
+        logger.debug('Retrieving sample rate configuration from board')
+        return self.send_command(b'', 'sample rate configuration request', timeout)
+
+    def send_command(self, command, description, timeout=SAMPLE_RATE_REPLY_TIMEOUT, expected=None):
+        """
+        Send a configuration command and wait for its acknowledge without blocking.
+
+        The command is written together with the request of the sample
+        rate configuration, in a single write: the sample rate packet sent
+        in reply tells that the board processed the command and reports
+        the resulting configuration. Commands can be sent back to back,
+        they are acknowledged in order.
+
+        Args:
+            - command: bytes of the command, possibly empty
+            - description: description of the command, used in the log and error messages
+            - timeout: maximum time, in seconds, to wait for the acknowledge
+            - expected: the `SampleRateConfiguration` requested by the command, None
+              for any, used to tell its acknowledge from the late reply to a command
+              that timed out, see `mip.communication.commands.PendingCommands`
+
+        Returns:
+            - `concurrent.futures.Future` resolved with the `SampleRateConfiguration`
+              reported by the board, failing with `TimeoutError` if the board does not
+              answer in time or with `ConnectionError` if the board is not connected
+
+        Usage:
+        >>> future = board.set_sample_rate('50 Hz')
+        >>> future.add_done_callback(on_sample_rate_set)
+        """
+        if (self.port is None or not self.port.is_open or self.connected != BOARD_CONNECTED):
+            logger.critical(f'Board not connected. Cannot send {description}')
+            return failed_future(ConnectionError(f'Board not connected. Cannot send {description}'))
+        future = self.pending_commands.add(description, timeout, expected)
+        write_future = self.write_command(bytes(command) + RETRIEVE_SAMPLE_RATE_CMD.encode('utf-8'), description)
+        write_future.add_done_callback(
+            lambda write_future: write_future.exception() is not None and
+            self.pending_commands.fail(future, write_future.exception()))
+        return future
+
+    def write_command(self, command, description):
+        """
+        Queue a command to be written to the board by the command writer,
+        in a single write, without waiting. See `mip.communication.writer`.
+
+        Args:
+            - command: the bytes of the command, in a single buffer
+            - description: description of the command, used in the log and error messages
+
+        Returns:
+            - `concurrent.futures.Future` resolved with the duration of the write,
+              or failing with `ConnectionError` if the command could not be written
+        """
+        command_writer = self.command_writer
+        if (command_writer is None):
+            logger.critical(f'Board not connected. Cannot send {description}')
+            return failed_future(ConnectionError(f'Board not connected. Cannot send {description}'))
+        return command_writer.submit(command, description)
+
+    def command_writer_stats(self):
+        """
+        Return the statistics of the command writer, see
+        `mip.communication.writer.CommandWriter.stats`, or None if not connected.
+        """
+        command_writer = self.command_writer
+        return command_writer.stats() if (command_writer is not None) else None
+
+    ###########################################
+    #    Temperature and humidity settings    #
+    ###########################################
+    def get_temp_hum_config_cmd(self, th_sample_rate, th_repeatability):
+        """
+        Based on the desired settings, this function returns a byte array
+        containing the commands to be sent to the board to properly configure
+        the temperature and relative humidity sensor.
+
+        Args:
+            - th_sample_rate: the sample rate to be set to the board
+            - th_repeatability: the repeatability setting to be set to the board
+        
+        Returns:
+            - byte array with commands to be sent to the board
+        
+        Usage:
+        >>> cmds = get_temp_hum_config_cmd('0.5 Hz', 'Med')
+        ... cmds
+        ... bytearray(b' $')
+        """
+        return bytearray(TEMP_RH_CONFIG[th_sample_rate][th_repeatability])
+
+    def get_temp_hum_config_value(self, th_sample_rate, th_repeatability):
+        """
+        Based on the settings, this function returns the proper
+        strings representing temperature and humidity sample rate value
+        and repeatabiity settings.
+
+        Args:
+            - th_sample_rate: sample rate value
+            - th_repeatability: repeatability value
+        
+        Returns:
+            - string with sample rate configuration
+            - string with repetability configuration
+        
+        Usage:
+        >>> values = get_temp_hum_config_value(0x20, 0x24)
+        ... values
+        ... '0.5 Hz', 'Med' 
+
+        """
+
+        # Set up sample rate dictionary
+        sr_dict = {
+            0x20: '0.5 Hz',
+            0X21: '1 Hz',
+            0x22: '2 Hz',
+            0x23: '4 Hz',
+            0x27: '10 Hz'
+        }
+
+        # Set up repeatability dictionary
+        rep_dict = {
+            0x20: {
+                0x2F: 'Low',
+                0x24: 'Med',
+                0x32: 'High'
+            },
+            0x21: {
+                0x2d: 'Low',
+                0x26: 'Med',
+                0x30: 'High'
+            },
+            0x22: {
+                0x2B: 'Low',
+                0x20: 'Med',
+                0x36: 'High'
+            },
+            0x23: {
+                0x29: 'Low',
+                0x22: 'Med',
+                0x34: 'High'
+            },
+            0x27: {
+                0x2A: 'Low',
+                0x21: 'Med',
+                0x37: 'High'
+            }
+        }
+        # Return dictionary values
+        return sr_dict[th_sample_rate], rep_dict[th_sample_rate][th_repeatability]
+
+    def set_temperature_settings(self, sample_rate, repeatability, timeout=SAMPLE_RATE_REPLY_TIMEOUT):
+        """
+        Set new configuration for temperature and relative humidity sensor.
+
+        This function sends the proper commands to the board to configure the
+        temperature and relative humidity sensor.
+
+        Args:
+            - sample_rate: the desired sample rate value
+            - repeatability: the desired repeatability settings
+            - timeout: maximum time, in seconds, to wait for the acknowledge
+
+        Returns:
+            - future resolved with the `SampleRateConfiguration` reported
+              by the board, see `send_command`
+        """
+        logger.debug(f'Setting temperature sensor to {sample_rate} and {repeatability}')
+        try:
+            cmds = self.get_temp_hum_config_cmd(sample_rate, repeatability)
+        except KeyError:
+            logger.critical(f'{sample_rate} and {repeatability} are invalid settings')
+            return failed_future(ValueError(f'{sample_rate} and {repeatability} are invalid settings'))
+        return self.send_command(build_temp_rh_command(cmds),
+                                 f'temperature settings {sample_rate} {repeatability}', timeout,
+                                 SampleRateConfiguration(None, sample_rate, repeatability))
+
+    ###########################################
+    #         Set SD Card recording           #
+    ###########################################
+    def set_sd_card_rec_minutes(self, rec_minutes, header):
+        if (rec_minutes == 'None'):
+            logger.debug('No SD recording')
+            return
+        logger.debug(f'Configuring SD Recording for {rec_minutes} minutes')
+        if (self.connected == BOARD_CONNECTED):
+            future = self.write_command(SD_CARD_REC_CMDS[rec_minutes].encode('utf-8'), 'SD card recording command')
+            future.add_done_callback(self.check_sd_card_command)
+            self.set_sd_card_custom_header(header)
+    
+    def set_sd_card_custom_header(self, header_string):
+        """
+        Send a custom header to the board so that it is added
+        in the SD file during recording.
+        See `mip.communication.commands.build_sd_card_header_command`.
+        """
+        logger.debug(f'Setting SD custom header to {header_string}')
+        if (self.connected == BOARD_CONNECTED):
+            future = self.write_command(build_sd_card_header_command(header_string), 'SD card custom header')
+            future.add_done_callback(self.check_sd_card_command)
+
+    def check_sd_card_command(self, future):
+        if (future.exception() is not None):
+            self.message_string = 'Could not configure SD card recording'
+
+    ###################################################
+    #               Data conversion                   # 
+    ###################################################
+    def convert_battery_voltage(self, value):
+        """
+        Convert raw bytes to battery voltage.
+        See `mip.communication.decoding.convert_battery_voltage`.
+        """
+        return decoding.convert_battery_voltage(value)
+
+    def convert_temperature(self, raw_temperature):
+        """
+        Convert raw bytes into temperature.
+        See `mip.communication.decoding.convert_temperature`.
+        """
+        return decoding.convert_temperature(raw_temperature)
+
+    def convert_humidity(self, raw_humidity):
+        """
+        Convert raw bytes into humidity value.
+        See `mip.communication.decoding.convert_humidity`.
+        """
+        return decoding.convert_humidity(raw_humidity)
+
+    def convert_capacitance(self, capacitance, capdac):
+        """
+        Convert raw bytes and capdac value into capacitance.
+        See `mip.communication.decoding.convert_capacitance`.
+        """
+        return decoding.convert_capacitance(capacitance, capdac)
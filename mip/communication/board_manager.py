@@ -0,0 +1,180 @@
+"""
+Management of several MIP boards connected to the same workstation.
+
+The `BoardManager` scans all the serial ports, connects to every board
+that answers to the connection request, and gives each of them its own
+`MIPSerial` object. Each board therefore has an independent reader
+thread, streaming state, sample rate properties and exporter file.
+"""
+import os
+import threading
+import time
+
+from loguru import logger
+
+from mip.communication.discovery import RESCAN_INTERVAL, find_mip_ports, list_candidate_ports, port_registry
+from mip.communication.mserial import MIPSerial, Singleton, BOARD_CONNECTED, BOARD_DISCONNECTED, BOARD_FOUND
+
+CAPTURE_ENV_VAR = 'MIP_CAPTURE'
+"""
+Environment variable enabling the raw capture of the bytes received
+from all the boards when set to 1. See `mip.communication.capture`.
+"""
+
+PORT_ENV_VAR = 'MIP_PORT'
+"""
+Environment variable forcing the port of the primary board, skipping
+discovery. It also accepts the URLs of `serial.serial_for_url`, such as
+the `replay://` ports of `mip.communication.protocol_replay`.
+"""
+
+
+class BoardManager(metaclass=Singleton):
+    """
+    Discover, connect and control all the boards attached to the workstation.
+
+    The first board found is assigned to the primary board, which
+    is created right away so that the widgets of the GUI can bind
+    to its properties before any board is found. The following
+    boards get a new `MIPSerial` object each.
+
+    Args:
+        - baudrate: baudrate of the ports
+        - discover: if True, start scanning the ports right away
+        - capture: if True, capture the raw bytes received from all the boards,
+          by default enabled by the `MIP_CAPTURE` environment variable
+        - port_name: port of the primary board, skipping discovery,
+          by default taken from the `MIP_PORT` environment variable
+
+    Usage:
+    >>> manager = BoardManager()
+    >>> manager.primary_board.bind(connected=callback)
+    >>> manager.start_streaming()
+    """
+
+    def __init__(self, baudrate=115200, discover=True, capture=None, port_name=None):
+        if (capture is None):
+            capture = (os.environ.get(CAPTURE_ENV_VAR) == '1')
+        if (port_name is None):
+            port_name = os.environ.get(PORT_ENV_VAR)
+        self.baudrate = baudrate
+        self.port_name = port_name
+        self.lock = threading.Lock()
+        self.primary_board = MIPSerial(baudrate=baudrate, board_id=0, discover=False, capture=capture)
+        self.boards = [self.primary_board]
+        if (discover):
+            discovery_thread = threading.Thread(target=self.discover_boards, daemon=True)
+            discovery_thread.start()
+
+    def discover_boards(self):
+        """
+        Scan the ports until at least one board is connected.
+        The ports where boards were last found are probed first.
+        If a port was forced, only that port is used.
+        """
+        if (self.port_name is not None):
+            self.connect_forced_port()
+            return
+        cached_ports = self.primary_board.port_cache.candidates(exclude=port_registry.in_use())
+        if (len(cached_ports) > 0):
+            logger.debug(f'Trying cached ports: {cached_ports}')
+            self.scan_ports(cached_ports)
+        while (len(self.get_connected_boards()) == 0):
+            self.scan_ports()
+            if (len(self.get_connected_boards()) == 0):
+                time.sleep(RESCAN_INTERVAL)
+
+    def connect_forced_port(self):
+        """
+        Connect the primary board to the forced port, retrying until it succeeds.
+        """
+        board = self.primary_board
+        board.port_name = self.port_name
+        while (True):
+            board.connected = BOARD_FOUND
+            if (board.connect() == 0):
+                logger.debug(f'Board {board.board_id} connected on {self.port_name}')
+                return
+            board.connected = BOARD_DISCONNECTED
+            logger.critical(f'Could not connect to board on {self.port_name}')
+            time.sleep(RESCAN_INTERVAL)
+
+    def scan_ports(self, port_names=None):
+        """
+        Probe in parallel all the ports not in use by a board,
+        connected or reconnecting, and connect to every board that answers.
+
+        Args:
+            - port_names: names of the ports to be probed, all the candidate ports if None
+
+        Returns:
+            - list of boards connected during this scan
+        """
+        if (port_names is None):
+            port_names = list_candidate_ports()
+        found_ports = find_mip_ports(port_names, baudrate=self.baudrate, first_only=False,
+                                     exclude=port_registry.in_use())
+        new_boards = []
+        for port_name in found_ports:
+            board = self.get_free_board()
+            board.connected = BOARD_FOUND
+            board.port_name = port_name
+            if (board.connect() == 0):
+                logger.debug(f'Board {board.board_id} connected on {port_name}')
+                new_boards.append(board)
+            else:
+                board.connected = BOARD_DISCONNECTED
+                logger.critical(f'Could not connect to board on {port_name}')
+        return new_boards
+
+    def get_free_board(self):
+        """
+        Return a board object not connected to any port,
+        creating a new one if needed.
+        """
+        with self.lock:
+            for board in self.boards:
+                if (board.connected != BOARD_CONNECTED):
+                    return board
+            board = MIPSerial(baudrate=self.baudrate, board_id=len(self.boards), discover=False)
+            self.copy_export_settings(board)
+            self.boards.append(board)
+            return board
+
+    def get_connected_boards(self):
+        """
+        Return the list of boards currently connected.
+        """
+        return [board for board in self.boards if board.connected == BOARD_CONNECTED]
+
+    def copy_export_settings(self, board):
+        """
+        Copy the export and capture settings of the primary board to another board.
+
+        Args:
+            - board: the board whose exporter is to be configured
+        """
+        primary_exporter = self.primary_board.exporter
+        board.exporter.save_data = primary_exporter.save_data
+        board.exporter.data_path = primary_exporter.data_path
+        board.exporter.data_format = primary_exporter.data_format
+        board.exporter.delim = primary_exporter.delim
+        board.exporter.custom_header = primary_exporter.custom_header
+        board.capture_enabled = self.primary_board.capture_enabled
+
+    def start_streaming(self):
+        """
+        Start data streaming on all the connected boards.
+        """
+        for board in self.get_connected_boards():
+            if (board is not self.primary_board):
+                self.copy_export_settings(board)
+            board.start_streaming()
+
+    def stop_streaming(self):
+        """
+        Stop data streaming on all the connected boards.
+        """
+        for board in self.get_connected_boards():
+            if (board.is_streaming):
+                board.stop_streaming()
@@ -0,0 +1,272 @@
+"""
+Raw capture of the bytes received from a MIP board.
+
+A capture stores every byte read from the port, before any decoding,
+together with the monotonic time at which it was read. Unlike the
+exported CSV files, it keeps voltage and sample rate packets, corrupted
+packets and the exact timing of the stream, so that a session can be
+replayed through the whole acquisition pipeline.
+
+The reader thread only appends the received chunks to a queue: the file
+is written by a separate thread through a large buffer, so capturing
+never delays the reads from the port.
+
+Capture file format, version 1. All the integers are little endian.
+
+File header:
+
+| Field            | Type      | Description                                   |
+|------------------|-----------|-----------------------------------------------|
+| magic            | 6 bytes   | `MIPCAP`                                      |
+| version          | uint8     | format version, currently 1                   |
+| reserved         | uint8     | 0                                             |
+| start_time       | float64   | wall-clock time of the start, seconds since epoch |
+| start_monotonic  | int64     | `time.monotonic_ns()` at the start            |
+| baudrate         | uint32    | baudrate of the port                          |
+| port_name_len    | uint16    | length of the port name                       |
+| port_name        | bytes     | name of the port, UTF-8                       |
+
+The header is followed by any number of blocks:
+
+| Field            | Type      | Description                                   |
+|------------------|-----------|-----------------------------------------------|
+| type             | uint8     | `BLOCK_RX` for bytes received from the board  |
+| timestamp        | int64     | `time.monotonic_ns()` when the first byte of the block was read |
+| length           | uint32    | number of bytes of the payload                |
+| payload          | bytes     | the bytes, in the order they were received    |
+
+Chunks read within `CAPTURE_BLOCK_INTERVAL` of the start of a block are
+merged in the same block. The file is append-only: a capture interrupted
+by a crash may end with a truncated block, which readers ignore. Readers
+must skip blocks of unknown type.
+
+This module does not depend on Kivy.
+"""
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import struct
+import threading
+import time
+
+from loguru import logger
+
+CAPTURE_MAGIC = b'MIPCAP'
+"""
+First bytes of every capture file.
+"""
+
+CAPTURE_VERSION = 1
+"""
+Version of the capture file format written by `CaptureWriter`.
+"""
+
+CAPTURE_FILE_EXTENSION = '.mipcap'
+"""
+Extension of the capture files.
+"""
+
+CAPTURE_HEADER = struct.Struct('<6sBBdqIH')
+"""
+Fixed part of the file header, followed by the port name.
+"""
+
+CAPTURE_BLOCK_HEADER = struct.Struct('<BqI')
+"""
+Header of each block: type, timestamp and payload length.
+"""
+
+BLOCK_RX = 0x01
+"""
+Block holding bytes received from the board.
+"""
+
+CAPTURE_BLOCK_INTERVAL = 0.01
+"""
+Maximum time, in seconds, between the first and the last
+chunk merged in the same block.
+"""
+
+CAPTURE_BLOCK_MAX_SIZE = 1 << 16
+"""
+Maximum payload size, in bytes, of a block.
+"""
+
+CAPTURE_WRITE_INTERVAL = 0.1
+"""
+Time, in seconds, between two wake-ups of the writer thread.
+"""
+
+CAPTURE_BUFFER_SIZE = 1 << 20
+"""
+Size, in bytes, of the write buffer of the capture file.
+"""
+
+CAPTURE_FLUSH_INTERVAL = 1
+"""
+Time, in seconds, between two flushes of the capture file.
+"""
+
+CAPTURE_MAX_PENDING = 64 << 20
+"""
+Maximum number of bytes waiting to be written. Further chunks
+are dropped, and counted, until the writer catches up.
+"""
+
+
+class CaptureWriter():
+    """
+    Write the bytes received from a port to a capture file.
+
+    Args:
+        - file_path: path of the capture file, opened in append mode
+        - port_name: name of the port, stored in the file header
+        - baudrate: baudrate of the port, stored in the file header
+
+    Usage:
+    >>> capture = CaptureWriter('session.mipcap', '/dev/rfcomm0', 115200)
+    >>> capture.write(data)
+    >>> capture.close()
+    """
+
+    def __init__(self, file_path, port_name='', baudrate=0):
+        self.file_path = Path(file_path)
+        self.pending = deque()
+        self.stop_requested = threading.Event()
+        self.bytes_queued = 0
+        self.bytes_written = 0
+        self.blocks_written = 0
+        self.dropped_bytes = 0
+        self.file = open(self.file_path, 'ab', buffering=CAPTURE_BUFFER_SIZE)
+        if (self.file.tell() == 0):
+            self.write_file_header(port_name, baudrate)
+        self.thread = threading.Thread(target=self.write_blocks, name='mip-capture', daemon=True)
+        self.thread.start()
+        logger.debug(f'Capturing raw data in {self.file_path}')
+
+    def write_file_header(self, port_name, baudrate):
+        port_name = port_name.encode('utf-8')
+        self.file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0, time.time(),
+                                            time.monotonic_ns(), baudrate, len(port_name)))
+        self.file.write(port_name)
+
+    def write(self, data, timestamp=None):
+        """
+        Queue a chunk of received bytes. Called by the reader thread,
+        it never blocks on the file.
+
+        Args:
+            - data: the bytes read from the port
+            - timestamp: `time.monotonic_ns()` of the read, taken now if None
+        """
+        if (timestamp is None):
+            timestamp = time.monotonic_ns()
+        if (self.bytes_queued - self.bytes_written > CAPTURE_MAX_PENDING):
+            self.dropped_bytes += len(data)
+            return
+        self.bytes_queued += len(data)
+        self.pending.append((timestamp, data))
+
+    def write_blocks(self):
+        """
+        Merge the queued chunks into blocks and write them to file.
+        Runs in its own thread until the writer is closed.
+        """
+        block_interval = int(CAPTURE_BLOCK_INTERVAL * 1e9)
+        last_flush = time.monotonic()
+        while (True):
+            stopping = self.stop_requested.wait(CAPTURE_WRITE_INTERVAL)
+            block_timestamp = None
+            block = bytearray()
+            while (len(self.pending) > 0):
+                timestamp, data = self.pending.popleft()
+                if (block_timestamp is not None and
+                        (timestamp - block_timestamp > block_interval or
+                         len(block) + len(data) > CAPTURE_BLOCK_MAX_SIZE)):
+                    self.write_block(block_timestamp, block)
+                    block = bytearray()
+                    block_timestamp = None
+                if (block_timestamp is None):
+                    block_timestamp = timestamp
+                block += data
+            if (block_timestamp is not None):
+                self.write_block(block_timestamp, block)
+            if (stopping):
+                break
+            if (time.monotonic() - last_flush > CAPTURE_FLUSH_INTERVAL):
+                self.file.flush()
+                last_flush = time.monotonic()
+        self.file.close()
+
+    def write_block(self, timestamp, payload):
+        self.file.write(CAPTURE_BLOCK_HEADER.pack(BLOCK_RX, timestamp, len(payload)))
+        self.file.write(payload)
+        self.bytes_written += len(payload)
+        self.blocks_written += 1
+
+    def close(self):
+        """
+        Write all the queued chunks and close the file.
+        """
+        self.stop_requested.set()
+        self.thread.join()
+        logger.debug(f'Raw capture closed: {self.bytes_written} bytes in '
+                     f'{self.blocks_written} blocks, {self.dropped_bytes} bytes dropped')
+
+
+class CaptureReader():
+    """
+    Read a capture file written by `CaptureWriter`.
+
+    Args:
+        - file_path: path of the capture file
+
+    Raises:
+        - ValueError: if the file is not a capture file, or its version is not supported
+
+    Usage:
+    >>> capture = CaptureReader('session.mipcap')
+    >>> for timestamp, data in capture.blocks():
+    ...     scanner.feed(data)
+    """
+
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        with open(self.file_path, 'rb') as f:
+            header = f.read(CAPTURE_HEADER.size)
+            if (len(header) < CAPTURE_HEADER.size or not header.startswith(CAPTURE_MAGIC)):
+                raise ValueError(f'{self.file_path} is not a capture file')
+            (_, self.version, _, self.start_time, self.start_monotonic,
+                self.baudrate, port_name_len) = CAPTURE_HEADER.unpack(header)
+            if (self.version > CAPTURE_VERSION):
+                raise ValueError(f'Capture format version {self.version} is not supported')
+            self.port_name = f.read(port_name_len).decode('utf-8')
+            self.data_offset = f.tell()
+
+    def start_datetime(self):
+        """
+        Return the wall-clock time of the start of the capture.
+        """
+        return datetime.fromtimestamp(self.start_time)
+
+    def blocks(self):
+        """
+        Iterate over the received blocks of the capture.
+
+        Returns:
+            - iterator of `(timestamp, data)` tuples, with the timestamp
+              in nanoseconds of the monotonic clock of the capture
+        """
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.data_offset)
+            while (True):
+                block_header = f.read(CAPTURE_BLOCK_HEADER.size)
+                if (len(block_header) < CAPTURE_BLOCK_HEADER.size):
+                    return
+                block_type, timestamp, length = CAPTURE_BLOCK_HEADER.unpack(block_header)
+                payload = f.read(length)
+                if (len(payload) < length):
+                    # Truncated block at the end of an interrupted capture
+                    return
+                if (block_type == BLOCK_RX):
+                    yield timestamp, payload
@@ -0,0 +1,406 @@
+"""
+Commands understood by the MIP board.
+
+The module defines the single-character commands sent to the board,
+the functions building the multi-byte commands, and the timeouts of
+the commands the board replies to. It is shared by the threaded
+`mip.communication.mserial.MIPSerial` and by the asyncio transport
+in `mip.communication.aio`.
+
+The board does not acknowledge configuration commands by itself: each
+of them is followed by the request of the sample rate configuration,
+and the sample rate packet sent in reply acknowledges the command and
+reports the resulting configuration. `PendingCommands` pairs these
+packets with the futures returned to the callers.
+
+This module does not depend on Kivy.
+"""
+from collections import deque, namedtuple
+from concurrent.futures import Future
+import threading
+
+from loguru import logger
+
+CONN_REQUEST_CMD = 'v'
+"""
+Command sent to the device to check whether it is connected to a port.
+"""
+
+CONN_REPLY = '$$$'
+"""
+Reply of the device to the connection request command.
+"""
+
+START_STREAMING_CMD = 'b'
+"""
+Command to start streaming data.
+"""
+
+STOP_STREAMING_CMD = 's'
+"""
+Command to stop streaming data.
+"""
+
+"""!
+@brief Time set command.
+"""
+TIME_SET_CMD = 't'
+
+"""!
+@brief Time latch command.
+"""
+TIME_LATCH_CMD = 'T'
+
+"""!
+@brief Temperature and relative humidity set command.
+"""
+TEMP_RH_SETTINGS_SET_CMD = 'x'
+
+"""!
+@brief Temperature and relative humidity latch command.
+"""
+TEMP_RH_SETTINGS_LATCH_CMD = 'X'
+
+SD_CARD_CUSTOM_HEADER_SET_CMD = 'y'
+"""
+Command to set custom header info in SD card file.
+"""
+
+SD_CARD_CUSTOM_HEADER_LATCH_CMD = 'Y'
+"""
+Command to latch custom header info in SD card file.
+"""
+
+SAMPLE_RATE_1_HZ_CMD   = '1'
+SAMPLE_RATE_10_HZ_CMD  = '2'
+SAMPLE_RATE_25_HZ_CMD  = '3'
+SAMPLE_RATE_50_HZ_CMD  = '4'
+SAMPLE_RATE_100_HZ_CMD = '5'
+
+RETRIEVE_SAMPLE_RATE_CMD = 'w'
+
+SAMPLE_RATES = ['1 Hz', '10 Hz', '25 Hz', '50 Hz', '100 Hz']
+"""
+Sample rates of the data packets, in the order of the index
+sent by the board in the sample rate packet.
+"""
+
+SAMPLE_RATE_CMDS = {
+    '1 Hz': SAMPLE_RATE_1_HZ_CMD,
+    '10 Hz': SAMPLE_RATE_10_HZ_CMD,
+    '25 Hz': SAMPLE_RATE_25_HZ_CMD,
+    '50 Hz': SAMPLE_RATE_50_HZ_CMD,
+    '100 Hz': SAMPLE_RATE_100_HZ_CMD,
+}
+"""
+Command setting each sample rate of the data packets.
+"""
+
+TEMP_RH_SAMPLE_RATES = ['0.5 Hz', '1 Hz', '2 Hz', '4 Hz', '10 Hz']
+"""
+Sample rates of the temperature and relative humidity sensor.
+"""
+
+TEMP_RH_CONFIG = {
+    '0.5 Hz': {
+        'Low': [0x20, 0x2f],
+        'Med': [0x20, 0x24],
+        'High': [0x20, 0x32],
+    },
+    '1 Hz': {
+        'Low': [0x21, 0x2D],
+        'Med': [0x21, 0x26],
+        'High': [0x21, 0x30], 
+    },
+    '2 Hz': {
+        'Low': [0x22, 0x2B],
+        'Med': [0x22, 0x20],
+        'High': [0x22, 0x36],
+    },
+    '4 Hz': {
+        'Low': [0x23, 0x29],
+        'Med': [0x23, 0x22],
+        'High': [0x23, 0x34],
+    },
+    '10 Hz': {
+        'Low': [0x27, 0x2A],
+        'Med': [0x27, 0x21],
+        'High': [0x27, 0x37],
+    }
+}
+"""
+Configuration bytes of the temperature and relative humidity
+sensor for each sample rate and repeatability setting. The
+same bytes are sent back by the board in the sample rate packet.
+"""
+
+SD_CARD_REC_CMDS = {
+    '5': 'A',
+    '15': 'B',
+    '30': 'C',
+    '60': 'D',
+    '120': 'E',
+    '180': 'F',
+}
+"""
+Commands starting an SD card recording of the given number of minutes.
+"""
+
+SD_CARD_HEADER_LENGTH = 4
+"""
+Number of characters of the custom header of the SD card files.
+"""
+
+COMMAND_ARGUMENT_LENGTHS = {
+    TIME_SET_CMD: 7,
+    TEMP_RH_SETTINGS_SET_CMD: 2,
+    SD_CARD_CUSTOM_HEADER_SET_CMD: SD_CARD_HEADER_LENGTH,
+}
+"""
+Number of argument bytes sent after each multi-byte command,
+before its latch command.
+"""
+
+COMMAND_LATCHES = {
+    TIME_SET_CMD: TIME_LATCH_CMD,
+    TEMP_RH_SETTINGS_SET_CMD: TEMP_RH_SETTINGS_LATCH_CMD,
+    SD_CARD_CUSTOM_HEADER_SET_CMD: SD_CARD_CUSTOM_HEADER_LATCH_CMD,
+}
+"""
+Latch command closing each multi-byte command.
+"""
+
+READY_REPLY_TIMEOUT = 2
+"""
+Maximum time, in seconds, to wait for the board to answer to the
+connection request after the port is opened.
+"""
+
+SAMPLE_RATE_REPLY_TIMEOUT = 2
+"""
+Maximum time, in seconds, to wait for the sample rate packet
+after the sample rate configuration is requested, and default
+timeout of the acknowledge of the configuration commands.
+"""
+
+SampleRateConfiguration = namedtuple('SampleRateConfiguration',
+                                     ['sample_rate', 'temp_rh_sample_rate', 'temp_rh_repeatability'])
+"""
+Configuration reported by a sample rate packet, as the strings shown
+in the GUI, e.g. `('100 Hz', '1 Hz', 'Med')`. It is the result of the
+futures of the configuration commands.
+"""
+
+
+def build_time_command(curr_time):
+    """
+    Build the command that updates time and date on the board.
+
+    The command has the following structure:
+        - First byte 't'
+        - Two bytes for current year
+        - One byte for month
+        - One byte for day
+        - One byte for hour
+        - One byte for minute
+        - One byte for second
+        - Last byte 'T'
+
+    Args:
+        - curr_time: the `datetime` to be sent to the board
+
+    Returns:
+        - the bytes of the command
+
+    Usage:
+    >>> from datetime import datetime
+    >>> build_time_command(datetime(2021, 3, 4, 5, 6, 7))
+    b't\\x07\\xe5\\x03\\x04\\x05\\x06\\x07T'
+    """
+    time_date_settings = bytes([curr_time.year >> 8,
+                                curr_time.year & 0xFF,
+                                curr_time.month,
+                                curr_time.day,
+                                curr_time.hour,
+                                curr_time.minute,
+                                curr_time.second])
+    return TIME_SET_CMD.encode('utf-8') + time_date_settings + TIME_LATCH_CMD.encode('utf-8')
+
+
+def build_temp_rh_command(config):
+    """
+    Build the command that configures the temperature and relative humidity sensor.
+
+    Args:
+        - config: the two configuration bytes, see `TEMP_RH_CONFIG`
+
+    Returns:
+        - the bytes of the command
+
+    Usage:
+    >>> build_temp_rh_command(TEMP_RH_CONFIG['1 Hz']['Med'])
+    b'x!&X'
+    """
+    return TEMP_RH_SETTINGS_SET_CMD.encode('utf-8') + bytes(config) + TEMP_RH_SETTINGS_LATCH_CMD.encode('utf-8')
+
+
+def build_sd_card_header_command(header_string):
+    """
+    Build the command that sets the custom header of the SD card files.
+    The header is cut or padded with spaces to `SD_CARD_HEADER_LENGTH` characters.
+
+    Args:
+        - header_string: the custom header
+
+    Returns:
+        - the bytes of the command
+
+    Usage:
+    >>> build_sd_card_header_command('ab')
+    b'y  abY'
+    """
+    header = header_string[:SD_CARD_HEADER_LENGTH].rjust(SD_CARD_HEADER_LENGTH, ' ')
+    return (SD_CARD_CUSTOM_HEADER_SET_CMD.encode('utf-8') + header.encode('utf-8') +
+            SD_CARD_CUSTOM_HEADER_LATCH_CMD.encode('utf-8'))
+
+
+def configuration_matches(configuration, expected):
+    """
+    Return True if a reported configuration holds the requested values.
+
+    Args:
+        - configuration: the `SampleRateConfiguration` reported by the board
+        - expected: the `SampleRateConfiguration` requested, whose None fields
+          match any value, or None if any configuration is expected
+
+    Usage:
+    >>> configuration_matches(SampleRateConfiguration('100 Hz', '1 Hz', 'Med'),
+    ...                       SampleRateConfiguration('100 Hz', None, None))
+    True
+    """
+    if (expected is None):
+        return True
+    return all(value is None or value == reported for reported, value in zip(configuration, expected))
+
+
+def failed_future(exception):
+    """
+    Return a `concurrent.futures.Future` that already failed with
+    `exception`, for commands that could not be sent at all.
+    """
+    future = Future()
+    future.set_exception(exception)
+    return future
+
+
+class PendingCommands():
+    """
+    Futures of the commands waiting for their acknowledge.
+
+    The board answers the requests of the sample rate configuration in
+    the order they are received, so the commands are acknowledged in
+    the same order they were sent: each sample rate packet resolves the
+    oldest pending future. A future not acknowledged within its timeout
+    fails with `TimeoutError` and is no longer waited for.
+
+    The board may still answer a command that timed out, and its late
+    reply must not acknowledge the next command. While such replies are
+    owed, a sample rate packet arriving when no command is pending, or
+    not holding the configuration requested by the oldest one, is taken
+    for a late reply and discarded.
+
+    Usage:
+    >>> pending_commands = PendingCommands()
+    >>> future = pending_commands.add('sample rate 100 Hz', timeout=2)
+    >>> pending_commands.acknowledge(SampleRateConfiguration('100 Hz', '1 Hz', 'Med'))
+    True
+    >>> future.result()
+    SampleRateConfiguration(sample_rate='100 Hz', temp_rh_sample_rate='1 Hz', temp_rh_repeatability='Med')
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.late_replies = 0
+        self.lock = threading.Lock()
+
+    def add(self, description, timeout=SAMPLE_RATE_REPLY_TIMEOUT, expected=None):
+        """
+        Register a command that is about to be sent.
+
+        Args:
+            - description: description of the command, used in the error messages
+            - timeout: maximum time, in seconds, to wait for the acknowledge
+            - expected: the `SampleRateConfiguration` requested by the command,
+              see `configuration_matches`, None for any configuration
+
+        Returns:
+            - the `concurrent.futures.Future` of the command
+        """
+        future = Future()
+        timer = threading.Timer(timeout, self.fail, args=(
+            future, TimeoutError(f'No acknowledge of {description} within {timeout} s'), True))
+        timer.daemon = True
+        with self.lock:
+            self.pending.append((future, timer, expected))
+        timer.start()
+        return future
+
+    def acknowledge(self, result):
+        """
+        Resolve the oldest pending command with the configuration
+        reported by a sample rate packet, unless the packet is the
+        late reply to a command that timed out.
+
+        Returns:
+            - True if a command was acknowledged, False if none was
+              pending or the packet was discarded
+        """
+        with self.lock:
+            if (self.late_replies > 0 and
+                    (len(self.pending) == 0 or not configuration_matches(result, self.pending[0][2]))):
+                self.late_replies -= 1
+                logger.debug(f'Discarded late acknowledge {tuple(result)}')
+                return False
+            if (len(self.pending) == 0):
+                return False
+            future, timer, _ = self.pending.popleft()
+        timer.cancel()
+        future.set_result(result)
+        return True
+
+    def fail(self, future, exception, timed_out=False):
+        """
+        Stop waiting for the acknowledge of a command, failing its future.
+        Does nothing if the command was already acknowledged or failed.
+
+        Args:
+            - future: the future of the command
+            - exception: the exception of the future
+            - timed_out: True if the command was sent, so that the board
+              may still reply to it
+        """
+        with self.lock:
+            entry = next((entry for entry in self.pending if entry[0] is future), None)
+            if (entry is None):
+                return
+            self.pending.remove(entry)
+            if (timed_out):
+                self.late_replies += 1
+        entry[1].cancel()
+        future.set_exception(exception)
+
+    def fail_all(self, exception):
+        """
+        Fail all the pending commands, e.g. when the link is lost.
+        Late replies are no longer expected.
+        """
+        with self.lock:
+            entries = list(self.pending)
+            self.pending.clear()
+            self.late_replies = 0
+        for future, timer, _ in entries:
+            timer.cancel()
+            future.set_exception(exception)
+
+    def __len__(self):
+        return len(self.pending)
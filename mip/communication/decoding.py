@@ -0,0 +1,252 @@
+"""
+Conversion of the raw values streamed by the MIP device.
+
+The module provides scalar functions that convert the raw bytes
+of a single sample, and `decode_data_frames`, which converts N data
+frames stored in a contiguous byte buffer in a single vectorized
+call. The batch decoder gives exactly the same values of the scalar
+functions, and is meant for replay and bulk import of recorded data.
+`decode_data_fields` does the same on frames already unpacked by the
+frame scanner, and is used to build `mip.communication.packets.DataPacketBatch`.
+
+This module does not depend on Kivy.
+"""
+from collections import namedtuple
+import struct
+
+import numpy as np
+
+from mip.communication.framing import (DATA_FRAME_LEN, DATA_PACKET_HEADER, DATA_PACKET_TAIL,
+                                       DATA_CRC_IDX, DATA_COUNTER_IDX)
+
+CAPDAC_FACTOR = 3.125
+"""
+Capdac factor for capacitance conversion
+"""
+
+CAPACITANCE_DIVIDER = 2 << 18
+"""
+Divider converting the 24-bit capacitance words into pF.
+"""
+
+CAPDAC_MAX = 31
+"""
+Maximum capdac value of the FDC1004Q.
+"""
+
+CAPACITANCE_RAW_MAX = (1 << 24) - 1
+"""
+Maximum value of the 24-bit capacitance words.
+"""
+
+SHT85_FULL_SCALE = (2 << 15) - 1
+"""
+Full scale of the 16-bit SHT85 temperature and humidity words.
+"""
+
+INVALID_TEMPERATURE = -45
+"""
+Temperature value sent by the board when no new temperature
+and humidity sample is available.
+"""
+
+DecodedFrames = namedtuple('DecodedFrames', ['packet_counter', 'crc', 'temperature', 'humidity',
+                                             'has_temp_data', 'capdac', 'capacitance_raw',
+                                             'capacitance', 'current', 'aux'])
+"""
+Columns decoded from N data frames. `capdac`, `capacitance_raw` and
+`capacitance` have shape (N, 4), all the other columns have shape (N,).
+"""
+
+
+def convert_battery_voltage(value):
+    """Convert raw bytes to battery voltage.
+
+    This function converts the bytes passed in as
+    parameter to a proper voltage value. The
+    battery voltage is equal to the 16 bit data
+    computed from the two bytes (MSB first) and
+    divided by 100.
+    @param value battery voltage raw values
+    @return computed battery voltage
+    """
+    value = struct.unpack('2B', value)
+    val = value[0] << 8 | value[1]
+    battery_voltage = val / 100.
+    return battery_voltage
+
+
+def convert_temperature(raw_temperature):
+    """!
+    @brief Convert raw bytes into temperature.
+
+    This function converts the bytes passed in as
+    parameter to a proper temperature value. The
+    temperature value is computed given the
+    equation stated in the SHT85 datasheet.
+    @param raw_temperature temperature bytes
+    @return computed temperature value
+    """
+    temp = raw_temperature[0] << 8 | raw_temperature[1]
+    temperature = -45 + 175 * temp / SHT85_FULL_SCALE
+    return temperature
+
+
+def convert_humidity(raw_humidity):
+    """
+    Convert raw bytes into humidity value.
+
+    This function converts the bytes passed in as
+    parameter to a proper humidity value. The
+    humidity value is computed given the
+    equation stated in the SHT85 datasheet.
+
+    Args:
+        - raw_humidity: the raw humidity bytes to be converted
+    Returns:
+        - the proper humidity value
+    """
+    temp = raw_humidity[0] << 8 | raw_humidity[1]
+    humidity = 100 * temp / SHT85_FULL_SCALE
+    return humidity
+
+
+def convert_capacitance(capacitance, capdac):
+    """
+    Convert raw bytes and capdac value into capacitance.
+
+    This function converts the bytes passed in as
+    parameter to a proper capacitance value based
+    on capdac settings. The capacitance value is
+    computed given the equation stated in the FDC1004Q datasheet.
+
+    Args:
+        - capacitance 3 bytes of capacitance data
+        - capdac single byte capdac value
+
+    Returns:
+        - computed capacitance value
+    """
+    capacitance_v = capacitance[0] << 16 | capacitance[1] << 8 | capacitance[2]
+    capacitance_v = capacitance_v / CAPACITANCE_DIVIDER
+    capacitance_v = capacitance_v + capdac * CAPDAC_FACTOR
+    return capacitance_v
+
+
+def encode_temperature(temperature):
+    """
+    Convert a temperature value into the 16-bit word sent by the device.
+    Inverse of `convert_temperature`, up to the resolution of the sensor.
+    """
+    raw = round((temperature - INVALID_TEMPERATURE) * SHT85_FULL_SCALE / 175)
+    return min(max(raw, 0), SHT85_FULL_SCALE)
+
+
+def encode_humidity(humidity):
+    """
+    Convert a humidity value into the 16-bit word sent by the device.
+    Inverse of `convert_humidity`, up to the resolution of the sensor.
+    """
+    raw = round(humidity * SHT85_FULL_SCALE / 100)
+    return min(max(raw, 0), SHT85_FULL_SCALE)
+
+
+def encode_capacitance(capacitance):
+    """
+    Convert a capacitance value into the capdac value and the
+    24-bit word sent by the device. Inverse of `convert_capacitance`,
+    up to the resolution of the sensor.
+
+    Returns:
+        - capdac value
+        - 24-bit capacitance word
+
+    Usage:
+    >>> capdac, raw = encode_capacitance(10.5)
+    >>> convert_capacitance(raw.to_bytes(3, 'big'), capdac)
+    10.5
+    """
+    capdac = min(max(int(capacitance // CAPDAC_FACTOR), 0), CAPDAC_MAX)
+    raw = round((capacitance - capdac * CAPDAC_FACTOR) * CAPACITANCE_DIVIDER)
+    return capdac, min(max(raw, 0), CAPACITANCE_RAW_MAX)
+
+
+def has_temperature_data(temperature, humidity):
+    """
+    Return True if the temperature and humidity values carry a new sample.
+    Works both on scalars and on NumPy arrays.
+    """
+    return (temperature != INVALID_TEMPERATURE) & (humidity != 0)
+
+
+def decode_data_frames(buffer, check_frames=True):
+    """
+    Convert N data frames in a single vectorized call.
+
+    Args:
+        - buffer: bytes-like object holding N complete data frames, one after the other
+        - check_frames: if True, check header and tail byte of every frame
+
+    Returns:
+        - `DecodedFrames` with the converted columns
+
+    Raises:
+        - ValueError: if the buffer length is not a multiple of the frame
+          length, or if a frame does not start and end with the
+          data packet header and tail bytes
+
+    Usage:
+    >>> frame = bytes([0xA1, 0, 7, 0x66, 0x66, 0x80, 0, 1, 2, 3, 4] + [0] * 12 + [0] * 4 + [0xC0])
+    >>> decoded = decode_data_frames(frame * 2)
+    >>> decoded.packet_counter.tolist(), decoded.capacitance[0].tolist()
+    ([7, 7], [3.125, 6.25, 9.375, 12.5])
+    """
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    if (raw.size % DATA_FRAME_LEN != 0):
+        raise ValueError(f'Buffer length {raw.size} is not a multiple of {DATA_FRAME_LEN}')
+    frames = raw.reshape(-1, DATA_FRAME_LEN)
+    if (check_frames and frames.shape[0] > 0):
+        if (np.any(frames[:, 0] != DATA_PACKET_HEADER) or np.any(frames[:, -1] != DATA_PACKET_TAIL)):
+            raise ValueError('Buffer contains frames that are not data frames')
+    return decode_data_fields(frames)
+
+
+def decode_data_fields(frames):
+    """
+    Convert N data frames, one per row of a byte array, in a single vectorized call.
+
+    Args:
+        - frames: array of shape (N, `DATA_FRAME_LEN`), or sequence of N tuples
+          of fields unpacked by `mip.communication.framing.FrameScanner`
+
+    Returns:
+        - `DecodedFrames` with the converted columns
+    """
+    frames = np.asarray(frames, dtype=np.uint8).reshape(-1, DATA_FRAME_LEN)
+
+    # Big endian 16-bit words: temperature, humidity, current and aux
+    words = frames[:, 3:7].astype(np.int64)
+    temperature_raw = words[:, 0] << 8 | words[:, 1]
+    humidity_raw = words[:, 2] << 8 | words[:, 3]
+    temperature = -45 + (175 * temperature_raw) / SHT85_FULL_SCALE
+    humidity = (100 * humidity_raw) / SHT85_FULL_SCALE
+
+    capdac = frames[:, 7:11]
+    cap_bytes = frames[:, 11:23].reshape(-1, 4, 3).astype(np.int64)
+    capacitance_raw = cap_bytes[:, :, 0] << 16 | cap_bytes[:, :, 1] << 8 | cap_bytes[:, :, 2]
+    capacitance = capacitance_raw / CAPACITANCE_DIVIDER + capdac * CAPDAC_FACTOR
+
+    tail_words = frames[:, 23:27].astype(np.uint16)
+    current = tail_words[:, 0] << 8 | tail_words[:, 1]
+    aux = tail_words[:, 2] << 8 | tail_words[:, 3]
+
+    return DecodedFrames(packet_counter=frames[:, DATA_COUNTER_IDX],
+                         crc=frames[:, DATA_CRC_IDX],
+                         temperature=temperature,
+                         humidity=humidity,
+                         has_temp_data=has_temperature_data(temperature, humidity),
+                         capdac=capdac,
+                         capacitance_raw=capacitance_raw,
+                         capacitance=capacitance,
+                         current=current,
+                         aux=aux)
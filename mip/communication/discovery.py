@@ -0,0 +1,243 @@
+"""
+Discovery of the serial ports to which MIP devices are connected.
+
+All the candidate ports are probed in parallel by a bounded pool of
+worker threads, so that discovery takes about as long as the slowest
+single probe rather than the sum of all of them. Each probe has its
+own deadline, and the probes still running when the first device
+answers can be cancelled.
+
+Each board claims its port in `port_registry` before opening it and
+releases it once closed. Discovery skips the claimed ports, so that
+no probe is ever written to, or read from, the port of a connected board.
+Ports are also opened with an exclusive lock, so that a port held by
+another process, or not yet in the registry, cannot be opened twice.
+
+This module does not depend on Kivy.
+"""
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from sys import platform
+import threading
+import time
+
+import serial
+import serial.tools.list_ports as list_ports
+from loguru import logger
+
+from mip.communication.commands import CONN_REQUEST_CMD, CONN_REPLY
+
+PROBE_REPLY_TIMEOUT = 2
+"""
+Maximum time, in seconds, to wait for the reply of the device
+after sending the connection request. The wait ends as soon
+as the reply is received.
+"""
+
+PROBE_READ_TIMEOUT = 0.05
+"""
+Timeout, in seconds, of the single reads while waiting for a reply.
+It bounds how long a cancelled probe keeps the port open.
+"""
+
+PROBE_DEADLINE = 3
+"""
+Maximum time, in seconds, given to the probe of a single port,
+including the time needed to open it.
+"""
+
+MAX_PROBE_WORKERS = 16
+"""
+Maximum number of ports probed at the same time.
+"""
+
+RESCAN_INTERVAL = 2
+"""
+Time, in seconds, between two scans of the ports while
+no device has been found.
+"""
+
+
+class PortRegistry():
+    """
+    Ports held by the boards of this process.
+
+    Usage:
+    >>> registry = PortRegistry()
+    >>> registry.claim('/dev/ttyUSB0', 'board 0'), registry.claim('/dev/ttyUSB0', 'board 1')
+    (True, False)
+    >>> registry.in_use(), registry.in_use(owner='board 0')
+    ({'/dev/ttyUSB0'}, set())
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owners = {}
+
+    def claim(self, port_name, owner):
+        """
+        Claim a port for an owner, usually the board about to open it.
+
+        Returns:
+            - True if the port was free or already claimed by the same owner
+        """
+        with self.lock:
+            if (self.owners.setdefault(port_name, owner) != owner):
+                return False
+            return True
+
+    def release(self, port_name, owner):
+        """
+        Release a port, if it is claimed by the given owner.
+        """
+        with self.lock:
+            if (self.owners.get(port_name) == owner):
+                del self.owners[port_name]
+
+    def in_use(self, owner=None):
+        """
+        Return the set of the claimed ports, excluding the ones of the given owner.
+        """
+        with self.lock:
+            return {port_name for port_name, port_owner in self.owners.items() if port_owner != owner}
+
+
+port_registry = PortRegistry()
+"""
+The `PortRegistry` of the ports held by the boards of this process.
+"""
+
+
+def list_candidate_ports():
+    """
+    Return the names of the ports on which a device could be connected.
+    """
+    port_names = [port.device for port in list_ports.comports()]
+    if (platform == 'darwin'):
+        port_names = [port_name for port_name in port_names if 'MIP' in port_name]
+    return port_names
+
+
+def probe_mip_port(port_name, baudrate=115200, cancel_event=None):
+    """
+    Check if a MIP device is connected to a port.
+
+    This function sends the connection request command on the
+    port and checks whether the device answers to it.
+
+    Args:
+        - port_name: name of the port to be checked
+        - baudrate: baudrate of the port
+        - cancel_event: optional `threading.Event` that aborts the probe when set
+
+    Returns:
+        - True if the device answered on the port before the timeout
+    """
+    logger.debug('Checking: {}'.format(port_name))
+    if ( (platform == 'darwin') and (not 'MIP' in port_name)):
+        return False
+    try:
+        port = serial.Serial(port=port_name, baudrate=baudrate, timeout=PROBE_READ_TIMEOUT, exclusive=True)
+        try:
+            if (not port.is_open):
+                return False
+            port.write(CONN_REQUEST_CMD.encode('utf-8'))
+            found = wait_for_reply(port, CONN_REPLY, PROBE_REPLY_TIMEOUT, cancel_event)
+        finally:
+            port.close()
+        if (found):
+            logger.debug('Device found on port: {}'.format(port_name))
+            return True
+    except (serial.SerialException, OSError):
+        return False
+    except ValueError:
+        return False
+    return False
+
+
+def wait_for_reply(port, reply, timeout, cancel_event=None):
+    """
+    Read from a port until an expected reply is received.
+
+    The function returns as soon as the reply is found among the
+    received bytes, so it only waits as long as the device takes
+    to answer. Bytes received before the reply, such as data
+    packets of a streaming device, are discarded. The timeout is
+    checked after every read, so it may be exceeded by up to the
+    read timeout of the port.
+
+    Args:
+        - port: the open `serial.Serial` object to be read
+        - reply: the expected reply, as a string or bytes
+        - timeout: maximum waiting time, in seconds
+        - cancel_event: optional `threading.Event` that aborts the wait when set
+
+    Returns:
+        - True if the reply was received before the timeout
+    """
+    if (isinstance(reply, str)):
+        reply = reply.encode('utf-8')
+    end_time = time.monotonic() + timeout
+    received = bytearray()
+    while (time.monotonic() < end_time):
+        if (cancel_event is not None and cancel_event.is_set()):
+            return False
+        received += port.read(port.in_waiting or 1)
+        if (reply in received):
+            return True
+        # Keep only the bytes that could be the start of the reply
+        del received[:-len(reply)]
+    return False
+
+
+def find_mip_ports(port_names=None, baudrate=115200, first_only=True,
+                    deadline=PROBE_DEADLINE, max_workers=MAX_PROBE_WORKERS, exclude=()):
+    """
+    Probe several ports in parallel looking for MIP devices.
+
+    Args:
+        - port_names: names of the ports to be probed, all the candidate ports if None
+        - exclude: names of the ports that must not be probed, such as the ports in use
+        - baudrate: baudrate of the ports
+        - first_only: if True, stop at the first port that answers and cancel the other probes
+        - deadline: maximum time, in seconds, given to each probe
+        - max_workers: maximum number of ports probed at the same time
+
+    Returns:
+        - list of the names of the ports that answered, in order of answer
+    """
+    if (port_names is None):
+        port_names = list_candidate_ports()
+    port_names = [port_name for port_name in port_names if port_name not in exclude]
+    if (len(port_names) == 0):
+        return []
+    start_time = time.monotonic()
+    cancel_event = threading.Event()
+    found_ports = []
+    n_workers = min(max_workers, len(port_names))
+    executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='mip-probe')
+    try:
+        futures = {executor.submit(probe_mip_port, port_name, baudrate, cancel_event): port_name
+                    for port_name in port_names}
+        # Probes wait for their turn in the pool, so the overall deadline
+        # grows with the number of rounds of workers
+        n_rounds = -(-len(port_names) // n_workers)
+        end_time = start_time + deadline * n_rounds
+        pending = set(futures)
+        while (len(pending) > 0):
+            remaining = end_time - time.monotonic()
+            if (remaining <= 0):
+                logger.debug(f'Probe deadline expired for: {[futures[future] for future in pending]}')
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if (not future.cancelled() and future.exception() is None and future.result()):
+                    found_ports.append(futures[future])
+            if (first_only and len(found_ports) > 0):
+                found_ports = found_ports[:1]
+                break
+    finally:
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    logger.debug(f'Probed {len(port_names)} ports in {time.monotonic() - start_time:.2f} s, '
+                 f'found: {found_ports}')
+    return found_ports
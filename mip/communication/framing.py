@@ -0,0 +1,385 @@
+"""
+Framing engine for the byte stream received from the MIP device.
+
+The device streams three kinds of fixed-length frames, each one
+starting with a header byte and terminated by a tail byte:
+
+    - voltage frames (header 0xA0): 2 bytes of battery voltage
+    - data frames (header 0xA1): CRC, packet counter, temperature,
+      humidity, capdac, capacitance, current and aux bytes
+    - sample rate frames (header 0xA3): 3 bytes of configuration
+
+The `FrameScanner` accumulates all the bytes read from the port in
+a single reusable buffer, finds the complete frames in it and decodes
+each of them with a single precompiled `struct.Struct`. Incomplete
+frames at the end of the buffer are kept and completed by the
+next chunk of bytes.
+
+The CRC byte of each data frame is checked with a table-driven CRC-8
+over the bytes that follow it, up to the tail byte. What happens to
+frames that fail the check is decided by the CRC policy of the scanner.
+
+This module does not depend on Kivy, so that it can be used by
+scripts and benchmarks as well.
+"""
+import struct
+from loguru import logger
+
+"""!
+@brief Voltage packet header byte.
+"""
+VOLTAGE_PACKET_HEADER = 0xA0
+
+"""!
+@brief Voltage packet tail byte.
+"""
+VOLTAGE_PACKET_TAIL = 0xC0
+
+"""!
+@brief Data packet header byte.
+"""
+DATA_PACKET_HEADER = 0xA1
+
+"""!
+@brief Data packet tail byte.
+"""
+DATA_PACKET_TAIL = 0xC0
+
+"""!
+@brief Sample rate packet header byte.
+"""
+SAMPLE_RATE_PACKET_HEADER = 0xA3
+
+"""!
+@brief Sample rate packet tail byte.
+"""
+SAMPLE_RATE_PACKET_TAIL = 0xC3
+
+VOLTAGE_FRAME = struct.Struct('>B2sB')
+"""
+Voltage frame layout: header, 2 bytes of battery voltage, tail.
+"""
+
+DATA_FRAME = struct.Struct('>BBB2B2B4B12B2B2BB')
+"""
+Data frame layout: header, CRC, packet counter, 2 bytes of temperature,
+2 bytes of humidity, 4 capdac bytes, 4 x 3 bytes of capacitance,
+2 bytes of current, 2 aux bytes, tail. Every byte is unpacked on its
+own, so that slices of the unpacked tuple can be passed directly
+to the conversion functions.
+"""
+
+SAMPLE_RATE_FRAME = struct.Struct('>B3sB')
+"""
+Sample rate frame layout: header, 3 bytes of configuration, tail.
+"""
+
+FRAME_LAYOUTS = {
+    VOLTAGE_PACKET_HEADER: (VOLTAGE_FRAME, VOLTAGE_PACKET_TAIL),
+    DATA_PACKET_HEADER: (DATA_FRAME, DATA_PACKET_TAIL),
+    SAMPLE_RATE_PACKET_HEADER: (SAMPLE_RATE_FRAME, SAMPLE_RATE_PACKET_TAIL),
+}
+"""
+Frame struct and expected tail byte for each header byte.
+"""
+
+DATA_FRAME_LEN = DATA_FRAME.size
+"""
+Total length of a data frame, in bytes.
+"""
+
+# Offsets of the fields in the tuple unpacked from a data frame
+DATA_CRC_IDX = 1
+DATA_COUNTER_IDX = 2
+DATA_TEMPERATURE_SLICE = slice(3, 5)
+DATA_HUMIDITY_SLICE = slice(5, 7)
+DATA_CAPDAC_SLICE = slice(7, 11)
+DATA_CAPACITANCE_SLICES = (slice(11, 14), slice(14, 17), slice(17, 20), slice(20, 23))
+DATA_CURRENT_SLICE = slice(23, 25)
+DATA_AUX_SLICE = slice(25, 27)
+
+CRC8_POLYNOMIAL = 0x07
+"""
+Polynomial of the CRC-8 computed by the firmware on data frames.
+"""
+
+CRC8_INIT = 0x00
+"""
+Initial value of the CRC-8 computed by the firmware on data frames.
+"""
+
+DATA_CRC_START = DATA_COUNTER_IDX
+"""
+Offset of the first data frame byte covered by the CRC.
+"""
+
+DATA_CRC_END = DATA_FRAME_LEN - 1
+"""
+Offset of the data frame byte following the last one covered by the CRC.
+"""
+
+CRC_POLICY_DROP = 'drop'
+"""
+Data frames with a wrong CRC are discarded.
+"""
+
+CRC_POLICY_FLAG = 'flag'
+"""
+Data frames with a wrong CRC are delivered, marked as invalid.
+"""
+
+CRC_POLICY_KEEP = 'keep'
+"""
+Data frames with a wrong CRC are delivered as valid ones. Errors are
+still counted.
+"""
+
+
+def make_crc8_table(polynomial):
+    """
+    Compute the lookup table of a CRC-8 with the given polynomial.
+
+    Args:
+        - polynomial: the CRC polynomial, without the leading x^8 term
+
+    Returns:
+        - bytes object with the CRC of each one-byte message
+    """
+    table = bytearray(256)
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if (crc & 0x80):
+                crc = ((crc << 1) ^ polynomial) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table[byte] = crc
+    return bytes(table)
+
+
+CRC8_TABLE = make_crc8_table(CRC8_POLYNOMIAL)
+"""
+Precomputed CRC-8 lookup table.
+"""
+
+
+def crc8(data, start=0, end=None, crc=CRC8_INIT):
+    """
+    Compute the CRC-8 of a slice of a buffer using the lookup table.
+
+    Args:
+        - data: bytes-like object
+        - start: offset of the first byte
+        - end: offset of the byte following the last one
+        - crc: initial CRC value
+
+    Returns:
+        - the CRC value
+
+    Usage:
+    >>> hex(crc8(b'123456789'))
+    '0xf4'
+    """
+    table = CRC8_TABLE
+    for byte in data[start:end]:
+        crc = table[crc ^ byte]
+    return crc
+
+
+def build_data_frame(packet_counter, temperature_raw, humidity_raw, capdac, capacitance_raw,
+                     current_raw=0, aux_raw=0):
+    """
+    Build a data frame, with its CRC, as sent by the device.
+
+    Args:
+        - packet_counter: the 8-bit packet counter
+        - temperature_raw: 16-bit temperature word
+        - humidity_raw: 16-bit humidity word
+        - capdac: sequence of 4 capdac values
+        - capacitance_raw: sequence of 4 24-bit capacitance words
+        - current_raw: 16-bit current word
+        - aux_raw: 16-bit aux word
+
+    Returns:
+        - the bytes of the frame
+
+    Usage:
+    >>> frame = build_data_frame(7, 0x6666, 0x8000, [1, 2, 3, 4], [0, 0, 0, 0])
+    >>> len(frame), frame[0] == DATA_PACKET_HEADER, frame[1] == crc8(frame, DATA_CRC_START, DATA_CRC_END)
+    (28, True, True)
+    """
+    frame = bytearray(DATA_FRAME_LEN)
+    frame[0] = DATA_PACKET_HEADER
+    frame[DATA_COUNTER_IDX] = packet_counter & 0xFF
+    frame[DATA_TEMPERATURE_SLICE] = temperature_raw.to_bytes(2, 'big')
+    frame[DATA_HUMIDITY_SLICE] = humidity_raw.to_bytes(2, 'big')
+    frame[DATA_CAPDAC_SLICE] = bytes(capdac)
+    for cap_slice, value in zip(DATA_CAPACITANCE_SLICES, capacitance_raw):
+        frame[cap_slice] = value.to_bytes(3, 'big')
+    frame[DATA_CURRENT_SLICE] = current_raw.to_bytes(2, 'big')
+    frame[DATA_AUX_SLICE] = aux_raw.to_bytes(2, 'big')
+    frame[-1] = DATA_PACKET_TAIL
+    frame[DATA_CRC_IDX] = crc8(frame, DATA_CRC_START, DATA_CRC_END)
+    return bytes(frame)
+
+
+def build_voltage_frame(voltage_raw):
+    """
+    Build a voltage frame from the 16-bit battery voltage word.
+    """
+    return VOLTAGE_FRAME.pack(VOLTAGE_PACKET_HEADER, voltage_raw.to_bytes(2, 'big'), VOLTAGE_PACKET_TAIL)
+
+
+def build_sample_rate_frame(sample_rate_idx, temp_rh_sample_rate, temp_rh_repeatability):
+    """
+    Build a sample rate frame from the 3 configuration bytes.
+    """
+    return SAMPLE_RATE_FRAME.pack(SAMPLE_RATE_PACKET_HEADER,
+                                  bytes([sample_rate_idx, temp_rh_sample_rate, temp_rh_repeatability]),
+                                  SAMPLE_RATE_PACKET_TAIL)
+
+
+class FrameScanner():
+    """
+    Incremental scanner for the frames streamed by the device.
+
+    Bytes are appended to an internal buffer with `feed`, which returns
+    the list of complete frames found so far as `(header, fields, valid)`
+    tuples, where `fields` is the tuple unpacked with the frame struct and
+    `valid` tells whether the CRC check passed. Bytes that do not start a
+    known frame, and frames whose tail byte does not match the expected one,
+    are skipped until the next header byte.
+
+    The scanner keeps running counters of CRC errors, tail errors and
+    resyncs, i.e. the number of times it had to skip bytes to find
+    the start of the next frame.
+
+    Args:
+        - crc_policy: one of `CRC_POLICY_DROP`, `CRC_POLICY_FLAG`
+          and `CRC_POLICY_KEEP`
+
+    Usage:
+    >>> scanner = FrameScanner()
+    >>> scanner.feed(bytes([0xA0, 0x01, 0x90, 0xC0, 0xA3]))
+    [(160, (160, b'\\x01\\x90', 192), True)]
+    >>> scanner.pending()
+    1
+    """
+
+    def __init__(self, crc_policy=CRC_POLICY_FLAG):
+        self.buffer = bytearray()
+        self.crc_policy = crc_policy
+        self.frames_decoded = 0
+        self.crc_errors = 0
+        self.tail_errors = 0
+        self.resyncs = 0
+
+    def feed(self, data):
+        """
+        Append bytes to the buffer and decode all the complete frames.
+
+        Args:
+            - data: bytes read from the port
+
+        Returns:
+            - list of `(header, fields, valid)` tuples, in order of arrival
+        """
+        buf = self.buffer
+        buf += data
+        frames = []
+        buf_len = len(buf)
+        pos = 0
+        while (pos < buf_len):
+            header = buf[pos]
+            layout = FRAME_LAYOUTS.get(header)
+            if (layout is None):
+                # Not a header byte, hunt for the next one
+                self.resyncs += 1
+                pos = self.find_next_header(buf, pos + 1)
+                continue
+            frame_struct, tail = layout
+            end = pos + frame_struct.size
+            if (end > buf_len):
+                # Partial frame, wait for more bytes
+                break
+            if (buf[end - 1] != tail):
+                self.on_tail_error(header)
+                self.resyncs += 1
+                pos = self.find_next_header(buf, pos + 1)
+                continue
+            valid = True
+            if (header == DATA_PACKET_HEADER):
+                crc = crc8(buf, pos + DATA_CRC_START, pos + DATA_CRC_END)
+                if (crc != buf[pos + DATA_CRC_IDX]):
+                    self.crc_errors += 1
+                    if (self.crc_policy == CRC_POLICY_DROP):
+                        pos = end
+                        continue
+                    valid = (self.crc_policy == CRC_POLICY_KEEP)
+            frames.append((header, frame_struct.unpack_from(buf, pos), valid))
+            pos = end
+        if (pos > 0):
+            del buf[:pos]
+        self.frames_decoded += len(frames)
+        return frames
+
+    def find_next_header(self, buf, start):
+        """
+        Find the position of the next header byte in the buffer.
+
+        Args:
+            - buf: the buffer to be searched
+            - start: the position from where to start the search
+
+        Returns:
+            - the position of the next header byte, or the buffer length
+              if no header byte is found
+        """
+        next_pos = len(buf)
+        for header in FRAME_LAYOUTS:
+            pos = buf.find(header, start, next_pos)
+            if (pos >= 0):
+                next_pos = pos
+        return next_pos
+
+    def on_tail_error(self, header):
+        """
+        Called when a frame does not end with the expected tail byte.
+
+        Args:
+            - header: the header byte of the discarded frame
+        """
+        self.tail_errors += 1
+        if (header == DATA_PACKET_HEADER):
+            logger.critical('Skipped one packet')
+
+    def pending(self):
+        """
+        Return the number of bytes waiting to be completed into a frame.
+        """
+        return len(self.buffer)
+
+    def bytes_needed(self, data=b''):
+        """
+        Return the number of bytes still missing to complete the first
+        frame of the buffer, followed by `data`, or 0 if it is complete
+        or does not start with a header byte.
+
+        Usage:
+        >>> FrameScanner().bytes_needed(bytes([DATA_PACKET_HEADER]))
+        27
+        """
+        n_bytes = len(self.buffer) + len(data)
+        if (n_bytes == 0):
+            return 0
+        header = self.buffer[0] if (len(self.buffer) > 0) else data[0]
+        layout = FRAME_LAYOUTS.get(header)
+        if (layout is None):
+            return 0
+        return max(layout[0].size - n_bytes, 0)
+
+    def reset(self):
+        """
+        Drop any partial frame held in the buffer.
+        """
+        self.buffer.clear()
@@ -0,0 +1,277 @@
+"""
+Optional latency instrumentation of the data path, from the bytes read
+from the port to the pixels of the plots and the rows of the exported file.
+
+When enabled, each batch of packets is timed at every stage it goes through:
+
+    - `STAGE_READ`: read of the bytes waiting on the port, by the reader
+      thread, from the arrival of the first byte in blocking read mode;
+      not measured with the asyncio transport
+    - `STAGE_DECODE`: conversion of the frames of a chunk into a batch,
+      in `mip.communication.mserial.MIPSerial.handle_frames`
+    - `STAGE_DISPATCH`: time from the port read to the start of the
+      delivery of the batch to a callback, see `mip.communication.subscribers`
+    - `STAGE_PLOT`: update of the plots, in `mip.widgets.graph_tabs.GraphManager.update_plots_batch`
+    - `STAGE_DRAW`: drawing of a line, in `mip.graph.LinePlot.draw`,
+      see `mip.widgets.graph_tabs.TimedLinePlot`
+    - `STAGE_WRITE`: write of a row, in `mip.export.csv_exporter.CSVExporter.write_packet`
+    - `STAGE_READ_TO_PLOT`, `STAGE_READ_TO_DISK`: time from the start of
+      the port read, as for `STAGE_READ`, to the end of the update of the
+      plots and of the write of the row
+
+Each stage keeps a rolling histogram of the last `LATENCY_WINDOW` seconds,
+from which the 50th, 95th and 99th percentiles and the maximum are
+computed. The statistics are logged every `LATENCY_LOG_INTERVAL` seconds
+and shown by the debug overlay of the GUI, see `mip.widgets.utils.LatencyOverlay`.
+
+The instrumentation is enabled by setting the `MIP_LATENCY` environment
+variable to 1, or by calling `enable`. When it is disabled, `monitor` is
+None and each instrumented stage only checks it, with no timing at all:
+
+>>> from mip.communication import latency
+>>> if (latency.monitor is not None):
+...     start = time.perf_counter_ns()
+>>> decode()
+>>> if (latency.monitor is not None):
+...     latency.monitor.record(latency.STAGE_DECODE, time.perf_counter_ns() - start)
+
+This module does not depend on Kivy.
+"""
+from collections import deque
+import os
+import threading
+import time
+
+from loguru import logger
+
+from mip.communication.rate import interval_bin, bin_interval
+
+LATENCY_ENV_VAR = 'MIP_LATENCY'
+"""
+Environment variable enabling the latency instrumentation when set to 1.
+"""
+
+STAGE_READ = 'read'
+STAGE_DECODE = 'decode'
+STAGE_DISPATCH = 'dispatch'
+STAGE_PLOT = 'plot'
+STAGE_DRAW = 'draw'
+STAGE_WRITE = 'write'
+STAGE_READ_TO_PLOT = 'read to plot'
+STAGE_READ_TO_DISK = 'read to disk'
+
+STAGES = (STAGE_READ, STAGE_DECODE, STAGE_DISPATCH, STAGE_PLOT, STAGE_DRAW, STAGE_WRITE,
+          STAGE_READ_TO_PLOT, STAGE_READ_TO_DISK)
+"""
+Instrumented stages, in the order of the data path.
+"""
+
+LATENCY_WINDOW = 10
+"""
+Duration, in seconds, of the window over which the statistics are computed.
+"""
+
+LATENCY_SLICES = 10
+"""
+Number of slices of the window. The oldest slice is dropped as a whole.
+"""
+
+LATENCY_LOG_INTERVAL = 10
+"""
+Time, in seconds, between two log messages with the latency statistics.
+"""
+
+
+class HistogramSlice():
+    """
+    Counts of the durations recorded during a slice of the window.
+    """
+
+    __slots__ = ('index', 'counts', 'count', 'max')
+
+    def __init__(self, index):
+        self.index = index
+        self.counts = {}
+        self.count = 0
+        self.max = 0
+
+
+class LatencyHistogram():
+    """
+    Rolling histogram of durations, with logarithmic bins.
+
+    Recording a duration costs a dictionary update: the window is
+    split in `LATENCY_SLICES` slices, each one with its own counts,
+    and the slices older than the window are dropped as a whole.
+    The bins are those of `mip.communication.rate.interval_bin`.
+
+    Args:
+        - window: duration of the window, in seconds
+
+    Usage:
+    >>> histogram = LatencyHistogram()
+    >>> for duration in range(1000, 101000, 1000):
+    ...     histogram.add(duration, now=0)
+    >>> stats = histogram.stats(now=0)
+    >>> stats['count'], stats['p50'], stats['max']
+    (100, 4.9664e-05, 0.0001)
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.slice_duration = int(window * 1e9 / LATENCY_SLICES)
+        self.slices = deque(maxlen=LATENCY_SLICES)
+        self.lock = threading.Lock()
+
+    def add(self, duration, now=None):
+        """
+        Record a duration.
+
+        Args:
+            - duration: the duration, in nanoseconds
+            - now: current `time.monotonic_ns()`, if already available
+        """
+        if (now is None):
+            now = time.monotonic_ns()
+        index = now // self.slice_duration
+        bin_index = interval_bin(duration)
+        with self.lock:
+            slices = self.slices
+            if (len(slices) == 0 or slices[-1].index != index):
+                slices.append(HistogramSlice(index))
+            current = slices[-1]
+            current.counts[bin_index] = current.counts.get(bin_index, 0) + 1
+            current.count += 1
+            if (duration > current.max):
+                current.max = duration
+
+    def stats(self, now=None):
+        """
+        Return the statistics of the window ending at `now` as a
+        dictionary: number of durations, 50th, 95th and 99th
+        percentiles and maximum, in seconds.
+
+        Args:
+            - now: end of the window, `time.monotonic_ns()`
+        """
+        if (now is None):
+            now = time.monotonic_ns()
+        oldest = now // self.slice_duration - LATENCY_SLICES + 1
+        counts = {}
+        count = 0
+        maximum = 0
+        with self.lock:
+            for histogram_slice in self.slices:
+                if (histogram_slice.index < oldest):
+                    continue
+                for bin_index, bin_count in histogram_slice.counts.items():
+                    counts[bin_index] = counts.get(bin_index, 0) + bin_count
+                count += histogram_slice.count
+                maximum = max(maximum, histogram_slice.max)
+        stats = {'count': count, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': maximum / 1e9}
+        if (count == 0):
+            return stats
+        bins = sorted(counts.items())
+        for key, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            target = fraction * count
+            cumulative = 0
+            for bin_index, bin_count in bins:
+                cumulative += bin_count
+                if (cumulative >= target):
+                    # The bin center may exceed the largest duration recorded
+                    stats[key] = min(bin_interval(bin_index), maximum) / 1e9
+                    break
+        return stats
+
+
+class LatencyMonitor():
+    """
+    Rolling latency histograms of all the stages of the data path.
+
+    Args:
+        - window: duration of the window of the histograms, in seconds
+        - log_interval: time, in seconds, between two log messages, never if None
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, log_interval=LATENCY_LOG_INTERVAL):
+        self.histograms = {stage: LatencyHistogram(window) for stage in STAGES}
+        self.log_interval = log_interval
+        self.next_log = time.monotonic_ns() + int(log_interval * 1e9) if (log_interval is not None) else None
+
+    def record(self, stage, duration):
+        """
+        Record the duration of a stage, logging the statistics if due.
+
+        Args:
+            - stage: one of `STAGES`
+            - duration: the duration, in nanoseconds
+        """
+        now = time.monotonic_ns()
+        self.histograms[stage].add(duration, now)
+        if (self.next_log is not None and now >= self.next_log):
+            self.next_log = now + int(self.log_interval * 1e9)
+            self.log_stats(now)
+
+    def record_since(self, stage, timestamp):
+        """
+        Record the time elapsed since a `time.monotonic_ns()` timestamp,
+        usually the time at which a chunk of bytes was read from the port.
+        """
+        self.record(stage, time.monotonic_ns() - timestamp)
+
+    def stats(self, now=None):
+        """
+        Return the statistics of each stage, see `LatencyHistogram.stats`.
+        """
+        if (now is None):
+            now = time.monotonic_ns()
+        return {stage: histogram.stats(now) for stage, histogram in self.histograms.items()}
+
+    def format_stats(self, now=None):
+        """
+        Return the statistics of the stages with recorded durations,
+        one line per stage, in milliseconds.
+        """
+        lines = [f"{'stage':<13}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'n':>8}"]
+        for stage, stats in self.stats(now).items():
+            if (stats['count'] == 0):
+                continue
+            lines.append(f"{stage:<13}" + ''.join(f'{1000 * stats[key]:8.2f}' for key in ('p50', 'p95', 'p99', 'max'))
+                         + f"{stats['count']:8d}")
+        return '\n'.join(lines)
+
+    def log_stats(self, now=None):
+        """
+        Log the statistics of the stages with recorded durations.
+        """
+        stages = [f"{stage} {1000 * stats['p50']:.2f}/{1000 * stats['p95']:.2f}/"
+                  f"{1000 * stats['p99']:.2f}/{1000 * stats['max']:.2f}"
+                  for stage, stats in self.stats(now).items() if (stats['count'] > 0)]
+        if (len(stages) > 0):
+            logger.debug(f"Latency p50/p95/p99/max (ms): {', '.join(stages)}")
+
+
+monitor = LatencyMonitor() if (os.environ.get(LATENCY_ENV_VAR) == '1') else None
+"""
+The `LatencyMonitor` of the application, None when the instrumentation is disabled.
+"""
+
+
+def enable():
+    """
+    Enable the latency instrumentation, if not enabled yet.
+
+    Returns:
+        - the `LatencyMonitor`
+    """
+    global monitor
+    if (monitor is None):
+        monitor = LatencyMonitor()
+    return monitor
+
+
+def disable():
+    """
+    Disable the latency instrumentation, dropping the statistics.
+    """
+    global monitor
+    monitor = None
@@ -0,0 +1,85 @@
+"""
+Observable properties, without Kivy.
+
+The classes shared by the GUI and the headless acquisition, such as
+`mip.communication.board.MIPSerialBase` and
+`mip.export.exporter.CSVExporterBase`, notify the changes of their
+state through properties. In the GUI their subclasses declare Kivy
+properties with the same names, and the widgets bind to them as to any
+Kivy property. Without Kivy, the properties are `ObservableProperty`
+objects, with the same binding interface as the Kivy properties:
+
+>>> class Board(Observable):
+...     connected = ObservableProperty(0)
+>>> board = Board()
+>>> board.bind(connected=lambda instance, value: print(f'connected: {value}'))
+>>> board.connected = 2
+connected: 2
+>>> board.connected = 2
+
+As with Kivy properties, the callbacks are called, in the thread that
+sets the property, only when its value changes.
+
+This module does not depend on Kivy.
+"""
+
+
+class ObservableProperty():
+    """
+    Property of an `Observable`, calling the bound callbacks when its value changes.
+
+    Args:
+        - defaultvalue: the value of the property until it is first set
+    """
+
+    def __init__(self, defaultvalue=None):
+        self.defaultvalue = defaultvalue
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if (instance is None):
+            return self
+        return instance.__dict__.get(self.name, self.defaultvalue)
+
+    def __set__(self, instance, value):
+        previous = instance.__dict__.get(self.name, self.defaultvalue)
+        instance.__dict__[self.name] = value
+        if (previous != value):
+            for callback in list(instance.__dict__.get('_observers', {}).get(self.name, ())):
+                callback(instance, value)
+
+
+class Observable():
+    """
+    Base class of the objects with `ObservableProperty` properties,
+    implementing the binding interface of `kivy.event.EventDispatcher`.
+    """
+
+    def bind(self, **kwargs):
+        """
+        Bind callbacks to properties, e.g. `board.bind(connected=callback)`.
+        Each callback is called with the instance and the new value.
+        """
+        observers = self.__dict__.setdefault('_observers', {})
+        for name, callback in kwargs.items():
+            if (not isinstance(getattr(type(self), name, None), ObservableProperty)):
+                raise KeyError(f'{type(self).__name__!r} has no property {name!r}')
+            observers.setdefault(name, []).append(callback)
+
+    def unbind(self, **kwargs):
+        """
+        Unbind callbacks bound with `bind`.
+        """
+        observers = self.__dict__.get('_observers', {})
+        for name, callback in kwargs.items():
+            if (callback in observers.get(name, ())):
+                observers[name].remove(callback)
+
+    def setter(self, name):
+        """
+        Return a callback setting a property, to bind it to a property of another object.
+        """
+        return lambda instance, value: setattr(self, name, value)
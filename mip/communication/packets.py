@@ -0,0 +1,302 @@
+"""
+Data packets received from the MIP device.
+
+The data frames decoded from each chunk of bytes read from the port are
+stored in a `DataPacketBatch`: a single preallocated NumPy array with
+one typed column per value, `SAMPLE_DTYPE.itemsize` bytes per sample.
+Creating a batch costs a couple of allocations whatever the number of
+samples. Large batches are converted with a single vectorized call of
+`mip.communication.decoding.decode_data_fields`, small ones with the
+scalar conversion functions, which give exactly the same values and are
+faster for a handful of frames.
+
+Consumers that can work column by column subscribe to whole batches
+with `mip.communication.mserial.MIPSerial.add_batch_callback`. The single
+packet API of `DataPacket` is still available: a `DataPacket` is a view
+on one row of a batch, with no data of its own, created only when a
+consumer asks for it.
+
+Usage:
+>>> frame = bytes([0xA1, 0, 7, 0x66, 0x66, 0x80, 0, 1, 2, 3, 4] + [0] * 12 + [0] * 4 + [0xC0])
+>>> batch = DataPacketBatch.from_frames([frame, frame], sequence=[7, 8], timestamp=1_000_000)
+>>> len(batch), batch.capacitance[1].tolist()
+(2, [3.125, 6.25, 9.375, 12.5])
+>>> packet = batch[1]
+>>> packet.get_sequence(), packet.get_capacitance(3), packet.get_time()
+(8, 12.5, 1000000)
+
+This module does not depend on Kivy.
+"""
+import numpy as np
+
+from mip.communication import decoding
+from mip.communication.framing import (DATA_FRAME, DATA_COUNTER_IDX, DATA_TEMPERATURE_SLICE, DATA_HUMIDITY_SLICE,
+                                       DATA_CAPDAC_SLICE, DATA_CAPACITANCE_SLICES, DATA_CURRENT_SLICE,
+                                       DATA_AUX_SLICE)
+
+SAMPLE_DTYPE = np.dtype([
+    ('packet_counter', np.uint8),
+    ('crc_valid', np.bool_),
+    ('has_temp_data', np.bool_),
+    ('current', np.uint16),
+    ('aux', np.uint16),
+    ('missing_before', np.int32),
+    ('sequence', np.int64),
+    ('timestamp', np.int64),
+    ('device_time', np.int64),
+    ('temperature', np.float64),
+    ('humidity', np.float64),
+    ('capacitance', np.float64, (4,)),
+])
+"""
+Layout of a sample in a `DataPacketBatch`.
+"""
+
+VECTORIZED_DECODING_MIN_FRAMES = 16
+"""
+Minimum number of frames of a batch converted with the vectorized decoder.
+"""
+
+
+def broadcast(value, n_frames):
+    """
+    Return a per-frame sequence of values from a sequence or a single value.
+    """
+    if (isinstance(value, (list, tuple, np.ndarray))):
+        return value
+    return [value] * n_frames
+
+
+class DataPacketBatch():
+    """
+    Samples of N data packets, stored column by column in a preallocated typed array.
+
+    Each column of `SAMPLE_DTYPE` can be read as an attribute of the batch,
+    e.g. `batch.temperature`, and is a NumPy view on the samples:
+
+        - packet_counter: 8-bit packet counter sent by the board
+        - crc_valid: False for the packets that failed the CRC check
+        - has_temp_data: True for the packets carrying a new temperature and humidity sample
+        - current, aux: raw current and aux words
+        - missing_before: number of packets lost right before each packet
+        - sequence: unwrapped sequence number, see `mip.communication.sequence`
+        - timestamp: `time.monotonic_ns()` of the chunk holding each packet
+        - device_time: reconstructed sampling time, see `mip.communication.timing`,
+          meaningful only if `has_device_time` is True
+        - temperature, humidity: converted temperature and humidity values
+        - capacitance: converted capacitance values, shape (N, 4)
+
+    Args:
+        - size: number of samples of the batch
+    """
+
+    __slots__ = ('samples', 'has_device_time')
+
+    def __init__(self, size):
+        self.samples = np.zeros(size, dtype=SAMPLE_DTYPE)
+        self.has_device_time = False
+
+    @classmethod
+    def from_frames(cls, frames, crc_valid=True, sequence=None, missing_before=0,
+                    timestamp=0, device_time=None):
+        """
+        Build a batch from N data frames.
+
+        Args:
+            - frames: sequence of N tuples of fields unpacked by
+              `mip.communication.framing.FrameScanner`, or of N raw frames
+            - crc_valid: validity flag of each frame, or a single flag for all of them
+            - sequence: sequence number of each frame, the packet counter if None
+            - missing_before: number of packets lost before each frame, or a single number
+            - timestamp: read timestamp of each frame, or a single one for all of them
+            - device_time: reconstructed sampling time of each frame, or None
+
+        Returns:
+            - the new batch
+        """
+        n_frames = len(frames)
+        if (n_frames > 0 and isinstance(frames[0], (bytes, bytearray))):
+            frames = [DATA_FRAME.unpack(frame) for frame in frames]
+        if (n_frames < VECTORIZED_DECODING_MIN_FRAMES):
+            return cls.from_frames_scalar(frames, crc_valid, sequence, missing_before, timestamp, device_time)
+        decoded = decoding.decode_data_fields(frames)
+        batch = cls(n_frames)
+        samples = batch.samples
+        samples['packet_counter'] = decoded.packet_counter
+        samples['crc_valid'] = crc_valid
+        samples['has_temp_data'] = decoded.has_temp_data
+        samples['current'] = decoded.current
+        samples['aux'] = decoded.aux
+        samples['missing_before'] = missing_before
+        samples['sequence'] = decoded.packet_counter if (sequence is None) else sequence
+        samples['timestamp'] = timestamp
+        if (device_time is not None):
+            samples['device_time'] = device_time
+            batch.has_device_time = True
+        samples['temperature'] = decoded.temperature
+        samples['humidity'] = decoded.humidity
+        samples['capacitance'] = decoded.capacitance
+        return batch
+
+    @classmethod
+    def from_frames_scalar(cls, frames, crc_valid=True, sequence=None, missing_before=0,
+                           timestamp=0, device_time=None):
+        """
+        Build a batch from N data frames, converting one frame at a time.
+        See `from_frames`, which calls this function for small batches.
+        """
+        n_frames = len(frames)
+        crc_valid = broadcast(crc_valid, n_frames)
+        missing_before = broadcast(missing_before, n_frames)
+        timestamp = broadcast(timestamp, n_frames)
+        device_times = broadcast(0 if (device_time is None) else device_time, n_frames)
+        rows = []
+        for idx, fields in enumerate(frames):
+            temperature = decoding.convert_temperature(fields[DATA_TEMPERATURE_SLICE])
+            humidity = decoding.convert_humidity(fields[DATA_HUMIDITY_SLICE])
+            capdac = fields[DATA_CAPDAC_SLICE]
+            current = fields[DATA_CURRENT_SLICE]
+            aux = fields[DATA_AUX_SLICE]
+            rows.append((fields[DATA_COUNTER_IDX],
+                         crc_valid[idx],
+                         decoding.has_temperature_data(temperature, humidity),
+                         current[0] << 8 | current[1],
+                         aux[0] << 8 | aux[1],
+                         missing_before[idx],
+                         fields[DATA_COUNTER_IDX] if (sequence is None) else sequence[idx],
+                         timestamp[idx],
+                         device_times[idx],
+                         temperature,
+                         humidity,
+                         [decoding.convert_capacitance(fields[cap_slice], capdac[channel])
+                          for channel, cap_slice in enumerate(DATA_CAPACITANCE_SLICES)]))
+        batch = cls.__new__(cls)
+        batch.samples = np.array(rows, dtype=SAMPLE_DTYPE)
+        batch.has_device_time = device_time is not None
+        return batch
+
+    def __getattr__(self, name):
+        if (name in SAMPLE_DTYPE.names):
+            return self.samples[name]
+        raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+    @property
+    def nbytes(self):
+        """
+        Bytes taken by the samples of the batch.
+        """
+        return self.samples.nbytes
+
+    def get_times(self):
+        """
+        Return the best available time of each packet, see `DataPacket.get_time`.
+        """
+        return self.samples['device_time' if (self.has_device_time) else 'timestamp']
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        if (isinstance(index, slice)):
+            # A batch viewing a range of the samples
+            batch = DataPacketBatch.__new__(DataPacketBatch)
+            batch.samples = self.samples[index]
+            batch.has_device_time = self.has_device_time
+            return batch
+        size = len(self.samples)
+        if (index < 0):
+            index += size
+        if (index < 0 or index >= size):
+            raise IndexError('batch index out of range')
+        return DataPacket(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.samples)):
+            yield DataPacket(self, index)
+
+
+class DataPacket():
+    """Data packet holding data received from board.
+
+    The packet is a view on a row of a `DataPacketBatch`.
+
+    Args:
+        - batch: the batch holding the packet
+        - index: the row of the packet in the batch
+    """
+
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def get_packet_counter(self):
+        return int(self.batch.samples['packet_counter'][self.index])
+
+    def has_temperature_data(self):
+        return bool(self.batch.samples['has_temp_data'][self.index])
+
+    def has_valid_crc(self):
+        return bool(self.batch.samples['crc_valid'][self.index])
+
+    def get_sequence(self):
+        return int(self.batch.samples['sequence'][self.index])
+
+    def get_missing_before(self):
+        return int(self.batch.samples['missing_before'][self.index])
+
+    def get_timestamp(self):
+        """
+        Return the `time.monotonic_ns()` at which the packet was read from the port.
+        """
+        return int(self.batch.samples['timestamp'][self.index])
+
+    def get_device_time(self):
+        """
+        Return the reconstructed sampling time of the packet, in nanoseconds
+        of the host monotonic clock, or None if not reconstructed.
+        """
+        if (not self.batch.has_device_time):
+            return None
+        return int(self.batch.samples['device_time'][self.index])
+
+    def get_time(self):
+        """
+        Return the best available time of the packet, in nanoseconds of
+        the host monotonic clock: the device time if reconstructed,
+        the read timestamp otherwise.
+        """
+        batch = self.batch
+        if (batch.has_device_time):
+            return int(batch.samples['device_time'][self.index])
+        return int(batch.samples['timestamp'][self.index])
+
+    def get_temperature(self):
+        return float(self.batch.samples['temperature'][self.index])
+
+    def get_humidity(self):
+        return float(self.batch.samples['humidity'][self.index])
+
+    def get_capacitance(self, channel_number=None):
+        if (channel_number == None):
+            return self.get_capacitance_array()
+
+        if (channel_number < 0 or channel_number > 3):
+            return 0
+        else:
+            return float(self.batch.samples['capacitance'][self.index, channel_number])
+
+    def get_capacitance_array(self):
+        return self.batch.samples['capacitance'][self.index].tolist()
+
+    def get_current(self):
+        return int(self.batch.samples['current'][self.index])
+
+    def get_aux(self):
+        return int(self.batch.samples['aux'][self.index])
+
+    def __str__(self):
+        st = f"[{self.get_packet_counter()}] - {self.get_temperature():.2f} - "
+        st += f"{self.get_humidity():.2f} - {self.get_capacitance_array()}"
+        return st
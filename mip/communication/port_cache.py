@@ -0,0 +1,164 @@
+"""
+Persisted cache of the ports on which MIP boards were last found.
+
+Every time a board completes the connection handshake, the name of its
+port and the USB identity of the device behind it (VID, PID and serial
+number, when available) are stored in a small JSON file. On startup and
+on reconnection the cached ports are probed before falling back to a
+full scan, so that a board that did not move is found with a single
+probe. If the port name changed, as can happen to USB serial adapters
+plugged in a different order, the port is matched by its USB identity.
+
+This module does not depend on Kivy.
+"""
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import serial.tools.list_ports as list_ports
+from loguru import logger
+
+PORT_CACHE_FILE = 'port_cache.json'
+"""
+Name of the file holding the port cache, stored in the
+working directory next to `settings.json`.
+"""
+
+PORT_CACHE_MAX_ENTRIES = 8
+"""
+Maximum number of boards remembered by the cache.
+"""
+
+
+class PortCache():
+    """
+    Remember the ports of the last boards that answered.
+
+    Args:
+        - path: path of the JSON file holding the cache
+
+    Usage:
+    >>> cache = PortCache()
+    >>> cache.remember(board.port_name)
+    >>> port_names = cache.candidates()
+    """
+
+    def __init__(self, path=PORT_CACHE_FILE):
+        self.path = Path(path)
+
+    def load(self):
+        """
+        Read the cache from file.
+
+        Returns:
+            - list of cached entries, most recent first
+        """
+        if (not self.path.exists()):
+            return []
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)['ports']
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning(f'Ignoring invalid port cache {self.path}')
+            return []
+
+    def save(self, entries):
+        """
+        Write the cache to file, replacing the previous one in a single step.
+
+        Args:
+            - entries: list of cached entries, most recent first
+        """
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps({'ports': entries[:PORT_CACHE_MAX_ENTRIES]}, indent=4))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.warning(f'Could not write port cache {self.path}')
+
+    def remember(self, port_name):
+        """
+        Store a port as the most recent one on which a board answered.
+
+        Args:
+            - port_name: name of the port
+        """
+        entry = {'port_name': port_name, 'vid': None, 'pid': None, 'serial_number': None}
+        port_info = get_port_info(port_name)
+        if (port_info is not None):
+            entry['vid'] = port_info.vid
+            entry['pid'] = port_info.pid
+            entry['serial_number'] = port_info.serial_number
+        entry['last_seen'] = datetime.now().isoformat(timespec='seconds')
+        entries = [cached for cached in self.load() if not is_same_board(cached, entry)]
+        self.save([entry] + entries)
+
+    def candidates(self, exclude=()):
+        """
+        Return the ports that should be probed before a full scan.
+
+        A cached port is returned if it still exists and is not
+        taken by a different USB device. Otherwise, the port of a
+        device with the same USB identity is returned, if any.
+
+        Args:
+            - exclude: names of the ports that must not be returned
+
+        Returns:
+            - list of port names, most recent first
+        """
+        available_ports = {port.device: port for port in list_ports.comports()}
+        port_names = []
+        for entry in self.load():
+            port_name = entry.get('port_name')
+            port_info = available_ports.get(port_name)
+            if (port_info is not None and has_identity(entry) and not matches_identity(entry, port_info)):
+                # Another device took the port name
+                port_name = None
+            elif (port_info is None and not (port_name and os.path.exists(port_name))):
+                port_name = None
+            if (port_name is None and has_identity(entry)):
+                port_name = next((port.device for port in available_ports.values()
+                                    if matches_identity(entry, port)), None)
+            if (port_name is not None and port_name not in port_names and port_name not in exclude):
+                port_names.append(port_name)
+        return port_names
+
+
+def get_port_info(port_name):
+    """
+    Return the `ListPortInfo` of a port, or None if the port is not listed.
+    """
+    for port in list_ports.comports():
+        if (port.device == port_name):
+            return port
+    return None
+
+
+def has_identity(entry):
+    """
+    Return True if a cache entry holds the USB identity of the device.
+    """
+    return entry.get('vid') is not None and entry.get('pid') is not None
+
+
+def matches_identity(entry, port_info):
+    """
+    Return True if a listed port has the USB identity stored in a cache entry.
+    """
+    if (entry.get('vid') != port_info.vid or entry.get('pid') != port_info.pid):
+        return False
+    if (entry.get('serial_number') is not None):
+        return entry.get('serial_number') == port_info.serial_number
+    return True
+
+
+def is_same_board(first_entry, second_entry):
+    """
+    Return True if two cache entries refer to the same board.
+    """
+    if (has_identity(first_entry) and first_entry.get('serial_number') is not None):
+        return all(first_entry.get(key) == second_entry.get(key) for key in ('vid', 'pid', 'serial_number'))
+    return first_entry.get('port_name') == second_entry.get('port_name')
@@ -0,0 +1,205 @@
+"""
+`replay://` serial port for `serial.serial_for_url`.
+
+The port plays a capture file with a `mip.communication.replay.CapturePlayer`
+and answers the commands of `mip.communication.mserial.MIPSerial` the way
+the board would, so that a recorded session goes through discovery-free
+connection, decoding, dispatching, plotting and export unchanged:
+
+    - the connection request is answered with the connection reply
+    - the request of the sample rate configuration is answered with the
+      first sample rate frame of the capture, if any
+    - the start and stop streaming commands resume and pause the replay
+    - all the other commands are accepted and ignored
+
+URL format:
+
+    replay://<path of the capture>[?speed=<N|max>][&start=<seconds>]
+
+pyserial finds this module because `mip.communication` is added to
+`serial.protocol_handler_packages` when the package is imported.
+The port has no file descriptor, so it cannot be used with
+`mip.communication.mserial.READ_MODE_ASYNCIO`.
+
+This module does not depend on Kivy.
+"""
+import threading
+import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException, PortNotOpenError, to_bytes
+
+from mip.communication.commands import (CONN_REQUEST_CMD, CONN_REPLY, START_STREAMING_CMD, STOP_STREAMING_CMD,
+                                        RETRIEVE_SAMPLE_RATE_CMD, COMMAND_ARGUMENT_LENGTHS)
+from mip.communication.replay import CapturePlayer, REPLAY_SPEED_MAX
+
+REPLAY_SCHEME = 'replay'
+"""
+URL scheme of the replay ports.
+"""
+
+SKIPPED_BYTES = {ord(command): length + 1 for command, length in COMMAND_ARGUMENT_LENGTHS.items()}
+"""
+Number of bytes following each multi-byte command, latch byte included.
+These bytes are skipped, so that they are not taken for commands.
+"""
+
+
+def is_replay_port(port_name):
+    """
+    Return True if a port name is a `replay://` URL.
+    """
+    return port_name is not None and port_name.startswith(REPLAY_SCHEME + '://')
+
+
+class Serial(SerialBase):
+    """
+    Serial port replaying a capture file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.player = None
+        self.reply = bytearray()
+        self.skip_bytes = 0
+        self.sample_rate_frame = None
+        self.data_event = threading.Event()
+        self.lock = threading.Lock()
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        if (self.is_open):
+            raise SerialException('Port is already open.')
+        if (self._port is None):
+            raise SerialException('Port must be configured before it can be used.')
+        file_path, speed, start = self.from_url(self.port)
+        try:
+            self.player = CapturePlayer(file_path, speed)
+        except (OSError, ValueError) as exc:
+            raise SerialException(f'Could not open capture {file_path}: {exc}')
+        self.player.seek(start)
+        self.sample_rate_frame = self.player.first_sample_rate_frame()
+        self.is_open = True
+
+    def from_url(self, url):
+        """
+        Extract path, speed and start time from a `replay://` URL.
+        """
+        parts = urlparse.urlsplit(url)
+        if (parts.scheme != REPLAY_SCHEME):
+            raise SerialException(f'expected a string in the form "replay://<path>[?speed=<N|max>]'
+                                  f'[&start=<seconds>]": not starting with replay:// ({url!r})')
+        speed = 1
+        start = 0
+        try:
+            for option, values in urlparse.parse_qs(parts.query, True).items():
+                if (option == 'speed'):
+                    speed = REPLAY_SPEED_MAX if (values[0] == 'max') else float(values[0])
+                elif (option == 'start'):
+                    start = float(values[0])
+                else:
+                    raise ValueError(f'unknown option: {option!r}')
+        except ValueError as exc:
+            raise SerialException(f'invalid replay URL {url!r}: {exc}')
+        return urlparse.unquote(parts.netloc + parts.path), speed, start
+
+    def close(self):
+        if (self.is_open):
+            self.is_open = False
+            self.data_event.set()
+            self.player.log_stats()
+        super(Serial, self).close()
+
+    def _reconfigure_port(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    def _update_break_state(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        if (not self.is_open):
+            raise PortNotOpenError()
+        with self.lock:
+            return len(self.reply) + self.player.available()
+
+    def read(self, size=1):
+        """
+        Read up to `size` bytes, waiting up to the timeout of the port
+        for the next block of the capture to be due.
+        """
+        if (not self.is_open):
+            raise PortNotOpenError()
+        self.data_event.clear()
+        data = self.read_available(size)
+        if (len(data) > 0 or self._timeout == 0):
+            return data
+        wait_time = self.player.time_to_next_block()
+        if (self._timeout is not None and (wait_time is None or wait_time > self._timeout)):
+            wait_time = self._timeout
+        self.data_event.wait(wait_time)
+        if (not self.is_open):
+            return b''
+        return self.read_available(size)
+
+    def read_available(self, size):
+        with self.lock:
+            data = bytes(self.reply[:size])
+            del self.reply[:size]
+            if (len(data) < size):
+                data += self.player.read(size - len(data))
+        return data
+
+    def write(self, data):
+        """
+        Interpret the commands written to the port, as the board would.
+        """
+        if (not self.is_open):
+            raise PortNotOpenError()
+        data = to_bytes(data)
+        with self.lock:
+            for byte in data:
+                if (self.skip_bytes > 0):
+                    self.skip_bytes -= 1
+                elif (byte in SKIPPED_BYTES):
+                    self.skip_bytes = SKIPPED_BYTES[byte]
+                elif (byte == ord(CONN_REQUEST_CMD)):
+                    self.reply += CONN_REPLY.encode('utf-8')
+                elif (byte == ord(RETRIEVE_SAMPLE_RATE_CMD) and self.sample_rate_frame is not None):
+                    self.reply += self.sample_rate_frame
+                elif (byte == ord(START_STREAMING_CMD)):
+                    self.player.resume()
+                elif (byte == ord(STOP_STREAMING_CMD)):
+                    self.player.pause()
+        self.data_event.set()
+        return len(data)
+
+    def cancel_read(self):
+        self.data_event.set()
+
+    def reset_input_buffer(self):
+        if (not self.is_open):
+            raise PortNotOpenError()
+        with self.lock:
+            self.reply.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def seek(self, seconds):
+        """
+        Move the replay to a time from the start of the capture.
+        """
+        with self.lock:
+            self.player.seek(seconds)
+        self.data_event.set()
+
+    def replay_stats(self):
+        """
+        Return the replay statistics, see `mip.communication.replay.CapturePlayer.stats`.
+        """
+        return self.player.stats()
@@ -0,0 +1,200 @@
+"""
+Sliding-window estimate of the rate and regularity of a packet stream.
+
+The sample rates shown to the user used to be the number of packets
+received divided by the time since the first one: after a long session
+that figure barely moves, and it hides stalls and bursts. A
+`RateEstimator` looks instead at the packets that arrived during the
+last `RATE_WINDOW` seconds, and reports:
+
+    - the effective rate, in packets per second
+    - the median and 99th percentile of the inter-arrival times
+    - the burstiness of the arrivals, from -1 for a perfectly regular
+      stream, through 0 for random arrivals, to 1 for a very bursty one
+
+The packets read from the port at once share the same arrival time, so
+they are added together: the interval since the previous chunk is split
+evenly among them, rather than counted as one long interval followed by
+intervals of zero. Adding a chunk costs O(1): the inter-arrival times are
+kept in a histogram with logarithmic bins, updated as packets enter and leave the
+window, so that the statistics never need to sort the window. The
+percentiles are exact within the bin resolution, 1/`INTERVAL_BINS_PER_OCTAVE`
+of an octave.
+
+This module does not depend on Kivy.
+"""
+from collections import deque
+import math
+
+RATE_WINDOW = 10
+"""
+Duration, in seconds, of the window over which the statistics are computed.
+"""
+
+RATE_UPDATE_INTERVAL = 1
+"""
+Time, in seconds, between two updates of the displayed sample rates.
+"""
+
+INTERVAL_BINS_PER_OCTAVE = 32
+"""
+Number of histogram bins for each doubling of the inter-arrival time.
+"""
+
+INTERVAL_BINS = 64 * INTERVAL_BINS_PER_OCTAVE
+"""
+Number of histogram bins, enough for any interval in 64-bit nanoseconds.
+"""
+
+MANTISSA_BITS = INTERVAL_BINS_PER_OCTAVE.bit_length() - 1
+"""
+Number of bits of the interval, after the leading one, that select the bin within an octave.
+"""
+
+
+def interval_bin(interval):
+    """
+    Return the histogram bin of an inter-arrival time, in nanoseconds.
+    Intervals shorter than 2 * `INTERVAL_BINS_PER_OCTAVE` have a bin each.
+
+    Usage:
+    >>> [interval_bin(interval) for interval in (0, 63, 64, 65, 66, 10_000_000)]
+    [0, 63, 64, 64, 65, 614]
+    """
+    if (interval <= 0):
+        return 0
+    shift = max(interval.bit_length() - MANTISSA_BITS - 1, 0)
+    return shift * INTERVAL_BINS_PER_OCTAVE + (interval >> shift)
+
+
+def bin_interval(bin_index):
+    """
+    Return the inter-arrival time, in nanoseconds, at the center of a histogram bin.
+    """
+    if (bin_index < 2 * INTERVAL_BINS_PER_OCTAVE):
+        return bin_index
+    shift = bin_index // INTERVAL_BINS_PER_OCTAVE - 1
+    mantissa = bin_index % INTERVAL_BINS_PER_OCTAVE + INTERVAL_BINS_PER_OCTAVE
+    return (mantissa << shift) + (1 << shift) // 2
+
+
+class RateEstimator():
+    """
+    Rate, inter-arrival times and burstiness of a stream over a sliding window.
+
+    Args:
+        - window: duration of the window, in seconds
+
+    Usage:
+    >>> estimator = RateEstimator(window=1)
+    >>> for idx in range(200):
+    ...     estimator.add(idx * 10_000_000)
+    >>> stats = estimator.stats(2_000_000_000)
+    >>> stats['rate'], round(stats['interval_p50'], 3), stats['burstiness']
+    (100.0, 0.01, -1.0)
+    >>> estimator.reset()
+    >>> for idx in range(40):
+    ...     estimator.add(idx * 50_000_000, count=5)
+    >>> stats = estimator.stats(2_000_000_000)
+    >>> stats['rate'], round(stats['interval_p50'], 3), stats['burstiness']
+    (100.0, 0.01, -1.0)
+    """
+
+    def __init__(self, window=RATE_WINDOW):
+        self.window = int(window * 1e9)
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all the arrivals, e.g. when streaming starts again.
+        """
+        self.arrivals = deque()
+        self.histogram = [0] * INTERVAL_BINS
+        self.start_time = None
+        self.last_time = None
+        self.n_packets = 0
+        self.n_intervals = 0
+        self.interval_sum = 0
+        self.interval_squares = 0
+
+    def add(self, timestamp, count=1):
+        """
+        Account for packets arrived together.
+
+        Args:
+            - timestamp: arrival time of the packets, `time.monotonic_ns()`
+            - count: number of packets, each one taking an even share
+              of the interval since the previous arrival
+        """
+        if (count <= 0):
+            return
+        if (self.last_time is None):
+            self.start_time = timestamp
+            interval = None
+        else:
+            interval = (timestamp - self.last_time) // count
+            self.histogram[interval_bin(interval)] += count
+            self.n_intervals += count
+            self.interval_sum += interval * count
+            self.interval_squares += interval * interval * count
+        self.last_time = timestamp
+        self.n_packets += count
+        self.arrivals.append((timestamp, interval, count))
+        self.evict(timestamp)
+
+    def evict(self, now):
+        """
+        Remove the arrivals older than the window.
+        """
+        arrivals = self.arrivals
+        oldest = now - self.window
+        while (len(arrivals) > 0 and arrivals[0][0] < oldest):
+            _, interval, count = arrivals.popleft()
+            self.n_packets -= count
+            if (interval is not None):
+                self.histogram[interval_bin(interval)] -= count
+                self.n_intervals -= count
+                self.interval_sum -= interval * count
+                self.interval_squares -= interval * interval * count
+
+    def percentile(self, fraction):
+        """
+        Return the inter-arrival time, in nanoseconds, below which
+        the given fraction of the intervals in the window lie.
+        """
+        target = math.ceil(fraction * self.n_intervals)
+        count = 0
+        for bin_index, bin_count in enumerate(self.histogram):
+            count += bin_count
+            if (count >= target and count > 0):
+                return bin_interval(bin_index)
+        return 0
+
+    def stats(self, now):
+        """
+        Return the statistics of the window ending at `now` as a dictionary:
+        packets per second, median and 99th percentile of the inter-arrival
+        times in seconds, burstiness and number of packets in the window.
+
+        Args:
+            - now: end of the window, `time.monotonic_ns()`
+        """
+        self.evict(now)
+        stats = {'rate': 0.0, 'interval_p50': 0.0, 'interval_p99': 0.0, 'burstiness': 0.0,
+                 'packets': self.n_packets}
+        if (self.start_time is None):
+            return stats
+        elapsed = now - self.start_time
+        if (elapsed >= self.window):
+            stats['rate'] = self.n_packets * 1e9 / self.window
+        elif (elapsed > 0):
+            # The window is not full yet: count the packets after the first arrival
+            stats['rate'] = (self.n_packets - self.arrivals[0][2]) * 1e9 / elapsed
+        if (self.n_intervals > 0):
+            mean = self.interval_sum / self.n_intervals
+            deviation = math.sqrt(max(self.interval_squares / self.n_intervals - mean * mean, 0))
+            if (mean + deviation > 0):
+                stats['burstiness'] = (deviation - mean) / (deviation + mean)
+            stats['interval_p50'] = self.percentile(0.5) / 1e9
+            stats['interval_p99'] = self.percentile(0.99) / 1e9
+        return stats
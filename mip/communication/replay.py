@@ -0,0 +1,227 @@
+"""
+Replay of raw captures through the whole acquisition pipeline.
+
+A `CapturePlayer` releases the bytes of a capture file, written by
+`mip.communication.capture.CaptureWriter` or converted from an exported
+recording with `mip.utils.file_conversion.recording_to_capture`, with
+their original timing, N times faster, or as fast as possible.
+
+The player is used by the `replay://` serial port defined in
+`mip.communication.protocol_replay`, which plugs in wherever the
+port is opened with `serial.serial_for_url`, as in
+`mip.communication.mserial.MIPSerial.connect`:
+
+    replay://<path of the capture>[?speed=<N|max>][&start=<seconds>]
+
+Usage:
+>>> board = MIPSerial(discover=False)
+>>> board.port_name = 'replay://Data/20210304_101500.mipcap?speed=10'
+>>> board.connect()
+>>> board.start_streaming()
+
+This module does not depend on Kivy.
+"""
+import bisect
+import math
+import time
+
+from loguru import logger
+
+from mip.communication.capture import CaptureReader
+from mip.communication.framing import FrameScanner, SAMPLE_RATE_PACKET_HEADER, SAMPLE_RATE_FRAME
+
+REPLAY_SPEED_MAX = math.inf
+"""
+Replay speed releasing all the bytes as fast as they are read.
+"""
+
+
+class CapturePlayer():
+    """
+    Release the bytes of a capture file following its timestamps.
+
+    The whole capture is loaded in memory when the player is created,
+    so that seeking is immediate and reading never waits on the disk.
+    The player starts paused.
+
+    Args:
+        - file_path: path of the capture file
+        - speed: replay speed, 1 for the original timing, `REPLAY_SPEED_MAX` for no waits
+
+    Usage:
+    >>> player = CapturePlayer('session.mipcap', speed=10)
+    >>> player.seek(60)
+    >>> player.resume()
+    >>> data = player.read(4096)
+    """
+
+    def __init__(self, file_path, speed=1):
+        if (speed <= 0):
+            raise ValueError(f'Invalid replay speed {speed}')
+        self.reader = CaptureReader(file_path)
+        self.speed = speed
+        blocks = list(self.reader.blocks())
+        self.timestamps = [timestamp for timestamp, _ in blocks]
+        self.payloads = [payload for _, payload in blocks]
+        self.start_timestamp = self.timestamps[0] if (len(blocks) > 0) else 0
+        self.duration = (self.timestamps[-1] - self.start_timestamp) / 1e9 if (len(blocks) > 0) else 0
+        self.block_idx = 0
+        self.block_offset = 0
+        self.paused = True
+        self.position = 0
+        self.clock_start = 0
+        self.bytes_played = 0
+        self.play_time = 0
+        self.played_since = None
+        self.capture_played = 0
+        self.resume_position = 0
+        logger.debug(f'Loaded capture {file_path}: {len(blocks)} blocks, {self.duration:.1f} s')
+
+    def capture_time(self):
+        """
+        Return the position of the replay, in seconds from the start of the capture.
+        """
+        if (self.speed == REPLAY_SPEED_MAX):
+            if (self.finished()):
+                return self.duration
+            return (self.timestamps[self.block_idx] - self.start_timestamp) / 1e9
+        if (self.paused):
+            return self.position
+        return min(self.position + (time.monotonic() - self.clock_start) * self.speed, self.duration)
+
+    def seek(self, seconds):
+        """
+        Move the replay to a time from the start of the capture.
+
+        Args:
+            - seconds: time from the start of the capture
+        """
+        seconds = min(max(seconds, 0), self.duration)
+        if (not self.paused):
+            self.capture_played += self.capture_time() - self.resume_position
+            self.resume_position = seconds
+        target = self.start_timestamp + int(seconds * 1e9)
+        self.block_idx = bisect.bisect_left(self.timestamps, target)
+        self.block_offset = 0
+        self.position = seconds
+        self.clock_start = time.monotonic()
+        logger.debug(f'Replay moved to {seconds:.1f} s')
+
+    def pause(self):
+        """
+        Stop releasing bytes, keeping the current position.
+        """
+        if (not self.paused):
+            self.position = self.capture_time()
+            self.capture_played += self.position - self.resume_position
+            self.play_time += time.monotonic() - self.played_since
+            self.paused = True
+
+    def resume(self):
+        """
+        Start releasing bytes from the current position.
+        """
+        if (self.paused):
+            self.resume_position = self.capture_time()
+            self.clock_start = time.monotonic()
+            self.played_since = self.clock_start
+            self.paused = False
+
+    def finished(self):
+        """
+        Return True if all the bytes of the capture were released.
+        """
+        return self.block_idx >= len(self.payloads)
+
+    def due_blocks(self):
+        """
+        Return the index following the last block due at the current time.
+        """
+        if (self.paused):
+            return self.block_idx
+        if (self.speed == REPLAY_SPEED_MAX):
+            return len(self.payloads)
+        target = self.start_timestamp + int(self.capture_time() * 1e9)
+        return bisect.bisect_right(self.timestamps, target, lo=self.block_idx)
+
+    def available(self):
+        """
+        Return the number of bytes that can be read right away.
+        """
+        due = self.due_blocks()
+        if (due <= self.block_idx):
+            return 0
+        return sum(len(payload) for payload in self.payloads[self.block_idx:due]) - self.block_offset
+
+    def time_to_next_block(self):
+        """
+        Return the wall-clock time, in seconds, until the next block is due,
+        or None if the player is paused or finished.
+        """
+        if (self.paused or self.finished()):
+            return None
+        next_time = (self.timestamps[self.block_idx] - self.start_timestamp) / 1e9
+        return max(0, (next_time - self.capture_time()) / self.speed)
+
+    def read(self, size):
+        """
+        Read up to `size` of the bytes due at the current time, without waiting.
+
+        Args:
+            - size: maximum number of bytes to be returned
+
+        Returns:
+            - the bytes, possibly empty
+        """
+        due = self.due_blocks()
+        data = bytearray()
+        while (self.block_idx < due and len(data) < size):
+            payload = self.payloads[self.block_idx]
+            chunk = payload[self.block_offset:self.block_offset + size - len(data)]
+            data += chunk
+            self.block_offset += len(chunk)
+            if (self.block_offset >= len(payload)):
+                self.block_idx += 1
+                self.block_offset = 0
+        self.bytes_played += len(data)
+        return bytes(data)
+
+    def first_sample_rate_frame(self):
+        """
+        Return the first sample rate frame of the capture, or None if there is none.
+        """
+        scanner = FrameScanner()
+        for payload in self.payloads:
+            for header, fields, valid in scanner.feed(payload):
+                if (header == SAMPLE_RATE_PACKET_HEADER):
+                    return SAMPLE_RATE_FRAME.pack(*fields)
+        return None
+
+    def stats(self):
+        """
+        Return the replay statistics as a dictionary: bytes released,
+        time spent playing, current position in the capture, achieved
+        throughput and achieved speed, as capture time played per
+        second of replay.
+        """
+        play_time = self.play_time
+        capture_played = self.capture_played
+        if (not self.paused):
+            play_time += time.monotonic() - self.played_since
+            capture_played += self.capture_time() - self.resume_position
+        return {
+            'bytes_played': self.bytes_played,
+            'play_time': play_time,
+            'capture_time': self.capture_time(),
+            'bytes_per_second': self.bytes_played / play_time if (play_time > 0) else 0,
+            'speed': capture_played / play_time if (play_time > 0) else 0,
+        }
+
+    def log_stats(self):
+        """
+        Log the achieved replay throughput.
+        """
+        stats = self.stats()
+        logger.info(f"Replayed {stats['bytes_played']} bytes, up to {stats['capture_time']:.1f} s of capture "
+                    f"in {stats['play_time']:.1f} s: {stats['bytes_per_second'] / 1e3:.1f} kB/s, "
+                    f"{stats['speed']:.1f}x real time")
@@ -0,0 +1,181 @@
+"""
+Preallocated single-producer ring buffer for decoded samples.
+
+The serial reader thread is the only producer: it stores each batch of
+decoded samples in the next slot of the ring and then publishes the new write
+index, without taking any lock. Each consumer owns a `RingReader` with
+its own read index, so that consumers drain the ring at their own pace
+and never slow the producer down. A consumer that falls behind by more
+than the ring capacity loses the oldest batches, which are counted as
+overruns.
+
+The ring relies on the fact that, in CPython, storing an item in a list
+slot and rebinding an integer attribute are atomic operations.
+
+This module does not depend on Kivy.
+"""
+import threading
+
+RING_BUFFER_CAPACITY = 4096
+"""
+Default number of slots of the ring buffer. Each slot holds the
+samples decoded from a single read, so at 100 Hz the ring holds
+at least 40 seconds of samples.
+"""
+
+
+class RingBuffer():
+    """
+    Ring buffer with a single producer and any number of readers.
+
+    Args:
+        - capacity: number of slots of the ring
+
+    Usage:
+    >>> ring = RingBuffer(4)
+    >>> reader = ring.reader()
+    >>> ring.extend(range(6))
+    >>> reader.read()
+    [2, 3, 4, 5]
+    >>> reader.overruns, reader.high_water_mark
+    (2, 6)
+    """
+
+    def __init__(self, capacity=RING_BUFFER_CAPACITY):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.write_index = 0
+        self.reader_events = []
+
+    def append(self, item):
+        """
+        Store an item in the ring. Must be called only by the producer.
+
+        Args:
+            - item: the item to be stored
+        """
+        write_index = self.write_index
+        self.slots[write_index % self.capacity] = item
+        self.write_index = write_index + 1
+
+    def extend(self, items):
+        """
+        Store several items in the ring and notify the readers.
+        Must be called only by the producer.
+
+        Args:
+            - items: iterable of items to be stored
+        """
+        for item in items:
+            self.append(item)
+        self.notify()
+
+    def notify(self):
+        """
+        Wake up the readers waiting for new items.
+        """
+        for event in self.reader_events:
+            event.set()
+
+    def reader(self):
+        """
+        Create a new reader, starting from the current write position.
+
+        Returns:
+            - a `RingReader` for this ring
+        """
+        return RingReader(self)
+
+
+class RingReader():
+    """
+    Read position of a consumer in a `RingBuffer`, with its statistics.
+
+    Args:
+        - ring: the ring buffer to be read
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.read_index = ring.write_index
+        self.data_available = threading.Event()
+        ring.reader_events.append(self.data_available)
+        self.items_read = 0
+        self.overruns = 0
+        self.high_water_mark = 0
+
+    def lag(self):
+        """
+        Return the number of items written and not yet read.
+        """
+        return self.ring.write_index - self.read_index
+
+    def read(self, max_items=None):
+        """
+        Read the items written since the last read.
+
+        Args:
+            - max_items: maximum number of items to be returned
+
+        Returns:
+            - list of items, oldest first
+        """
+        ring = self.ring
+        capacity = ring.capacity
+        write_index = ring.write_index
+        lag = write_index - self.read_index
+        if (lag > self.high_water_mark):
+            self.high_water_mark = lag
+        if (lag > capacity):
+            # The producer went around the ring and overwrote unread items
+            self.overruns += lag - capacity
+            self.read_index = write_index - capacity
+        if (max_items is not None and write_index - self.read_index > max_items):
+            write_index = self.read_index + max_items
+        slots = ring.slots
+        items = [slots[idx % capacity] for idx in range(self.read_index, write_index)]
+        # Items may have been overwritten while they were being copied
+        overwritten = ring.write_index - capacity - self.read_index
+        if (overwritten > 0):
+            overwritten = min(overwritten, len(items))
+            self.overruns += overwritten
+            items = items[overwritten:]
+        self.read_index = write_index
+        self.items_read += len(items)
+        return items
+
+    def wait(self, timeout=None):
+        """
+        Wait until new items are available or the timeout expires.
+
+        Args:
+            - timeout: maximum waiting time, in seconds
+
+        Returns:
+            - True if new items are available
+        """
+        ring = self.ring
+        if (ring.write_index == self.read_index):
+            self.data_available.wait(timeout)
+        self.data_available.clear()
+        return ring.write_index != self.read_index
+
+    def close(self):
+        """
+        Detach the reader from the ring, which stops notifying it.
+        """
+        if (self.data_available in self.ring.reader_events):
+            self.ring.reader_events.remove(self.data_available)
+        self.data_available.set()
+
+    def stats(self):
+        """
+        Return the statistics of the reader as a dictionary.
+        """
+        return {
+            'capacity': self.ring.capacity,
+            'items_read': self.items_read,
+            'lag': self.lag(),
+            'high_water_mark': self.high_water_mark,
+            'overruns': self.overruns,
+        }
@@ -0,0 +1,286 @@
+"""
+Packet loss accounting based on the packet counter of data packets.
+
+Each data packet carries an 8-bit counter that wraps around every
+256 packets. The `SequenceTracker` unwraps it into a monotonically
+increasing sequence number and counts the packets that never
+arrived, so that consumers can place each sample at its correct
+position in time and fill the gaps left by the missing ones.
+
+This module does not depend on Kivy.
+"""
+from collections import deque
+import math
+import time
+
+import numpy as np
+
+COUNTER_MODULO = 256
+"""
+Number of distinct values of the packet counter.
+"""
+
+LOSS_RATE_WINDOW = 60
+"""
+Time window, in seconds, over which the packet loss rate is computed.
+"""
+
+GAP_FILL_NONE = 'none'
+"""
+Gaps left by missing packets are not filled.
+"""
+
+GAP_FILL_NAN = 'nan'
+"""
+Each missing packet is replaced by NaN values.
+"""
+
+GAP_FILL_INTERPOLATE = 'interpolate'
+"""
+Missing packets are replaced by values linearly interpolated
+between the packets received before and after the gap.
+"""
+
+
+class SequenceTracker():
+    """
+    Unwrap the 8-bit packet counter and keep packet loss statistics.
+
+    Usage:
+    >>> tracker = SequenceTracker()
+    >>> [tracker.update(counter) for counter in (254, 255, 0, 3)]
+    [(254, 0), (255, 0), (256, 0), (259, 2)]
+    >>> tracker.missing_packets, tracker.longest_gap
+    (2, 2)
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Reset sequence numbers and statistics, e.g. on a new streaming session.
+        """
+        self.sequence = -1
+        self.last_counter = None
+        self.received_packets = 0
+        self.missing_packets = 0
+        self.duplicate_packets = 0
+        self.longest_gap = 0
+        self.loss_events = deque()
+        self.window_missing = 0
+
+    def resync(self):
+        """
+        Forget the last packet counter, keeping sequence numbers and
+        statistics, e.g. when streaming resumes after the link was lost.
+        The next packet gets the sequence number following the last one,
+        since the number of packets lost in between cannot be known
+        from the 8-bit counter.
+        """
+        self.last_counter = None
+
+    def skip(self):
+        """
+        Account for a data packet whose counter cannot be trusted,
+        e.g. because its CRC check failed. The packet gets the next
+        expected sequence number and no packet is counted as missing,
+        so that a corrupted counter does not look like a lost burst.
+
+        Returns:
+            - the sequence number of the packet
+            - the number of packets missing right before this one, always 0
+
+        Usage:
+        >>> tracker = SequenceTracker()
+        >>> [tracker.update(counter) for counter in (10, 11)]
+        [(10, 0), (11, 0)]
+        >>> tracker.skip()
+        (12, 0)
+        >>> tracker.update(13), tracker.missing_packets
+        ((13, 0), 0)
+        """
+        if (self.sequence < 0):
+            return self.sequence, 0
+        self.sequence += 1
+        if (self.last_counter is not None):
+            self.last_counter = (self.last_counter + 1) % COUNTER_MODULO
+        self.received_packets += 1
+        return self.sequence, 0
+
+    def update(self, counter, now=None):
+        """
+        Account for a new data packet.
+
+        Args:
+            - counter: the 8-bit packet counter of the packet
+            - now: current monotonic time in seconds, if already available
+
+        Returns:
+            - the sequence number of the packet
+            - the number of packets missing right before this one
+        """
+        gap = 0
+        if (self.last_counter is None):
+            if (self.sequence < 0):
+                self.sequence = counter
+            else:
+                self.sequence += 1
+        else:
+            delta = (counter - self.last_counter) % COUNTER_MODULO
+            if (delta == 0):
+                # Same counter twice in a row: the packet was repeated
+                self.duplicate_packets += 1
+                delta = 1
+            gap = delta - 1
+            self.sequence += delta
+        self.last_counter = counter
+        self.received_packets += 1
+        if (gap > 0):
+            self.missing_packets += gap
+            if (gap > self.longest_gap):
+                self.longest_gap = gap
+            if (now is None):
+                now = time.monotonic()
+            self.loss_events.append((now, gap))
+            self.window_missing += gap
+        return self.sequence, gap
+
+    def loss_per_minute(self, now=None):
+        """
+        Return the number of packets lost during the last minute.
+
+        Args:
+            - now: current monotonic time in seconds, if already available
+        """
+        events = self.loss_events
+        if (len(events) > 0):
+            if (now is None):
+                now = time.monotonic()
+            while (len(events) > 0 and now - events[0][0] > LOSS_RATE_WINDOW):
+                self.window_missing -= events.popleft()[1]
+        return self.window_missing * 60 / LOSS_RATE_WINDOW
+
+    def loss_ratio(self):
+        """
+        Return the fraction of packets lost since the last reset.
+        """
+        total = self.received_packets + self.missing_packets
+        if (total == 0):
+            return 0.0
+        return self.missing_packets / total
+
+
+def gap_fill_values(previous, current, missing, mode):
+    """
+    Compute the values to be used in place of missing packets.
+
+    Args:
+        - previous: list of values of the last packet before the gap,
+          or None if there is no such packet
+        - current: list of values of the first packet after the gap
+        - missing: number of missing packets
+        - mode: one of `GAP_FILL_NONE`, `GAP_FILL_NAN` and `GAP_FILL_INTERPOLATE`
+
+    Returns:
+        - list of `missing` lists of values, empty if mode is `GAP_FILL_NONE`
+
+    Usage:
+    >>> gap_fill_values([0.0, 10.0], [3.0, 13.0], 2, GAP_FILL_INTERPOLATE)
+    [[1.0, 11.0], [2.0, 12.0]]
+    """
+    if (missing <= 0 or mode == GAP_FILL_NONE):
+        return []
+    if (mode == GAP_FILL_NAN):
+        return [[math.nan] * len(current) for _ in range(missing)]
+    if (previous is None):
+        return [list(current) for _ in range(missing)]
+    steps = [(curr - prev) / (missing + 1) for prev, curr in zip(previous, current)]
+    return [[prev + step * (idx + 1) for prev, step in zip(previous, steps)]
+            for idx in range(missing)]
+
+
+def gap_fill_arrays(previous, values, missing, mode):
+    """
+    Insert the values of the missing packets in a batch of packets,
+    column by column, as `gap_fill_values` does for a single gap.
+
+    Args:
+        - previous: array of the values of the last packet before the batch,
+          or None if there is no such packet
+        - values: array of shape (N, M) with the M values of N packets
+        - missing: array with the number of packets missing right before each packet
+        - mode: one of `GAP_FILL_NONE`, `GAP_FILL_NAN` and `GAP_FILL_INTERPOLATE`
+
+    Returns:
+        - array with the rows of the received packets, each one preceded by
+          the rows filled in place of the packets missing right before it
+        - array with the index of the received packet ending the gap of each row
+        - array with the number of sample periods between each row and the
+          received packet ending its gap, 0 for the rows of the received packets
+
+    Usage:
+    >>> filled, owner, back = gap_fill_arrays(np.array([0.0, 10.0]), np.array([[3.0, 13.0], [4.0, 14.0]]),
+    ...                                       np.array([2, 0]), GAP_FILL_INTERPOLATE)
+    >>> filled.tolist(), owner.tolist(), back.tolist()
+    ([[1.0, 11.0], [2.0, 12.0], [3.0, 13.0], [4.0, 14.0]], [0, 0, 0, 1], [2, 1, 0, 0])
+    """
+    n_packets = len(values)
+    missing = np.maximum(missing, 0)
+    if (mode == GAP_FILL_NONE or not missing.any()):
+        return values, np.arange(n_packets), np.zeros(n_packets, dtype=np.int64)
+    n_rows = missing + 1
+    owner = np.repeat(np.arange(n_packets), n_rows)
+    first_row = np.cumsum(n_rows) - n_rows
+    back = missing[owner] - (np.arange(len(owner)) - first_row[owner])
+    filled = values[owner]
+    gap_rows = back > 0
+    if (mode == GAP_FILL_NAN):
+        filled[gap_rows] = np.nan
+        return filled, owner, back
+    before = np.empty_like(values)
+    before[0] = values[0] if (previous is None) else previous
+    before[1:] = values[:-1]
+    before = before[owner[gap_rows]]
+    fraction = 1 - back[gap_rows] / n_rows[owner[gap_rows]]
+    filled[gap_rows] = before + (filled[gap_rows] - before) * fraction[:, np.newaxis]
+    return filled, owner, back
+
+
+class MissingPacket():
+    """
+    Placeholder for a data packet that was lost, with the same
+    getters of a received data packet. All its values are NaN.
+
+    Args:
+        - sequence: the sequence number of the lost packet
+    """
+    def __init__(self, sequence):
+        self.sequence = sequence
+
+    def get_packet_counter(self):
+        return self.sequence % COUNTER_MODULO
+
+    def get_sequence(self):
+        return self.sequence
+
+    def get_missing_before(self):
+        return 0
+
+    def has_temperature_data(self):
+        return False
+
+    def has_valid_crc(self):
+        return False
+
+    def get_temperature(self):
+        return math.nan
+
+    def get_humidity(self):
+        return math.nan
+
+    def get_capacitance_array(self):
+        return [math.nan] * 4
+
+    def get_time(self):
+        return None
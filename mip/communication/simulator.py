@@ -0,0 +1,329 @@
+"""
+Simulator of a MIP board on a pseudo-terminal.
+
+The `BoardSimulator` opens a pty and plays the board side of the protocol
+on its master end, so that `MIPSerial` can be connected to the slave end
+like to a real board, without any hardware:
+
+    - the connection request is answered with the connection reply
+    - the start and stop streaming commands start and stop data frames
+    - the sample rate commands change the rate of the data frames
+    - the request of the sample rate configuration is answered with
+      a sample rate frame
+    - the time, temperature and humidity settings and SD card custom
+      header commands are parsed together with their latch command
+    - a voltage frame is sent periodically, streaming or not
+
+Data frames carry consecutive packet counters, a sine wave of different
+frequency on each capacitance channel and slowly varying temperature
+and humidity, sampled at the configured temperature and humidity rate.
+The stream rate can be forced well above the rates of the real board,
+and frames can be dropped or corrupted at random to exercise packet loss
+and CRC handling.
+
+The pty is not listed among the serial ports, so discovery does not find
+it: pass its name with `MIP_PORT`, see `mip.communication.board_manager`.
+
+Linux/macOS only.
+
+Usage:
+>>> simulator = BoardSimulator(stream_rate=2000, drop_rate=0.001)
+>>> board = MIPSerial(discover=False)
+>>> board.port_name = simulator.port_name
+>>> board.connect()
+
+This module does not depend on Kivy.
+"""
+from datetime import datetime
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+from loguru import logger
+
+from mip.communication.commands import (CONN_REQUEST_CMD, CONN_REPLY, START_STREAMING_CMD, STOP_STREAMING_CMD,
+                                        RETRIEVE_SAMPLE_RATE_CMD, TIME_SET_CMD, TEMP_RH_SETTINGS_SET_CMD,
+                                        SD_CARD_CUSTOM_HEADER_SET_CMD, SAMPLE_RATES, SAMPLE_RATE_CMDS,
+                                        TEMP_RH_SAMPLE_RATES, TEMP_RH_CONFIG, COMMAND_ARGUMENT_LENGTHS,
+                                        COMMAND_LATCHES)
+from mip.communication.decoding import (encode_temperature, encode_humidity, encode_capacitance,
+                                        INVALID_TEMPERATURE)
+from mip.communication.framing import (build_data_frame, build_voltage_frame, build_sample_rate_frame,
+                                       DATA_FRAME_LEN)
+from mip.communication.sequence import COUNTER_MODULO
+
+SIMULATOR_TICK = 0.002
+"""
+Maximum time, in seconds, between two iterations of the simulator loop.
+"""
+
+SIMULATOR_VOLTAGE_INTERVAL = 1
+"""
+Time, in seconds, between two voltage frames.
+"""
+
+SIMULATOR_BATTERY_VOLTAGE = 4.1
+"""
+Battery voltage, in V, reported in the voltage frames.
+"""
+
+SIMULATOR_MAX_BACKLOG = 0.5
+"""
+Maximum time, in seconds, of data frames sent in a single burst after
+the simulator fell behind. Older frames are skipped, with their counters.
+"""
+
+SIMULATOR_CAPACITANCE_BASE = (10, 20, 30, 40)
+"""
+Mean value, in pF, of the capacitance of each channel.
+"""
+
+SIMULATOR_CAPACITANCE_AMPLITUDE = 2
+"""
+Amplitude, in pF, of the capacitance sine waves.
+"""
+
+SIMULATOR_CAPACITANCE_FREQUENCIES = (0.1, 0.25, 0.5, 1)
+"""
+Frequency, in Hz, of the sine wave of each capacitance channel.
+"""
+
+SIMULATOR_DEFAULT_TEMP_RH_CONFIG = TEMP_RH_CONFIG['1 Hz']['Med']
+"""
+Temperature and humidity configuration bytes at power up.
+"""
+
+
+def get_temp_rh_frequency(config):
+    """
+    Return the temperature and humidity sample rate, in Hz,
+    of the configuration bytes of the sensor, or None if unknown.
+    """
+    for sample_rate in TEMP_RH_SAMPLE_RATES:
+        if (config in TEMP_RH_CONFIG[sample_rate].values()):
+            return float(sample_rate.split(' ')[0])
+    return None
+
+
+class BoardSimulator():
+    """
+    Simulate a MIP board on the master end of a pseudo-terminal.
+
+    The simulator runs in its own thread from creation until `close`.
+
+    Args:
+        - sample_rate: initial sample rate, one of `SAMPLE_RATES`
+        - stream_rate: if not None, rate of the data frames in Hz,
+          overriding the sample rate set with the sample rate commands
+        - drop_rate: probability of a data frame not being sent
+        - corrupt_rate: probability of a data frame being sent with a wrong byte
+        - seed: seed of the random generator, for reproducible runs
+
+    Usage:
+    >>> simulator = BoardSimulator(stream_rate=5000, corrupt_rate=0.01)
+    >>> print(simulator.port_name)
+    >>> simulator.close()
+    """
+
+    def __init__(self, sample_rate='100 Hz', stream_rate=None, drop_rate=0, corrupt_rate=0, seed=None):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port_name = os.ttyname(self.slave)
+        self.sample_rate_idx = SAMPLE_RATES.index(sample_rate)
+        self.stream_rate = stream_rate
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.random = random.Random(seed)
+        self.temp_rh_config = list(SIMULATOR_DEFAULT_TEMP_RH_CONFIG)
+        self.board_time = None
+        self.custom_header = ''
+        self.streaming = False
+        self.stream_start = 0
+        self.frames_due = 0
+        self.sample_idx = 0
+        self.pending_command = None
+        self.pending_arguments = bytearray()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_corrupted = 0
+        self.frames_skipped = 0
+        self.overflow_bytes = 0
+        self.stop_requested = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='mip-simulator', daemon=True)
+        self.thread.start()
+        logger.info(f'Board simulator listening on {self.port_name}')
+
+    def get_frame_rate(self):
+        """
+        Return the current rate of the data frames, in Hz.
+        """
+        if (self.stream_rate is not None):
+            return self.stream_rate
+        return int(SAMPLE_RATES[self.sample_rate_idx].split(' ')[0])
+
+    def run(self):
+        """
+        Serve the commands and send the frames until the simulator is closed.
+        """
+        next_voltage_time = time.monotonic()
+        while (not self.stop_requested.is_set()):
+            try:
+                readable, _, _ = select.select([self.master], [], [], SIMULATOR_TICK)
+                if (len(readable) > 0):
+                    for byte in os.read(self.master, 1024):
+                        self.handle_byte(byte)
+                now = time.monotonic()
+                if (self.streaming):
+                    self.send_data_frames(now)
+                if (now >= next_voltage_time):
+                    self.send(build_voltage_frame(round(SIMULATOR_BATTERY_VOLTAGE * 100)))
+                    next_voltage_time = now + SIMULATOR_VOLTAGE_INTERVAL
+            except OSError:
+                # No process has the slave end open yet
+                time.sleep(SIMULATOR_TICK)
+
+    def handle_byte(self, byte):
+        """
+        Handle a byte received from the host, as the board firmware would.
+        """
+        char = chr(byte)
+        if (self.pending_command is not None):
+            if (len(self.pending_arguments) < COMMAND_ARGUMENT_LENGTHS[self.pending_command]):
+                self.pending_arguments.append(byte)
+                return
+            if (char == COMMAND_LATCHES[self.pending_command]):
+                self.apply_command(self.pending_command, bytes(self.pending_arguments))
+            else:
+                logger.warning(f'Simulator: missing latch of command {self.pending_command!r}')
+            self.pending_command = None
+            self.pending_arguments = bytearray()
+            return
+        if (char in COMMAND_ARGUMENT_LENGTHS):
+            self.pending_command = char
+        elif (char == CONN_REQUEST_CMD):
+            self.send(CONN_REPLY.encode('utf-8'))
+        elif (char == START_STREAMING_CMD):
+            self.start_stream()
+        elif (char == STOP_STREAMING_CMD):
+            self.streaming = False
+        elif (char == RETRIEVE_SAMPLE_RATE_CMD):
+            self.send(build_sample_rate_frame(self.sample_rate_idx, *self.temp_rh_config))
+        elif (char in SAMPLE_RATE_CMDS.values()):
+            self.sample_rate_idx = SAMPLE_RATES.index(
+                next(rate for rate, cmd in SAMPLE_RATE_CMDS.items() if cmd == char))
+            if (self.streaming):
+                self.start_stream()
+
+    def apply_command(self, command, arguments):
+        """
+        Apply a multi-byte command, once its latch was received.
+        """
+        if (command == TIME_SET_CMD):
+            self.board_time = datetime(arguments[0] << 8 | arguments[1], *arguments[2:])
+            logger.debug(f'Simulator: time set to {self.board_time}')
+        elif (command == TEMP_RH_SETTINGS_SET_CMD):
+            if (get_temp_rh_frequency(list(arguments)) is not None):
+                self.temp_rh_config = list(arguments)
+            else:
+                logger.warning(f'Simulator: invalid temperature and humidity settings {arguments.hex()}')
+        elif (command == SD_CARD_CUSTOM_HEADER_SET_CMD):
+            self.custom_header = arguments.decode('utf-8', errors='replace')
+
+    def start_stream(self):
+        """
+        Start sending data frames at the current rate.
+        """
+        self.streaming = True
+        self.stream_start = time.monotonic()
+        self.frames_due = 0
+
+    def send_data_frames(self, now):
+        """
+        Send, in a single write, all the data frames due at the current time.
+        """
+        frame_rate = self.get_frame_rate()
+        frames_due = int((now - self.stream_start) * frame_rate)
+        n_frames = frames_due - self.frames_due
+        if (n_frames <= 0):
+            return
+        self.frames_due = frames_due
+        max_frames = max(1, int(SIMULATOR_MAX_BACKLOG * frame_rate))
+        if (n_frames > max_frames):
+            self.frames_skipped += n_frames - max_frames
+            self.sample_idx += n_frames - max_frames
+            n_frames = max_frames
+        temp_rh_frequency = get_temp_rh_frequency(self.temp_rh_config) or 1
+        temp_rh_period = max(1, round(frame_rate / temp_rh_frequency))
+        buffer = bytearray()
+        for _ in range(n_frames):
+            sample_idx = self.sample_idx
+            self.sample_idx += 1
+            if (self.random.random() < self.drop_rate):
+                self.frames_dropped += 1
+                continue
+            frame = self.build_frame(sample_idx, sample_idx / frame_rate, sample_idx % temp_rh_period == 0)
+            if (self.random.random() < self.corrupt_rate):
+                frame = bytearray(frame)
+                frame[self.random.randrange(1, DATA_FRAME_LEN)] ^= self.random.randrange(1, 256)
+                self.frames_corrupted += 1
+            buffer += frame
+            self.frames_sent += 1
+        self.send(buffer)
+
+    def build_frame(self, sample_idx, t, has_temp_data):
+        """
+        Build the data frame of a sample of the synthetic waveforms.
+
+        Args:
+            - sample_idx: index of the sample since the power up
+            - t: time of the sample, in seconds
+            - has_temp_data: if True, the frame carries a temperature and humidity sample
+        """
+        temperature_raw = encode_temperature(INVALID_TEMPERATURE)
+        humidity_raw = 0
+        if (has_temp_data):
+            temperature_raw = encode_temperature(25 + 2 * math.sin(2 * math.pi * t / 60))
+            humidity_raw = encode_humidity(45 + 5 * math.sin(2 * math.pi * t / 90))
+        capdac, capacitance_raw = zip(*(
+            encode_capacitance(base + SIMULATOR_CAPACITANCE_AMPLITUDE * math.sin(2 * math.pi * frequency * t))
+            for base, frequency in zip(SIMULATOR_CAPACITANCE_BASE, SIMULATOR_CAPACITANCE_FREQUENCIES)))
+        return build_data_frame(sample_idx % COUNTER_MODULO, temperature_raw, humidity_raw,
+                                capdac, capacitance_raw)
+
+    def send(self, data):
+        """
+        Write bytes to the host. Bytes that do not fit in the pty
+        buffer, because the host is not reading, are dropped.
+        """
+        try:
+            written = os.write(self.master, data)
+        except BlockingIOError:
+            written = 0
+        self.overflow_bytes += len(data) - written
+
+    def stats(self):
+        """
+        Return the counters of the simulator as a dictionary.
+        """
+        return {
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'frames_corrupted': self.frames_corrupted,
+            'frames_skipped': self.frames_skipped,
+            'overflow_bytes': self.overflow_bytes,
+        }
+
+    def close(self):
+        """
+        Stop the simulator and close the pty.
+        """
+        self.stop_requested.set()
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+        logger.info(f'Board simulator closed: {self.stats()}')
@@ -0,0 +1,305 @@
+"""
+Isolated delivery of the received data to each consumer.
+
+Each consumer registered with `mip.communication.mserial.MIPSerial.add_callback`
+or `add_batch_callback` gets a `Subscriber`: its own reader of the packet
+ring buffer and its own worker thread, which calls the callback. A consumer
+that raises or stalls only delays itself: the serial reader never waits for
+consumers, and the other consumers keep receiving data at their own pace.
+
+The backlog of a subscriber is bounded, and what happens when it is full
+is decided by its backpressure policy:
+
+    - `POLICY_BLOCK`: every batch is delivered, in order. The backlog is
+      the whole ring buffer, so that the subscriber only loses data if
+      it falls more than `RING_BUFFER_CAPACITY` batches behind, since the
+      serial reader must never wait
+    - `POLICY_DROP_OLDEST`: beyond `max_queued` batches, the oldest ones
+      are dropped, so that the subscriber stays close to real time
+    - `POLICY_DROP_NEWEST`: beyond `max_queued` batches, the newest ones
+      are dropped, so that the subscriber sees contiguous data
+    - `POLICY_COALESCE`: only the latest batch is delivered, e.g. for
+      displays of the current value
+
+Each subscriber keeps timing statistics of its callback, see `Subscriber.stats`.
+
+Work that must follow the delivery of the batches received so far, e.g.
+closing the file written by the callback, is handed to the worker thread
+with `Subscriber.call_after_delivered`, so that the caller never waits
+for a slow callback.
+
+This module does not depend on Kivy.
+"""
+from collections import deque
+from concurrent.futures import Future
+import threading
+import time
+
+from loguru import logger
+
+from mip.communication import latency
+from mip.utils.profiling import profiled
+
+POLICY_BLOCK = 'block'
+"""
+Deliver every batch, with the whole ring buffer as backlog.
+"""
+
+POLICY_DROP_OLDEST = 'drop_oldest'
+"""
+Drop the oldest batches when the backlog is full.
+"""
+
+POLICY_DROP_NEWEST = 'drop_newest'
+"""
+Drop the newest batches when the backlog is full.
+"""
+
+POLICY_COALESCE = 'coalesce'
+"""
+Deliver only the latest batch.
+"""
+
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_COALESCE)
+"""
+Available backpressure policies.
+"""
+
+SUBSCRIBER_QUEUE_SIZE = 256
+"""
+Default maximum number of batches waiting for a subscriber
+with the drop policies.
+"""
+
+SUBSCRIBER_WAIT_TIMEOUT = 0.5
+"""
+Upper bound, in seconds, of the wait for new batches of a worker thread.
+"""
+
+SUBSCRIBER_DRAIN_TIMEOUT = 2
+"""
+Default maximum time, in seconds, to wait for a subscriber to deliver
+the batches already stored in the ring, see `Subscriber.call_after_delivered`.
+"""
+
+
+class Subscriber():
+    """
+    Deliver the batches stored in a ring buffer to a callback, in its own thread.
+
+    Args:
+        - ring: the `mip.communication.ring_buffer.RingBuffer` of the batches
+        - callback: function called with each batch, or with each packet
+        - per_packet: if True, call the callback with each `DataPacket` of the batches
+        - policy: one of `POLICIES`
+        - max_queued: maximum number of batches waiting, for the drop policies
+        - name: name of the subscriber, used in logs and thread names
+        - profile_thread: thread of `mip.utils.profiling.PROFILED_THREADS` whose
+          profiler, if enabled, profiles the worker thread, None for no profiling
+        - profile_name: name of the profile, see `mip.utils.profiling.ProfilingSession.profiled`
+
+    Raises:
+        - ValueError: if the policy is unknown
+
+    Usage:
+    >>> subscriber = Subscriber(board.packet_ring, plot.add_batch, policy=POLICY_DROP_OLDEST)
+    >>> subscriber.start()
+    >>> subscriber.stats()['calls_per_second']
+    98.7
+    """
+
+    def __init__(self, ring, callback, per_packet=False, policy=POLICY_BLOCK,
+                 max_queued=SUBSCRIBER_QUEUE_SIZE, name=None, profile_thread=None, profile_name=None):
+        if (policy not in POLICIES):
+            raise ValueError(f'Unknown backpressure policy {policy!r}, expected one of {POLICIES}')
+        self.callback = callback
+        self.per_packet = per_packet
+        self.policy = policy
+        self.max_queued = max(max_queued, 1)
+        self.name = name or getattr(callback, '__qualname__', repr(callback))
+        self.reader = ring.reader()
+        self.profile_thread = profile_thread
+        self.profile_name = profile_name
+        self.running = False
+        self.thread = None
+        self.delivered_index = self.reader.read_index
+        self.schedule_lock = threading.Lock()
+        self.scheduled_calls = deque()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats_start = time.monotonic()
+        self.calls = 0
+        self.handler_time = 0
+        self.max_handler_time = 0
+        self.errors = 0
+        self.dropped_batches = 0
+        self.dropped_packets = 0
+        self.overruns = self.reader.overruns
+
+    def start(self):
+        """
+        Start the worker thread.
+        """
+        self.running = True
+        target = self.run
+        if (self.profile_thread is not None):
+            target = profiled(self.profile_thread, target, self.profile_name)
+        self.thread = threading.Thread(target=target, name=f'subscriber {self.name}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the worker thread, once the callback in progress returns.
+        """
+        self.running = False
+        self.reader.close()
+
+    def call_after_delivered(self, function, *args):
+        """
+        Call a function from the worker thread once the batches stored
+        in the ring so far have been delivered, e.g. to close the file
+        written by the callback, without waiting for them. Functions
+        are called in the order in which they are passed. If the worker
+        thread is not running, the function is called right away.
+
+        Args:
+            - function: the function to be called
+            - args: the arguments of the function
+
+        Returns:
+            - `concurrent.futures.Future` resolved with the result of the function
+        """
+        future = Future()
+        with self.schedule_lock:
+            if (self.running):
+                self.scheduled_calls.append((self.reader.ring.write_index, function, args, future))
+                function = None
+        if (function is not None):
+            self.call(function, args, future)
+        else:
+            # Wake up the worker thread, even if no batch arrives
+            self.reader.data_available.set()
+        return future
+
+    def call(self, function, args, future):
+        """
+        Call a function passed to `call_after_delivered` and resolve its future.
+        """
+        try:
+            future.set_result(function(*args))
+        except Exception as exc:
+            logger.exception(f'Error in the call after the delivery to {self.name}')
+            future.set_exception(exc)
+
+    def run_scheduled_calls(self, delivered_index=None):
+        """
+        Call the functions waiting for the delivery of the batches
+        up to the given ring index, all of them if None.
+        """
+        scheduled_calls = self.scheduled_calls
+        while (True):
+            with self.schedule_lock:
+                if (len(scheduled_calls) == 0 or
+                        (delivered_index is not None and scheduled_calls[0][0] > delivered_index)):
+                    return
+                _, function, args, future = scheduled_calls.popleft()
+            self.call(function, args, future)
+
+    def run(self):
+        reader = self.reader
+        last_overruns = reader.overruns
+        while (self.running):
+            if (reader.wait(SUBSCRIBER_WAIT_TIMEOUT)):
+                batches = reader.read()
+                if (reader.overruns != last_overruns):
+                    logger.critical(f'Callback {self.name} too slow, {reader.overruns - last_overruns} batches lost')
+                    last_overruns = reader.overruns
+                for batch in self.apply_policy(batches):
+                    if (not self.running):
+                        break
+                    self.deliver(batch)
+                self.delivered_index = reader.read_index
+            self.run_scheduled_calls(self.delivered_index)
+        # Nothing more will be delivered
+        self.run_scheduled_calls()
+
+    def apply_policy(self, batches):
+        """
+        Return the batches to be delivered out of the backlog, counting the dropped ones.
+        """
+        if (self.policy == POLICY_BLOCK or len(batches) <= 1):
+            return batches
+        if (self.policy == POLICY_COALESCE):
+            kept, dropped = batches[-1:], batches[:-1]
+        elif (len(batches) <= self.max_queued):
+            return batches
+        elif (self.policy == POLICY_DROP_OLDEST):
+            kept, dropped = batches[-self.max_queued:], batches[:-self.max_queued]
+        else:
+            kept, dropped = batches[:self.max_queued], batches[self.max_queued:]
+        self.dropped_batches += len(dropped)
+        self.dropped_packets += sum(len(batch) for batch in dropped)
+        return kept
+
+    def deliver(self, batch):
+        """
+        Call the callback with a batch, or with each of its packets, timing each call.
+        """
+        callback = self.callback
+        monitor = latency.monitor
+        if (monitor is not None):
+            monitor.record_since(latency.STAGE_DISPATCH, int(batch.samples['timestamp'][0]))
+        items = batch if (self.per_packet) else (batch,)
+        for item in items:
+            start = time.perf_counter()
+            try:
+                callback(item)
+            except Exception:
+                self.errors += 1
+                logger.exception(f'Error in callback {self.name}')
+            elapsed = time.perf_counter() - start
+            self.calls += 1
+            self.handler_time += elapsed
+            if (elapsed > self.max_handler_time):
+                self.max_handler_time = elapsed
+
+    def stats(self):
+        """
+        Return the statistics since the last reset as a dictionary:
+        calls per second, mean and maximum time spent in the callback,
+        in seconds, errors raised by the callback, batches and packets
+        dropped by the policy or lost because the subscriber fell more
+        than the ring capacity behind, and batches waiting.
+        """
+        elapsed = time.monotonic() - self.stats_start
+        return {
+            'name': self.name,
+            'policy': self.policy,
+            'calls': self.calls,
+            'calls_per_second': self.calls / elapsed if (elapsed > 0) else 0,
+            'mean_handler_time': self.handler_time / self.calls if (self.calls > 0) else 0,
+            'max_handler_time': self.max_handler_time,
+            'errors': self.errors,
+            'dropped_batches': self.dropped_batches,
+            'dropped_packets': self.dropped_packets,
+            'overruns': self.reader.overruns - self.overruns,
+            'queued': self.reader.lag(),
+            'high_water_mark': self.reader.high_water_mark,
+        }
+
+    def log_stats(self):
+        """
+        Log the statistics of the subscriber and reset them.
+        """
+        stats = self.stats()
+        message = (f"Subscriber {stats['name']} ({stats['policy']}): {stats['calls_per_second']:.1f} calls/s, "
+                   f"handler mean {1000 * stats['mean_handler_time']:.2f} ms "
+                   f"max {1000 * stats['max_handler_time']:.2f} ms, {stats['errors']} errors, "
+                   f"{stats['dropped_batches']} batches ({stats['dropped_packets']} packets) dropped, "
+                   f"{stats['overruns']} overruns, high-water mark {stats['high_water_mark']} batches")
+        if (stats['dropped_batches'] > 0 or stats['overruns'] > 0 or stats['errors'] > 0):
+            logger.warning(message)
+        else:
+            logger.debug(message)
+        self.reset_stats()
@@ -0,0 +1,152 @@
+"""
+Timestamps of the samples received from a MIP board.
+
+Every chunk read from the port is stamped with `time.monotonic_ns()`
+at the start of the read, or when its first byte arrived in blocking
+read mode, and all the frames decoded from the chunk carry that host
+timestamp. Host timestamps are cheap and exact, but the
+frames of a chunk share the same one and they include the variable
+latency of the link.
+
+The `DeviceClock` reconstructs instead the time at which the board took
+each sample, on the host monotonic clock, from the sequence number of the
+packet and the configured sample rate. The offset of the device clock is
+the lower envelope of the host timestamps, i.e. the samples that reached
+the host with the least latency, and its drift with respect to the host
+clock is the slope of the lower envelope, measured over windows of
+`DEVICE_CLOCK_WINDOW` seconds from the first one. The estimate becomes
+more accurate the longer the stream runs; it is updated at the end of
+each window, so the device times may step by the latency jitter at those
+points.
+
+This module does not depend on Kivy.
+"""
+
+DEVICE_CLOCK_WINDOW = 10
+"""
+Duration, in seconds, of the windows over which the lower
+envelope of the host timestamps is measured.
+"""
+
+DEVICE_CLOCK_MAX_DRIFT = 0.01
+"""
+Maximum relative drift between the device and the host clocks.
+Larger estimates are treated as a wrong sample rate, and the
+clock is restarted.
+"""
+
+
+class DeviceClock():
+    """
+    Reconstruct the sampling times of the board from the packet sequence numbers.
+
+    Args:
+        - sample_rate: nominal sample rate of the data packets, in Hz
+
+    Usage:
+    >>> clock = DeviceClock(100)
+    >>> clock.timestamp(0, 1_000_000_000)
+    1000000000
+    >>> clock.timestamp(1, 1_030_000_000)
+    1010000000
+    """
+
+    def __init__(self, sample_rate=100):
+        self.sample_rate = sample_rate
+        self.reset()
+
+    def reset(self):
+        """
+        Restart the reconstruction from the next packet, e.g. after the
+        stream was restarted or the sequence numbers were resynchronized.
+        """
+        self.period = 1e9 / self.sample_rate if (self.sample_rate > 0) else 0
+        self.anchor_sequence = None
+        self.anchor_time = 0
+        self.window_length = int(DEVICE_CLOCK_WINDOW * self.sample_rate)
+        self.window_end = 0
+        self.window_min = None
+        self.window_min_sequence = 0
+        self.first_min = None
+        self.first_min_sequence = 0
+        self.offset = 0
+        self.drift = 0
+
+    def set_sample_rate(self, sample_rate):
+        """
+        Set the nominal sample rate, restarting the reconstruction if it changed.
+        """
+        if (sample_rate != self.sample_rate):
+            self.sample_rate = sample_rate
+            self.reset()
+
+    def timestamp(self, sequence, host_time):
+        """
+        Return the reconstructed device time of a packet.
+
+        Args:
+            - sequence: sequence number of the packet, see `mip.communication.sequence`
+            - host_time: `time.monotonic_ns()` of the chunk holding the packet
+
+        Returns:
+            - the device time, in nanoseconds of the host monotonic clock
+        """
+        if (self.period == 0):
+            return host_time
+        if (self.anchor_sequence is None):
+            self.anchor_sequence = sequence
+            self.anchor_time = host_time
+            self.window_end = sequence + self.window_length
+        elapsed = sequence - self.anchor_sequence
+        residual = host_time - self.anchor_time - elapsed * self.period
+        if (self.window_min is None or residual < self.window_min):
+            self.window_min = residual
+            self.window_min_sequence = sequence
+        if (self.first_min is None):
+            # First window: follow the lowest residual seen so far
+            self.offset = min(self.offset, residual)
+        if (sequence >= self.window_end):
+            self.close_window(sequence)
+            if (self.anchor_sequence is None):
+                return self.timestamp(sequence, host_time)
+        return int(self.anchor_time + elapsed * self.period + self.offset +
+                   self.drift * (sequence - self.first_min_sequence))
+
+    def predict(self, sequence, host_time):
+        """
+        Return the device time of a packet from the current estimates,
+        without updating them, e.g. for a packet whose CRC check failed.
+
+        Args:
+            - sequence: sequence number of the packet, see `mip.communication.sequence`
+            - host_time: `time.monotonic_ns()` of the chunk holding the packet,
+              returned if the reconstruction has not started yet
+
+        Returns:
+            - the device time, in nanoseconds of the host monotonic clock
+        """
+        if (self.period == 0 or self.anchor_sequence is None):
+            return host_time
+        elapsed = sequence - self.anchor_sequence
+        offset = self.offset
+        if (self.first_min is None):
+            offset = min(offset, host_time - self.anchor_time - elapsed * self.period)
+        return int(self.anchor_time + elapsed * self.period + offset +
+                   self.drift * (sequence - self.first_min_sequence))
+
+    def close_window(self, sequence):
+        """
+        Update the offset and drift estimates with the lowest residual of the window.
+        """
+        if (self.first_min is None):
+            self.first_min = self.window_min
+            self.first_min_sequence = self.window_min_sequence
+            self.offset = self.first_min
+        elif (self.window_min_sequence > self.first_min_sequence):
+            drift = (self.window_min - self.first_min) / (self.window_min_sequence - self.first_min_sequence)
+            if (abs(drift) > DEVICE_CLOCK_MAX_DRIFT * self.period):
+                self.reset()
+                return
+            self.drift = drift
+        self.window_min = None
+        self.window_end = sequence + self.window_length
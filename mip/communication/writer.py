@@ -0,0 +1,162 @@
+"""
+Serialized writes of the commands sent to the MIP board.
+
+Commands are requested from the GUI thread, from the reconnection thread
+and from the asyncio watchdog, while the reader thread reads from the
+same port. The `CommandWriter` owns all the writes to the port after the
+connection handshake: commands are queued, each one already built into a
+single buffer, and a dedicated thread writes them one at a time with a
+single call. Multi-byte commands never interleave, and the caller never
+waits on the port.
+
+The writer keeps the statistics of the queue depth, of the time spent
+by the commands in the queue and of the time taken by the writes.
+
+This module does not depend on Kivy.
+"""
+from collections import deque
+from concurrent.futures import Future
+import threading
+import time
+
+from loguru import logger
+
+
+class CommandWriter():
+    """
+    Write the commands queued by any thread to a port, from a dedicated thread.
+
+    Args:
+        - port: the open port, any object with a `write(bytes)` method
+        - name: name of the port, used in logs and in the thread name
+
+    Usage:
+    >>> writer = CommandWriter(port, 'COM3')
+    >>> future = writer.submit(b'b', 'start streaming')
+    >>> future.result()
+    0.00012
+    >>> writer.close()
+    """
+
+    def __init__(self, port, name=''):
+        self.port = port
+        self.name = name
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.reset_stats()
+        self.thread = threading.Thread(target=self.run, name=f'writer {name}', daemon=True)
+        self.thread.start()
+
+    def reset_stats(self):
+        self.stats_start = time.monotonic()
+        self.commands = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.queue_time = 0
+        self.max_queue_time = 0
+        self.write_time = 0
+        self.max_write_time = 0
+
+    def submit(self, command, description):
+        """
+        Queue a command to be written.
+
+        Args:
+            - command: the bytes of the command, in a single buffer
+            - description: description of the command, used in the log and error messages
+
+        Returns:
+            - `concurrent.futures.Future` resolved with the time, in seconds, taken by
+              the write, or failing with `ConnectionError` if the command could not be written
+        """
+        future = Future()
+        with self.condition:
+            if (not self.running):
+                future.set_exception(ConnectionError(f'Port closed. Cannot send {description}'))
+                return future
+            self.queue.append((bytes(command), description, future, time.perf_counter()))
+            if (len(self.queue) > self.max_depth):
+                self.max_depth = len(self.queue)
+            self.condition.notify()
+        return future
+
+    def depth(self):
+        """
+        Return the number of commands waiting to be written.
+        """
+        return len(self.queue)
+
+    def run(self):
+        while (True):
+            with self.condition:
+                while (self.running and len(self.queue) == 0):
+                    self.condition.wait()
+                if (not self.running):
+                    break
+                command, description, future, queued_time = self.queue.popleft()
+            start = time.perf_counter()
+            try:
+                self.port.write(command)
+            except Exception as exc:
+                self.errors += 1
+                logger.critical(f'Could not write {description} to board on {self.name}: {exc}')
+                future.set_exception(ConnectionError(f'Could not write {description} to board: {exc}'))
+                continue
+            end = time.perf_counter()
+            self.update_stats(len(command), start - queued_time, end - start)
+            future.set_result(end - start)
+
+    def update_stats(self, n_bytes, queue_time, write_time):
+        self.commands += 1
+        self.bytes_written += n_bytes
+        self.queue_time += queue_time
+        self.max_queue_time = max(self.max_queue_time, queue_time)
+        self.write_time += write_time
+        self.max_write_time = max(self.max_write_time, write_time)
+
+    def stats(self):
+        """
+        Return the statistics since the last reset as a dictionary: commands
+        and bytes written, failed writes, current and maximum queue depth,
+        mean and maximum time spent in the queue and in the write, in seconds.
+        """
+        commands = self.commands
+        return {
+            'commands': commands,
+            'bytes': self.bytes_written,
+            'errors': self.errors,
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'mean_queue_time': self.queue_time / commands if (commands > 0) else 0,
+            'max_queue_time': self.max_queue_time,
+            'mean_write_time': self.write_time / commands if (commands > 0) else 0,
+            'max_write_time': self.max_write_time,
+        }
+
+    def log_stats(self):
+        """
+        Log the statistics of the writer and reset them.
+        """
+        stats = self.stats()
+        logger.debug(f"Command writer on {self.name}: {stats['commands']} commands, {stats['bytes']} bytes, "
+                     f"{stats['errors']} errors, max depth {stats['max_depth']}, "
+                     f"queue mean {1000 * stats['mean_queue_time']:.2f} ms "
+                     f"max {1000 * stats['max_queue_time']:.2f} ms, "
+                     f"write mean {1000 * stats['mean_write_time']:.2f} ms "
+                     f"max {1000 * stats['max_write_time']:.2f} ms")
+        self.reset_stats()
+
+    def close(self):
+        """
+        Stop the writer thread, failing the commands still queued.
+        The command being written, if any, is completed.
+        """
+        with self.condition:
+            self.running = False
+            pending = list(self.queue)
+            self.queue.clear()
+            self.condition.notify()
+        for _, description, future, _ in pending:
+            future.set_exception(ConnectionError(f'Port closed. Cannot send {description}'))
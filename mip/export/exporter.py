@@ -0,0 +1,210 @@
+"""
+Export of the received data packets to txt or csv files, without Kivy.
+
+`CSVExporterBase` writes the packets delivered by the subscriber of its
+board to a new file for each streaming session, with a header holding
+the settings of the board. Sessions are opened and closed by the
+subscriber thread too, after the packets received before streaming
+started or stopped, and `session_open` tells when the file is complete. Its settings are held in
+`mip.communication.observable` properties, so that it can run in
+processes without Kivy. The GUI uses its subclass
+`mip.export.csv_exporter.CSVExporter`, whose properties are Kivy
+properties with the same names.
+
+This module does not depend on Kivy.
+"""
+from datetime import datetime
+import json
+from loguru import logger
+from pathlib import Path
+import threading
+import time
+from mip.communication import latency
+from mip.communication.observable import Observable, ObservableProperty
+from mip.communication.sequence import GAP_FILL_NAN, MissingPacket
+
+PACKET_BUFFER_MAX_DIM = 10
+
+class CSVExporterBase(Observable):
+    save_data = ObservableProperty(False)
+    data_sample_rate = ObservableProperty('')
+    temp_rh_sample_rate = ObservableProperty('')
+    temp_rh_rep = ObservableProperty('')
+    custom_header = ObservableProperty('')
+    session_open = ObservableProperty(False)
+
+    def __init__(self, gap_fill=GAP_FILL_NAN, file_suffix=''):
+        logger.debug('Data Exporter Initialized')
+        self.load_export_settings()
+        # Packets are added, and the session is opened and closed,
+        # by the subscriber thread; settings are changed by others
+        self.lock = threading.RLock()
+        self.packet_list = []
+        self.gap_fill = gap_fill
+        self.file_suffix = file_suffix
+    
+    def load_export_settings(self):
+        if (Path('settings.json').exists()):
+            with open('settings.json', 'r') as f:
+                settings_json = json.load(f)
+                self.save_data = settings_json['save_data']
+                self.data_format = settings_json['data_format']
+                self.data_path = Path(settings_json['data_path'])
+                self.custom_header = ''
+                if (self.data_format == 'csv'):
+                    self.delim = ','
+                else:
+                    self.delim = ' '
+        else:
+            self.save_data = False
+            self.data_path = Path.cwd() / 'Data'
+            self.data_format = 'txt'
+            self.custom_header = ''
+            self.delim = ' '
+
+    def set_output_path(self, instance, path):
+        if (Path(path).exists()):
+            self.data_path = Path(path)
+            logger.debug(f'Saving data in {self.data_path}')
+        else:
+            self.data_path = Path.cwd() / 'Data'
+            logger.debug(f'Path does not exist. Saving data in {self.data_path}')
+    
+    def set_output_format(self, instance, data_format):
+        if (data_format != 'txt' and data_format != 'csv'):
+            logger.critical(f'{data_format} is not a valid format. Using txt instead.')
+            self.data_format = 'txt'
+            self.delim = ' '
+        else:
+            self.data_format = data_format
+            logger.debug(f'Saving data in {self.data_format} format')
+            if (self.data_format == 'csv'):
+                self.delim = ','
+            else:
+                self.delim = ' '
+
+    def is_streaming(self, instance, streaming):
+        with self.lock:
+            if (streaming):
+                self.packet_list = []
+                self.init_file()
+                self.session_open = True
+            else:
+                self.close_file()
+                self.session_open = False
+
+    def init_file(self):
+        # Times of the packets are exported in seconds from this instant
+        curr_time = datetime.now()
+        self.start_time = time.monotonic_ns()
+        self.start_datetime = curr_time
+        self.file_name = datetime.strftime(curr_time, "%Y%m%d_%H%M%S") + self.file_suffix + '.' + self.data_format
+        self.file_name = self.data_path /self.file_name
+        if (self.save_data):
+            # The default folder is created only when it is used
+            self.data_path.mkdir(parents=True, exist_ok=True)
+            self.write_header()
+
+    def write_header(self):
+        header = ''
+        header += f'% Data sample rate: {self.data_sample_rate}'
+        header += '\n'
+        header += f'% Temperature and RH sample rate: {self.temp_rh_sample_rate}'
+        header += '\n'
+        header += f'% Temperature and RH repeatability: {self.temp_rh_rep}'
+        header += '\n'
+        header += f'% Custom Header: {self.custom_header}'
+        header += '\n'
+        header += f'% Start time: {self.start_datetime.isoformat(timespec="microseconds")}'
+        header += '\n'
+        header += "Packet_ID"
+        header += self.delim
+        header += "Temperature"
+        header += self.delim
+        header += "Humidity"
+        header += self.delim
+        header += "Ch 1"
+        header += self.delim
+        header += "Ch 2"
+        header += self.delim
+        header += "Ch 3"
+        header += self.delim
+        header += "Ch 4"
+        header += self.delim
+        header += "Time"
+        header += self.delim
+        header += "CRC_Valid"
+        header += '\n'
+        with open(self.file_name, 'a') as f:
+            f.write(header)
+
+    def add_batch(self, batch):
+        """
+        Add all the packets of a `mip.communication.packets.DataPacketBatch`.
+        """
+        with self.lock:
+            if (self.save_data and self.session_open):
+                for packet in batch:
+                    self.add_packet(packet)
+
+    def add_packet(self, packet):
+        """
+        Add a packet to the file of the export session. Packets received
+        when no session is open, e.g. after streaming stopped, are ignored.
+        """
+        with self.lock:
+            if (not (self.save_data and self.session_open)):
+                return
+            if (self.gap_fill == GAP_FILL_NAN):
+                # Write a row of NaN values for each lost packet
+                sequence = packet.get_sequence()
+                for missing in range(sequence - packet.get_missing_before(), sequence):
+                    self.packet_list.append(MissingPacket(missing))
+            self.packet_list.append(packet)
+            if (len(self.packet_list) >= PACKET_BUFFER_MAX_DIM):
+                for packet_temp in self.packet_list:
+                    self.write_packet(packet_temp)
+                self.packet_list = []
+
+    def write_packet(self, packet):
+        monitor = latency.monitor
+        if (monitor is not None):
+            write_start = time.perf_counter_ns()
+        row = ''
+        row += str(packet.get_packet_counter())
+        row += self.delim
+        if not (packet.has_temperature_data()):
+            row += ''
+            row += self.delim
+            row += ''
+        else:
+            row += str(packet.get_temperature())
+            row += self.delim
+            row += str(packet.get_humidity())
+        row += self.delim
+        cap_values = packet.get_capacitance_array()
+        for idx, capacitance in enumerate(cap_values):
+            row += str(capacitance)
+            if (idx < (len(cap_values) - 1)):
+                row += self.delim
+        row += self.delim
+        packet_time = packet.get_time()
+        if (packet_time is None):
+            row += 'nan'
+        else:
+            row += f'{(packet_time - self.start_time) / 1e9:.6f}'
+        row += self.delim
+        row += '1' if (packet.has_valid_crc()) else '0'
+        row += '\n'
+        with open(self.file_name, 'a') as f:
+            f.write(row)
+        if (monitor is not None):
+            monitor.record(latency.STAGE_WRITE, time.perf_counter_ns() - write_start)
+            if (not isinstance(packet, MissingPacket)):
+                monitor.record_since(latency.STAGE_READ_TO_DISK, packet.get_timestamp())
+
+    def close_file(self):
+        if (len(self.packet_list) > 0 and self.save_data):
+            for packet_temp in self.packet_list:
+                self.write_packet(packet_temp)
+        self.packet_list = []
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Conversion of the files written by the application.
+
+An exported recording, written by `mip.export.csv_exporter.CSVExporter`,
+can be turned into a raw capture, so that sessions recorded before raw
+captures existed can be replayed with `mip.communication.replay`.
+
+This module does not depend on Kivy.
+"""
+import math
+from pathlib import Path
+
+from loguru import logger
+
+from mip.communication.capture import CaptureWriter, CAPTURE_FILE_EXTENSION
+from mip.communication.commands import SAMPLE_RATES, TEMP_RH_CONFIG
+from mip.communication.decoding import (encode_temperature, encode_humidity,
+                                        encode_capacitance, INVALID_TEMPERATURE)
+from mip.communication.framing import build_data_frame, build_sample_rate_frame
+from mip.communication.sequence import COUNTER_MODULO
+
+RECORDING_HEADER_PREFIX = '%'
+"""
+First character of the header lines of an exported recording.
+"""
+
+DEFAULT_RECORDING_SAMPLE_RATE = '100 Hz'
+"""
+Sample rate assumed for recordings whose header does not report it.
+"""
+
+
+def read_recording_header(lines):
+    """
+    Parse the header lines of an exported recording.
+
+    Args:
+        - lines: the lines of the file
+
+    Returns:
+        - dictionary with the header fields, e.g. `{'Data sample rate': '100 Hz'}`
+        - number of header lines, column names included
+    """
+    header = {}
+    n_lines = 0
+    for line in lines:
+        if (not line.startswith(RECORDING_HEADER_PREFIX)):
+            break
+        key, _, value = line[1:].partition(':')
+        header[key.strip()] = value.strip()
+        n_lines += 1
+    return header, n_lines + 1
+
+
+def recording_to_capture(recording_path, capture_path=None):
+    """
+    Convert an exported recording into a raw capture.
+
+    Each row becomes a data frame, with the packet counter of the row,
+    timestamped with the time column of the recording, if present, or
+    according to the sample rate in the header otherwise. Rows of lost
+    packets and of packets that failed the CRC check are skipped, so
+    that the replay shows the same losses. The capture starts with a
+    sample rate frame holding the settings of the recording.
+
+    Args:
+        - recording_path: path of the exported recording, in txt or csv format
+        - capture_path: path of the capture, the recording path with the capture extension if None
+
+    Returns:
+        - the path of the capture
+
+    Raises:
+        - FileExistsError: if the capture file already exists
+
+    Usage:
+    >>> recording_to_capture('Data/20210304_101500.txt')
+    PosixPath('Data/20210304_101500.mipcap')
+    """
+    recording_path = Path(recording_path)
+    if (capture_path is None):
+        capture_path = recording_path.with_suffix(CAPTURE_FILE_EXTENSION)
+    if (Path(capture_path).exists()):
+        raise FileExistsError(f'{capture_path} already exists')
+    with open(recording_path, 'r') as f:
+        lines = f.read().splitlines()
+    header, n_header_lines = read_recording_header(lines)
+    sample_rate = header.get('Data sample rate') or DEFAULT_RECORDING_SAMPLE_RATE
+    if (sample_rate not in SAMPLE_RATES):
+        logger.warning(f'Unknown sample rate {sample_rate!r}, using {DEFAULT_RECORDING_SAMPLE_RATE}')
+        sample_rate = DEFAULT_RECORDING_SAMPLE_RATE
+    sample_period = int(1e9 / int(sample_rate.split(' ')[0]))
+    temp_rh_config = TEMP_RH_CONFIG.get(header.get('Temperature and RH sample rate'), {}).get(
+        header.get('Temperature and RH repeatability'), [0, 0])
+    delim = ',' if (recording_path.suffix == '.csv') else ' '
+
+    capture = CaptureWriter(capture_path, port_name=str(recording_path))
+    timestamp = 0
+    capture.write(build_sample_rate_frame(SAMPLE_RATES.index(sample_rate), *temp_rh_config), timestamp)
+    n_frames = 0
+    previous_counter = None
+    for line in lines[n_header_lines:]:
+        fields = line.split(delim)
+        if (len(fields) < 7):
+            continue
+        try:
+            packet_counter = int(fields[0])
+            capacitances = [float(value) for value in fields[3:7]]
+        except ValueError:
+            continue
+        lost = any(math.isnan(value) for value in capacitances)
+        if (not lost and len(fields) > 8 and fields[8] == '0'):
+            # The packet counter of a packet with a wrong CRC cannot be trusted
+            continue
+        if (previous_counter is not None):
+            timestamp += sample_period * ((packet_counter - previous_counter) % COUNTER_MODULO or COUNTER_MODULO)
+        previous_counter = packet_counter
+        if (lost):
+            continue
+        if (len(fields) > 7 and fields[7] != 'nan'):
+            timestamp = int(float(fields[7]) * 1e9)
+        temperature_raw = encode_temperature(INVALID_TEMPERATURE)
+        humidity_raw = 0
+        if (fields[1] != '' and fields[2] != ''):
+            temperature_raw = encode_temperature(float(fields[1]))
+            humidity_raw = encode_humidity(float(fields[2]))
+        capdac, capacitance_raw = zip(*(encode_capacitance(value) for value in capacitances))
+        capture.write(build_data_frame(packet_counter, temperature_raw, humidity_raw,
+                                       capdac, capacitance_raw), timestamp)
+        n_frames += 1
+    capture.close()
+    logger.info(f'Converted {recording_path} into {capture_path}: {n_frames} data frames')
+    return Path(capture_path)
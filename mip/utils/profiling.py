@@ -0,0 +1,365 @@
+"""
+Profiling of the threads of the application.
+
+Profiling the whole GUI with `python -m cProfile main.py` only profiles
+the main thread, where the Kivy frame loop runs, and misses the reader
+threads of the boards and the thread of the exporter. This module
+profiles each of them separately, with its own `cProfile` profiler:
+
+    - `THREAD_READER`: the reader thread of each board, see
+      `mip.communication.mserial.MIPSerial.read_data`, or the event
+      loop thread of the asyncio transport
+    - `THREAD_EXPORTER`: the thread delivering the data to the exporter
+      of each board, see `mip.communication.subscribers`
+    - `THREAD_UI`: the main thread, running the Kivy frame loop
+
+It can also sample the stacks of all the threads on a timer, which costs
+much less than `cProfile` and suits long sessions. The samples are
+written in the collapsed stack format, one line per stack with its
+count, read by flame graph tools such as flamegraph.pl and speedscope.
+
+Profiling is enabled with environment variables, or with the matching
+command line options of `main.py`:
+
+    - `MIP_PROFILE`: comma separated threads to profile, e.g. `reader,ui`, or `all`
+    - `MIP_PROFILE_SAMPLING`: interval, in milliseconds, of the stack sampler
+    - `MIP_PROFILE_DIR`: folder of the profiles, `Profiles` by default
+
+The profiles are written when the application exits and, on POSIX
+systems, whenever the process receives SIGUSR1, e.g. `kill -USR1 <pid>`.
+There is one `.prof` file per thread, to be read with `pstats` or
+snakeviz, and one `.txt` file with the stack samples.
+
+Since Python 3.12 only one `cProfile` profiler can be active at a time,
+and it profiles all the threads: only the first profiled thread is
+profiled, and stack sampling is the way to tell the threads apart.
+
+This module does not depend on Kivy.
+"""
+import atexit
+from collections import Counter
+import cProfile
+from datetime import datetime
+import os
+from pathlib import Path
+import pstats
+import signal
+import sys
+import threading
+
+from loguru import logger
+
+THREAD_READER = 'reader'
+THREAD_EXPORTER = 'exporter'
+THREAD_UI = 'ui'
+
+PROFILED_THREADS = (THREAD_READER, THREAD_EXPORTER, THREAD_UI)
+"""
+Threads that can be profiled with `cProfile`.
+"""
+
+PROFILE_ENV_VAR = 'MIP_PROFILE'
+"""
+Environment variable holding the comma separated threads to profile, or `all`.
+"""
+
+PROFILE_SAMPLING_ENV_VAR = 'MIP_PROFILE_SAMPLING'
+"""
+Environment variable holding the interval, in milliseconds, of the stack sampler.
+"""
+
+PROFILE_DIR_ENV_VAR = 'MIP_PROFILE_DIR'
+"""
+Environment variable holding the folder of the profiles.
+"""
+
+DEFAULT_SAMPLING_INTERVAL = 10
+"""
+Default interval, in milliseconds, of the stack sampler.
+"""
+
+MAX_STACK_DEPTH = 64
+"""
+Maximum number of frames of a sampled stack, from the innermost one.
+"""
+
+
+def parse_threads(value):
+    """
+    Return the threads to profile from a comma separated string.
+
+    Usage:
+    >>> parse_threads('reader, ui')
+    ('reader', 'ui')
+    >>> parse_threads('all')
+    ('reader', 'exporter', 'ui')
+    """
+    names = tuple(name.strip() for name in value.split(',') if name.strip() != '')
+    if ('all' in names):
+        return PROFILED_THREADS
+    for name in names:
+        if (name not in PROFILED_THREADS):
+            logger.warning(f'Unknown thread {name!r} to profile, expected one of {PROFILED_THREADS}')
+    return tuple(name for name in names if name in PROFILED_THREADS)
+
+
+class ProfileSnapshot():
+    """
+    Statistics of a running `cProfile.Profile`, taken without stopping it,
+    in the form loaded by `pstats.Stats`.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.stats = {}
+
+    def create_stats(self):
+        self.profile.snapshot_stats()
+        self.stats = self.profile.stats
+
+
+class StackSampler():
+    """
+    Sample the stacks of all the threads on a timer, from a dedicated thread.
+
+    Args:
+        - interval: time between two samples, in seconds
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.counts = Counter()
+        self.n_samples = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profiler sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while (not self.stop_event.wait(self.interval)):
+            self.sample(own_ident)
+
+    def sample(self, own_ident=None):
+        """
+        Count the current stack of each thread.
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if (ident == own_ident):
+                continue
+            stack = []
+            while (frame is not None and len(stack) < MAX_STACK_DEPTH):
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread {ident}').replace(';', ','))
+            stacks.append(';'.join(reversed(stack)))
+        with self.lock:
+            self.counts.update(stacks)
+            self.n_samples += 1
+
+    def write(self, path):
+        """
+        Write the stacks sampled so far in the collapsed stack format.
+        """
+        with self.lock:
+            counts = list(self.counts.items())
+            n_samples = self.n_samples
+        with open(path, 'w') as f:
+            for stack, count in sorted(counts):
+                f.write(f'{stack} {count}\n')
+        return n_samples
+
+
+class ProfilingSession():
+    """
+    Profilers of the threads and stack sampler of the application.
+
+    Args:
+        - threads: threads to profile with `cProfile`, among `PROFILED_THREADS`
+        - sampling_interval: interval of the stack sampler, in milliseconds, no sampling if None
+        - output_dir: folder of the profiles, `Profiles` in the working directory if None
+    """
+
+    def __init__(self, threads=(), sampling_interval=None, output_dir=None):
+        self.threads = tuple(threads)
+        self.output_dir = Path(output_dir) if (output_dir is not None) else Path.cwd() / 'Profiles'
+        self.file_prefix = datetime.strftime(datetime.now(), "%Y%m%d_%H%M%S")
+        self.lock = threading.Lock()
+        self.running = {}
+        self.finished = {}
+        self.sampler = None
+        if (sampling_interval is not None):
+            self.sampler = StackSampler(sampling_interval / 1000)
+            self.sampler.start()
+
+    def is_profiled(self, thread):
+        return thread in self.threads
+
+    def profiled(self, thread, target, name=None):
+        """
+        Return a function running `target` under a `cProfile` profiler
+        of its own, if the thread is profiled, or `target` itself.
+
+        Args:
+            - thread: one of `PROFILED_THREADS`
+            - target: the function run by the thread
+            - name: name of the profile, the thread if None
+        """
+        if (not self.is_profiled(thread)):
+            return target
+        name = name or thread
+
+        def run_profiled(*args, **kwargs):
+            profile = self.start_profile(name)
+            try:
+                return target(*args, **kwargs)
+            finally:
+                if (profile is not None):
+                    self.stop_profile(name, profile)
+        return run_profiled
+
+    def start_profile(self, name):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active, only one at a time since Python 3.12
+            logger.warning(f'Could not profile {name}: another profiler is active')
+            return None
+        with self.lock:
+            self.running.setdefault(name, []).append(profile)
+        logger.debug(f'Profiling {name} thread')
+        return profile
+
+    def stop_profile(self, name, profile):
+        """
+        Stop a profile, from the thread it profiles, and keep its statistics.
+        """
+        profile.disable()
+        with self.lock:
+            self.running[name].remove(profile)
+            self.finished.setdefault(name, []).append(profile)
+
+    def dump(self):
+        """
+        Write the statistics of each profile and the stack samples collected
+        so far. The running profiles are not stopped, so this function can
+        be called at any time, from any thread.
+
+        Returns:
+            - list of the paths of the files written
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            profiles = {name: [ProfileSnapshot(profile) for profile in self.running.get(name, [])] +
+                        list(self.finished.get(name, []))
+                        for name in set(self.running) | set(self.finished)}
+        paths = []
+        for name, name_profiles in sorted(profiles.items()):
+            if (len(name_profiles) == 0):
+                continue
+            stats = pstats.Stats(*name_profiles)
+            path = self.output_dir / f'{self.file_prefix}_{name}.prof'
+            stats.dump_stats(path)
+            paths.append(path)
+        if (self.sampler is not None):
+            path = self.output_dir / f'{self.file_prefix}_samples.txt'
+            n_samples = self.sampler.write(path)
+            paths.append(path)
+            logger.debug(f'{n_samples} stack samples in {path}')
+        logger.info(f"Profiles written: {', '.join(str(path) for path in paths)}")
+        return paths
+
+    def close(self):
+        """
+        Stop the stack sampler and write the profiles.
+        """
+        if (self.sampler is not None):
+            self.sampler.stop()
+        return self.dump()
+
+
+session = None
+"""
+The `ProfilingSession` of the application, None when profiling is disabled.
+"""
+
+
+def configure(threads=(), sampling_interval=None, output_dir=None):
+    """
+    Enable profiling, replacing the current session, if any. The
+    profiles are written at exit and, on POSIX systems, on SIGUSR1.
+
+    Args:
+        - threads: threads to profile, see `ProfilingSession`
+        - sampling_interval: interval of the stack sampler, in milliseconds
+        - output_dir: folder of the profiles
+
+    Returns:
+        - the `ProfilingSession`, or None if nothing is profiled
+    """
+    global session
+    if (session is not None):
+        atexit.unregister(session.close)
+        session.close()
+        session = None
+    if (len(threads) == 0 and sampling_interval is None):
+        return None
+    session = ProfilingSession(threads, sampling_interval, output_dir)
+    atexit.register(session.close)
+    if (hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread()):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: session.dump())
+    sampling = f'every {sampling_interval} ms' if (sampling_interval is not None) else 'disabled'
+    logger.info(f'Profiling threads {session.threads}, stack sampling {sampling}, '
+                f'profiles in {session.output_dir}')
+    return session
+
+
+def configure_from_environment():
+    """
+    Enable profiling according to the `MIP_PROFILE`, `MIP_PROFILE_SAMPLING`
+    and `MIP_PROFILE_DIR` environment variables, if set.
+    """
+    threads = parse_threads(os.environ.get(PROFILE_ENV_VAR, ''))
+    sampling_interval = os.environ.get(PROFILE_SAMPLING_ENV_VAR)
+    if (sampling_interval is not None):
+        try:
+            sampling_interval = float(sampling_interval) or DEFAULT_SAMPLING_INTERVAL
+        except ValueError:
+            logger.warning(f'Invalid {PROFILE_SAMPLING_ENV_VAR} {sampling_interval!r}, '
+                           f'sampling every {DEFAULT_SAMPLING_INTERVAL} ms')
+            sampling_interval = DEFAULT_SAMPLING_INTERVAL
+    return configure(threads, sampling_interval, os.environ.get(PROFILE_DIR_ENV_VAR))
+
+
+def profiled(thread, target, name=None):
+    """
+    Return `target` wrapped to run under its own profiler if the thread
+    is profiled, see `ProfilingSession.profiled`, or `target` itself.
+
+    Usage:
+    >>> read_thread = threading.Thread(target=profiled(THREAD_READER, board.read_data))
+    """
+    if (session is None):
+        return target
+    return session.profiled(thread, target, name)
+
+
+def dump():
+    """
+    Write the profiles collected so far, if profiling is enabled.
+    """
+    if (session is not None):
+        return session.dump()
+    return []
+
+
+configure_from_environment()
@@ -1,12 +1,15 @@
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
+from kivy.core.window import Window
 from kivy.properties import ObjectProperty
 from kivy.uix.boxlayout import BoxLayout
 
 from loguru import logger
 
-from mip.communication.mserial import MIPSerial
+from mip.communication.board_manager import BoardManager
+from mip.communication import latency
 import mip.communication
 from mip.widgets.dialogs import ClosePopup
+from mip.widgets.utils import LatencyOverlay
 
 class ContainerLayout(BoxLayout):
     """
@@ -44,16 +47,21 @@ class ContainerLayout(BoxLayout):
     """
     
     def __init__(self, **kwargs):
-        self.serial = MIPSerial()
+        self.serial = BoardManager().primary_board
         self.serial.bind(connected=self.connection_event)
         super(ContainerLayout, self).__init__(**kwargs)
         
         # Start moving progress bar based on connection status
         self.pb_update_sign = 1
         self.pb_update_event = Clock.schedule_interval(self.progress_bar_update, 0.05)
+
+        # Show the latency statistics on top of the window, once the layout is in it
+        if (latency.monitor is not None):
+            Clock.schedule_once(lambda dt: Window.add_widget(LatencyOverlay()))
     
     def on_toolbar(self, instance, value):
-        self.serial.bind(is_streaming=self.toolbar.is_streaming)
+        # Export settings are locked until the file of the last session is complete
+        self.serial.exporter.bind(session_open=self.toolbar.is_streaming)
         self.toolbar.bind(data_path=self.serial.exporter.set_output_path)
         self.toolbar.bind(data_format=self.serial.exporter.set_output_format)
         self.toolbar.bind(save_data=self.serial.exporter.setter('save_data'))
@@ -74,13 +82,15 @@ class ContainerLayout(BoxLayout):
         updated properly.
         """
         self.serial.bind(battery_voltage=self.top_bar.update_battery_level)
+        self.serial.exporter.bind(session_open=self.top_bar.export_session_changed)
     
     def on_graph_manager(self, instance, value):
         self.serial.bind(data_sample_rate=self.graph_manager.setter('data_sample_rate'))
         self.serial.bind(temperature_sample_rate=self.graph_manager.setter('temperature_sample_rate'))
         self.serial.bind(sample_rate_num_samples=self.graph_manager.setter('num_samples_per_second'))
-        self.serial.add_callback(self.graph_manager.update_plots)
+        self.serial.add_batch_callback(self.graph_manager.queue_batch)
 
+    @mainthread
     def connection_event(self, instance, value):
         """
         Callback called on serial connection event.
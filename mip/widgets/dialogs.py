@@ -6,8 +6,8 @@ from kivy.uix.spinner import Spinner
 from kivy.uix.popup import Popup
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.textinput import TextInput
-from mip.communication.mserial import MIPSerial
-import time
+from mip.communication.board_manager import BoardManager
+from mip.communication.commands import SAMPLE_RATE_REPLY_TIMEOUT, failed_future
 
 class PopupRetrieval(Popup):
     """
@@ -18,8 +18,12 @@ class PopupRetrieval(Popup):
     It implements sevaral methods that the sub classes can further 
     implement to perform the desired operations.
 
+    The commands sent to the board return futures, see
+    `MIPSerial.send_command`: the retrieval and the checking complete
+    as soon as the board acknowledges the command, or when it fails.
+
     Args:
-        - retrieval_timeout: the total timeout to wait for retrieval completion.
+        - retrieval_timeout: the maximum time to wait for the board to acknowledge a command.
 
     Usage:
     >>> class SampleRatePopup(PopupRetrieval):
@@ -45,11 +49,38 @@ class PopupRetrieval(Popup):
     of the configuration.
     """
 
-    def __init__(self, retrieval_timeout = 1, **kwargs):
+    def __init__(self, retrieval_timeout = SAMPLE_RATE_REPLY_TIMEOUT, **kwargs):
         super(PopupRetrieval, self).__init__(**kwargs)
+        self.retrieval_timeout = retrieval_timeout
+        self.command_future = None
         self.pb_update_sign = 1
         self.pb_update_event = Clock.schedule_interval(self.update_progress_bar, timeout=0.01)
-        Clock.schedule_once(self.retrieval_completed, timeout=retrieval_timeout)
+        self.watch_command(self.retrieve(), self.retrieval_completed)
+
+    def retrieve(self):
+        """
+        Send the command retrieving the current configuration from
+        the board. Subclasses must return the future of the command.
+        """
+        return failed_future(NotImplementedError('retrieve is not implemented'))
+
+    def watch_command(self, future, callback):
+        """
+        Call `callback` in the Kivy thread as soon as the future of
+        a command is done. The future is stored in `command_future`.
+
+        Args:
+            - future: the `concurrent.futures.Future` of the command
+            - callback: function called with the Clock `dt` argument
+        """
+        self.command_future = future
+        future.add_done_callback(lambda future: Clock.schedule_once(callback))
+
+    def command_succeeded(self):
+        """
+        Return True if the board acknowledged the last command.
+        """
+        return self.command_future is not None and self.command_future.exception() is None
 
     def update_progress_bar(self, dt):
         """
@@ -82,15 +113,18 @@ class PopupRetrieval(Popup):
         self.pb_update.value = 100
         self.update_button.disabled = False
         self.spinner_layout.disabled = False
-        self.message_label.text = 'Retrieval completed'
+        if (self.command_succeeded()):
+            self.message_label.text = 'Retrieval completed'
+        else:
+            self.message_label.text = 'Retrieval failed'
     
-    def start_checking(self, check_timeout=1):
+    def start_checking(self, future):
         """
-        Start the clock timeout to check the 
-        successfull configuration. 
+        Wait for the acknowledge of a configuration
+        command to check the successfull configuration.
 
         Args:
-            - check_timeout: the timeout for the checking.
+            - future: the future of the configuration command.
         """
         # Widgets enable/disable
         self.ok_button.disabled = True
@@ -101,7 +135,7 @@ class PopupRetrieval(Popup):
         # Progress bar update
         self.pb_update_sign = 1
         self.pb_update_event = Clock.schedule_interval(self.update_progress_bar, timeout=0.01)
-        Clock.schedule_once(self.checking_completed, timeout=check_timeout)
+        self.watch_command(future, self.checking_completed)
 
     def checking_completed(self, dt):
         """
@@ -140,11 +174,13 @@ class PopupRetrieval(Popup):
 class SampleRateDialog(PopupRetrieval):
 
     def __init__(self, **kwargs):
-        self.serial = MIPSerial()
-        self.serial.retrieve_sample_rate_from_board()
+        self.serial = BoardManager().primary_board
         self.title = 'Sample Rate'
         super(SampleRateDialog, self).__init__(**kwargs)
 
+    def retrieve(self):
+        return self.serial.retrieve_sample_rate_from_board(timeout=self.retrieval_timeout)
+
     def on_spinner_layout(self, instance, value):
         self.spinner_layout.add_widget(Label(text='Sample Rate'))   
         self.data_sample_rate_spinner = Spinner(values=self.serial.available_sample_rates)
@@ -156,25 +192,26 @@ class SampleRateDialog(PopupRetrieval):
 
     def checking_completed(self, dt):
         super(SampleRateDialog, self).checking_completed(dt)
-        if (self.serial.configured_sample_rate == self.data_sample_rate_spinner.text):
+        if (self.command_succeeded() and
+                self.command_future.result().sample_rate == self.data_sample_rate_spinner.text):
             self.checking_success()
         else:
             self.checking_fail()
     
     def update(self):
-        self.serial.set_sample_rate(self.data_sample_rate_spinner.text)
-        time.sleep(0.01)
-        self.serial.retrieve_sample_rate_from_board()
-        self.start_checking()
+        self.start_checking(self.serial.set_sample_rate(self.data_sample_rate_spinner.text,
+                                                        timeout=self.retrieval_timeout))
 
 class TRHConfigurationDialog(PopupRetrieval):
     
     def __init__(self, **kwargs):
-        self.serial = MIPSerial()
-        self.serial.retrieve_sample_rate_from_board()
+        self.serial = BoardManager().primary_board
         self.title = 'Temperature Sensor'
         super(TRHConfigurationDialog, self).__init__(**kwargs)
 
+    def retrieve(self):
+        return self.serial.retrieve_sample_rate_from_board(timeout=self.retrieval_timeout)
+
     def on_spinner_layout(self, instance, value):
         self.spinner_layout.add_widget(Label(text='T&RH Sample Rate'))   
         self.sample_rate_spinner = Spinner(values=self.serial.available_temp_rh_sample_rates)
@@ -190,8 +227,12 @@ class TRHConfigurationDialog(PopupRetrieval):
 
     def checking_completed(self, dt):
         super(TRHConfigurationDialog, self).checking_completed(dt)
-        if (self.serial.configured_temp_rh_sample_rate == self.sample_rate_spinner.text):
-            if (self.serial.configured_temp_rh_sample_rep == self.rep_spinner.text):
+        if (not self.command_succeeded()):
+            self.checking_fail()
+            return
+        configuration = self.command_future.result()
+        if (configuration.temp_rh_sample_rate == self.sample_rate_spinner.text):
+            if (configuration.temp_rh_repeatability == self.rep_spinner.text):
                 self.checking_success()
             else:
                 self.checking_fail()
@@ -199,10 +240,9 @@ class TRHConfigurationDialog(PopupRetrieval):
             self.checking_fail()
     
     def update(self):
-        self.serial.set_temperature_settings(self.sample_rate_spinner.text, self.rep_spinner.text)
-        time.sleep(0.01)
-        self.serial.retrieve_sample_rate_from_board()
-        self.start_checking()
+        self.start_checking(self.serial.set_temperature_settings(self.sample_rate_spinner.text,
+                                                                 self.rep_spinner.text,
+                                                                 timeout=self.retrieval_timeout))
 
 
 class SDCardDialog(Popup):
@@ -213,7 +253,7 @@ class SDCardDialog(Popup):
 
     def __init__(self, **kwargs):
         super(SDCardDialog, self).__init__(**kwargs)
-        self.serial = MIPSerial()
+        self.serial = BoardManager().primary_board
 
     def update(self):
         self.serial.set_sd_card_rec_minutes(self.rec_min_spinner.text,self.header_info.text)
@@ -1,24 +1,42 @@
+from kivy.clock import Clock, mainthread
 from kivy.lang import Builder
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
 from kivy.uix.boxlayout import BoxLayout
 from kivy.properties import BooleanProperty, ObjectProperty, NumericProperty
+from collections import deque
+from loguru import logger
+import numpy as np
 import re
+import time
 from mip.graph import LinePlot
+from mip.communication import latency
+from mip.communication.sequence import GAP_FILL_INTERPOLATE, gap_fill_arrays
 from kivy.uix.tabbedpanel import TabbedPanelHeader
 from decimal import Decimal
 from math import pow, isclose
 from kivy.graphics import Color, Rectangle
 
+BATCH_LOG_INTERVAL = 10
+"""
+Interval, in seconds, between two log messages with the
+statistics of the batches of packets delivered to the plots.
+"""
+
 class GraphManager(TabbedPanel):
     data_sample_rate = NumericProperty(0)
     temperature_sample_rate = NumericProperty(0)
     num_samples_per_second = NumericProperty(1)
 
-    def __init__(self, **kwargs):
+    def __init__(self, gap_fill=GAP_FILL_INTERPOLATE, **kwargs):
         super(GraphManager, self).__init__(**kwargs)
         self.n_points_per_update = 10
+        self.gap_fill = gap_fill
+        self.last_values = None
+        self.masked_packets = 0
+        self.pending_packets = deque()
+        self.reset_batch_stats()
         self.tabs_dict = {
             'Capacitance': CapacitancePlot(n_plots=4, color=[(0.5,0.1,0.1,1),
                                                     (0.1,0.5,0.1,1),
@@ -40,16 +58,200 @@ class GraphManager(TabbedPanel):
             # Bind temperature and humidity sample rate
             self.bind(temperature_sample_rate=self.tabs_dict[tab].setter('temperature_sample_rate'))
             self.bind(num_samples_per_second=self.tabs_dict[tab].setter('num_samples_per_second'))
+        # Deliver the packets received between two frames in a single batch
+        self.flush_event = Clock.schedule_interval(self.flush_packets, 0)
+
+    def queue_packet(self, packet):
+        """
+        Queue a data packet to be plotted at the next frame.
+        This function can be called from any thread.
+
+        Args:
+            - packet: the received data packet
+        """
+        self.pending_packets.append((time.monotonic(), packet.batch[packet.index:packet.index + 1]))
+
+    def queue_batch(self, batch):
+        """
+        Queue a batch of data packets to be plotted at the next frame.
+        This function can be called from any thread.
+
+        Args:
+            - batch: the received `mip.communication.packets.DataPacketBatch`
+        """
+        self.pending_packets.append((time.monotonic(), batch))
+
+    def flush_packets(self, dt):
+        """
+        Plot all the packets queued since the previous frame.
+        Called by the Kivy clock once per frame.
+        """
+        pending = self.pending_packets
+        n_queued = len(pending)
+        if (n_queued == 0):
+            return
+        queued = [pending.popleft() for _ in range(n_queued)]
+        latency = time.monotonic() - queued[0][0]
+        batches = [batch for _, batch in queued]
+        self.update_plots_batch(batches)
+        self.update_batch_stats(sum(len(batch) for batch in batches), latency)
+
+    def reset_batch_stats(self):
+        self.batch_stats_start = time.monotonic()
+        self.n_batches = 0
+        self.n_batched_packets = 0
+        self.max_batch_size = 0
+        self.total_batch_latency = 0
+        self.max_batch_latency = 0
+
+    def update_batch_stats(self, batch_size, latency):
+        """
+        Update the statistics of the batches delivered to the plots
+        and log them every `BATCH_LOG_INTERVAL` seconds.
+
+        Args:
+            - batch_size: number of packets in the batch
+            - latency: time elapsed since the oldest packet of the batch was queued
+        """
+        self.n_batches += 1
+        self.n_batched_packets += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.total_batch_latency += latency
+        self.max_batch_latency = max(self.max_batch_latency, latency)
+        if (time.monotonic() - self.batch_stats_start > BATCH_LOG_INTERVAL):
+            logger.debug(f'Plot batches: {self.n_batches}, '
+                         f'size mean {self.n_batched_packets / self.n_batches:.1f} max {self.max_batch_size}, '
+                         f'latency mean {1000 * self.total_batch_latency / self.n_batches:.1f} ms '
+                         f'max {1000 * self.max_batch_latency:.1f} ms')
+            self.reset_batch_stats()
 
     def update_plots(self, packet):
         """
+        Add the values of a single data packet to the plots.
+
+        Args:
+            - packet: the received data packet
+        """
+        self.update_plots_batch([packet.batch[packet.index:packet.index + 1]])
 
+    def update_plots_batch(self, batches):
+        """
+        Add the values of several batches of data packets to the plots,
+        column by column, extending each plot only once.
+
+        If packets were lost right before one of them, the gap is
+        first filled according to the gap fill mode, so that
+        the samples stay aligned with the time axis. Packets that
+        failed the CRC check are not plotted, and are filled as if
+        they were lost. Each sample
+        is placed on the time axis at the time of its packet, the
+        filled samples one nominal sample period apart.
+
+        Args:
+            - batches: list of `mip.communication.packets.DataPacketBatch`, oldest first
         """
-        self.tabs_dict['Temperature'].update_plot(packet.get_temperature(), 
-                                            valid_data=packet.has_temperature_data())
-        self.tabs_dict['Humidity'].update_plot(packet.get_humidity(),
-                                            valid_data=packet.has_temperature_data())
-        self.tabs_dict['Capacitance'].update_plot(packet.get_capacitance_array())
+        monitor = latency.monitor
+        if (monitor is not None):
+            plot_start = time.perf_counter_ns()
+        samples = np.concatenate([batch.samples for batch in batches])
+        packet_times = np.concatenate([batch.get_times() for batch in batches])
+        read_time = int(samples['timestamp'][0])
+        index, missing, self.masked_packets = mask_invalid_samples(samples['crc_valid'], samples['missing_before'],
+                                                                   self.masked_packets)
+        if (len(index) == 0):
+            return
+        samples = samples[index]
+        packet_times = packet_times[index]
+        valid = samples['has_temp_data']
+        values = np.empty((len(samples), 6))
+        values[:, 0] = samples['temperature']
+        values[:, 1] = samples['humidity']
+        values[:, 2:] = samples['capacitance']
+        last_values = self.last_values
+        values[:, 0:2] = hold_last_valid(values[:, 0:2], valid,
+                                         last_values[0:2] if (last_values is not None) else None)
+        filled, owner, back = gap_fill_arrays(last_values, values, missing, self.gap_fill)
+        period = 1e9 / self.num_samples_per_second if (self.num_samples_per_second > 0) else 0
+        times = (packet_times[owner] - (back * period).astype(np.int64)).tolist()
+        valid = valid[owner]
+        self.last_values = values[-1]
+        self.tabs_dict['Temperature'].update_plot_batch(filled[:, 0], valid_data=valid, times=times)
+        self.tabs_dict['Humidity'].update_plot_batch(filled[:, 1], valid_data=valid, times=times)
+        self.tabs_dict['Capacitance'].update_plot_batch(filled[:, 2:], times=times)
+        if (monitor is not None):
+            monitor.record(latency.STAGE_PLOT, time.perf_counter_ns() - plot_start)
+            monitor.record_since(latency.STAGE_READ_TO_PLOT, read_time)
+
+
+def mask_invalid_samples(valid, missing, masked=0):
+    """
+    Drop the invalid samples, counting each of them as a missing packet
+    before the next valid one, so that the gap fill takes their place.
+
+    Args:
+        - valid: array of the validity flags of the samples
+        - missing: array with the number of packets missing right before each sample
+        - masked: number of packets dropped at the end of the previous call,
+          missing before the first valid sample
+
+    Returns:
+        - array with the indices of the valid samples
+        - array with the number of packets missing right before each valid sample
+        - number of packets dropped after the last valid sample
+
+    Usage:
+    >>> index, missing, masked = mask_invalid_samples(np.array([True, False, True, False]), np.array([0, 1, 0, 0]))
+    >>> index.tolist(), missing.tolist(), masked
+    ([0, 2], [0, 2], 1)
+    """
+    missing = np.asarray(missing)
+    if (valid.all() and masked == 0):
+        return np.arange(len(valid)), missing, 0
+    dropped = np.where(valid, 0, missing + 1)
+    dropped[0] += masked
+    dropped = np.cumsum(dropped)
+    index = np.flatnonzero(valid)
+    dropped_before = dropped[index]
+    missing = missing[index] + np.diff(dropped_before, prepend=0)
+    masked = int(dropped[-1] - (dropped_before[-1] if (len(index) > 0) else 0))
+    return index, missing, masked
+
+
+def hold_last_valid(values, valid, last=None):
+    """
+    Replace the values of the invalid samples with the last valid one before them.
+
+    Args:
+        - values: array of the values, one sample per row
+        - valid: array of the validity flags of the samples
+        - last: value used for the invalid samples before the first valid one,
+          None to keep their own values
+
+    Returns:
+        - the array of the values with the invalid ones replaced
+    """
+    index = np.where(valid, np.arange(len(valid)), -1)
+    np.maximum.accumulate(index, out=index)
+    held = values[np.maximum(index, 0)]
+    if (last is not None):
+        held[index < 0] = last
+    else:
+        held[index < 0] = values[index < 0]
+    return held
+
+class TimedLinePlot(LinePlot):
+    """
+    `mip.graph.LinePlot` whose drawing is timed when the latency
+    instrumentation is enabled, see `mip.communication.latency`.
+    """
+
+    def draw(self, *args):
+        monitor = latency.monitor
+        if (monitor is None):
+            return super(TimedLinePlot, self).draw(*args)
+        draw_start = time.perf_counter_ns()
+        super(TimedLinePlot, self).draw(*args)
+        monitor.record(latency.STAGE_DRAW, time.perf_counter_ns() - draw_start)
 
 class GraphPanelItem(BoxLayout):
     graph = ObjectProperty(None)
@@ -76,6 +278,7 @@ class GraphPanelItem(BoxLayout):
             self.legend = legend
         self.temp_points = [[] for _ in range(self.n_plots)]
         self.y_points = [[] for _ in range(self.n_plots)]
+        self.t_points = []
         self.plots = []
         super(GraphPanelItem, self).__init__(**kwargs)
 
@@ -97,6 +300,7 @@ class GraphPanelItem(BoxLayout):
         self.x_points = [x for x in range(-self.n_points, 0)]
         for j in range(self.n_points):
             self.x_points[j] = -self.max_seconds + j * self.time_between_points
+        self.reset_time_points()
         for plot_index in range(self.n_plots):
             self.y_points[plot_index] = [0 for y in range(-self.n_points, 0)]
             if plot_index > len(self.color):
@@ -104,7 +308,7 @@ class GraphPanelItem(BoxLayout):
             else:
                 color = self.color[plot_index]
             #print(color)
-            plot = LinePlot(color=color)
+            plot = TimedLinePlot(color=color)
             plot.line_width = 2
             plot.points = zip(self.x_points, self.y_points[plot_index])
             self.plots.append(plot)
@@ -163,9 +367,11 @@ class GraphPanelItem(BoxLayout):
         self.graph.x_ticks_major = major_ticks
         self.graph.x_ticks_minor = minor_ticks
 
+    @mainthread
     def on_data_sample_rate(self, instance, value):
         self.plot_settings.update_sample_rate(value)
     
+    @mainthread
     def on_temperature_sample_rate(self, instance, value):
         self.plot_settings.update_temperature_sample_rate(value)
     
@@ -186,12 +392,63 @@ class GraphPanelItem(BoxLayout):
         if (self.autoscale):
             self.autoscale_plots()
 
+    def reset_time_points(self):
+        """
+        Set the times of the plotted points to the fixed time axis,
+        in nanoseconds, until samples with their own times arrive.
+        """
+        self.t_points = [int(x * 1e9) for x in self.x_points]
+
+    def update_time_points(self, times):
+        """
+        Store the times of new samples and place all the points
+        on the time axis, relative to the newest sample.
+
+        Args:
+            - times: list of the times of the samples, in nanoseconds of the monotonic clock
+        """
+        t_points = self.t_points
+        n_new = min(len(times), len(t_points))
+        del t_points[:n_new]
+        t_points.extend(times[len(times) - n_new:])
+        latest = t_points[-1]
+        self.x_points = [(t - latest) / 1e9 for t in t_points]
+
+    def update_plot_batch(self, values, valid_data=None, times=None):
+        """
+        Add several samples to the plots and update them once.
+
+        Args:
+            - values: array of samples, with one column per plot,
+              or a single column
+            - valid_data: array of validity flags, one per sample
+            - times: list of the times of the samples, in nanoseconds of the
+              monotonic clock, or None to keep the fixed time axis
+        """
+        if (len(values) == 0):
+            return
+        columns = np.asarray(values).reshape(len(values), -1).T
+        if (times is not None):
+            self.update_time_points(times)
+        for plot_index in range(self.n_plots):
+            y_points = self.y_points[plot_index]
+            new_points = columns[plot_index]
+            n_new = min(len(new_points), len(y_points))
+            del y_points[:n_new]
+            y_points.extend(new_points[len(new_points) - n_new:].tolist())
+            self.plots[plot_index].points = zip(self.x_points, y_points)
+
+        if (self.autoscale):
+            self.autoscale_plots()
+
+    @mainthread
     def on_num_samples_per_second(self, instance, value):
         self.n_points = self.max_seconds * self.num_samples_per_second  # Number of points to plot
         self.x_points = [x for x in range(-self.n_points, 0)]
         self.time_between_points = (self.max_seconds)/float(self.n_points)
         for j in range(self.n_points):
             self.x_points[j] = -self.max_seconds + j * self.time_between_points
+        self.reset_time_points()
         if (self.num_samples_per_second < 30):
             self.n_points_per_update = 1
         else:
@@ -242,7 +499,6 @@ class TemperaturePlot(GraphPanelItem):
 
     def on_graph(self, instance, value):
         super(TemperaturePlot, self).on_graph(instance, value)
-        print(self.color)
         self.graph.ylabel = 'Temperature (C)'
         self.graph.ymax = 30
         self.graph.ymin = 5
@@ -255,6 +511,13 @@ class TemperaturePlot(GraphPanelItem):
             self.last_temperature = value
         super(TemperaturePlot, self).update_plot(value)
 
+    def update_plot_batch(self, values, valid_data, times=None):
+        if (len(values) == 0):
+            return
+        values = hold_last_valid(np.asarray(values), np.asarray(valid_data), self.last_temperature)
+        self.last_temperature = float(values[-1])
+        super(TemperaturePlot, self).update_plot_batch(values, times=times)
+
 
 class HumidityPlot(GraphPanelItem):
     def __init__(self, **kwargs):
@@ -276,6 +539,13 @@ class HumidityPlot(GraphPanelItem):
             self.last_humidity = value
         super(HumidityPlot, self).update_plot(value)
 
+    def update_plot_batch(self, values, valid_data, times=None):
+        if (len(values) == 0):
+            return
+        values = hold_last_valid(np.asarray(values), np.asarray(valid_data), self.last_humidity)
+        self.last_humidity = float(values[-1])
+        super(HumidityPlot, self).update_plot_batch(values, times=times)
+
 class CurrentPlot(GraphPanelItem):
     def on_graph(self, instance, value):
         super(CurrentPlot, self).on_graph(instance, value)
@@ -2,10 +2,10 @@
 Classes to handle Top, Bottom, and Lateral toolbars.
 """
 
-from mip.communication.mserial import MIPSerial
+from mip.communication.board_manager import BoardManager
 import mip.communication
 import mip.widgets.dialogs as dialogs
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
 from kivy.properties import BooleanProperty, NumericProperty, ObjectProperty, StringProperty
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
@@ -22,17 +22,25 @@ class BottomBar(BoxLayout):
     """
     message_label = ObjectProperty(None)
     connection_label = ObjectProperty(None)
+    loss_label = ObjectProperty(None)
     def __init__(self, **kwargs):
         super(BottomBar, self).__init__(**kwargs)
-        self.board = MIPSerial()
+        self.board = BoardManager().primary_board
         self.board.bind(connected=self.connection_event)
+        self.board.bind(packet_loss_per_minute=self.update_packet_loss)
 
     def update_text(self, instance, value):
         self.message_label.text = value
     
+    @mainthread
     def update_str(self, value):
         self.message_label.text = value
 
+    @mainthread
+    def update_packet_loss(self, instance, value):
+        self.loss_label.text = f'Loss: {value:.0f}/min'
+
+    @mainthread
     def connection_event(self, instance, value):
         if (value == mip.communication.mserial.BOARD_FOUND):
             self.connection_label.update_color(1, 1, 0, 0.7)
@@ -100,7 +108,6 @@ class Toolbar(BoxLayout):
         self.message_string = "Configuring data export"
         self.load_export_settings()
         popup = dialogs.ExportDialog()
-        print(self.custom_header)
         popup.set_settings(self.save_data, self.data_format, self.data_path, self.custom_header)
 
         popup.bind(save_data=self.setter('save_data'))
@@ -133,6 +140,7 @@ class Toolbar(BoxLayout):
             if (not Path(self.data_path).exists()):
                 Path(self.data_path).mkdir(parents=True, exist_ok=True)
 
+    @mainthread
     def is_streaming(self, instance, value):
         self.disabled = value
 
@@ -143,7 +151,7 @@ class TopBar(BoxLayout):
 
     def __init__(self, **kwargs):
         super(TopBar, self).__init__(**kwargs)
-        self.ser = MIPSerial()
+        self.ser = BoardManager().primary_board
 
     def streaming(self):
         """!
@@ -152,16 +160,31 @@ class TopBar(BoxLayout):
         This function checks whether the board is currently
         streaming data or not, and based on that triggers
         the start/stop of data streaming and also 
-        updates the text of the button. 
+        updates the text of the button. Streaming is
+        started and stopped on all the connected boards.
+        After stopping, the button stays disabled until the
+        exporter has written the last packets to the file.
         """
         if (self.ser.is_streaming):
-            self.ser.stop_streaming()
+            BoardManager().stop_streaming()
             self.streaming_button.text = 'Start'
+            self.streaming_button.disabled = True
         else:
-            self.ser.start_streaming()
+            BoardManager().start_streaming()
             self.streaming_button.text = 'Stop'
 
 
+    @mainthread
+    def export_session_changed(self, instance, value):
+        """!
+        @brief Callback called when the export session is opened or closed.
+
+        Enable the streaming button again once the export
+        session of the last streaming is closed.
+        """
+        if (not value and self.ser.connected == mip.communication.mserial.BOARD_CONNECTED):
+            self.streaming_button.disabled = False
+
     def enable_widgets(self, enabled):
         """!
         @brief Enable/disable widgets for interaction with board.
@@ -173,6 +196,7 @@ class TopBar(BoxLayout):
             self.battery_label.color = (1,1,1,1)
             self.battery_label.text = f'Battery: '
     
+    @mainthread
     def update_battery_level(self, instance, value):
         self.battery_label.text = f'Battery: {value:.1f}'
         if (value >= 3.7):
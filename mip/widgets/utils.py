@@ -0,0 +1,50 @@
+"""
+Utility widgets of the GUI.
+"""
+from kivy.clock import Clock
+from kivy.graphics import Color, Rectangle
+from kivy.uix.label import Label
+
+from mip.communication import latency
+
+LATENCY_OVERLAY_INTERVAL = 1
+"""
+Time, in seconds, between two updates of the latency overlay.
+"""
+
+
+class LatencyOverlay(Label):
+    """
+    Debug overlay showing the latency statistics of each stage
+    of the data path, see `mip.communication.latency`. It is
+    added on top of the window when the instrumentation is enabled.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('font_name', 'RobotoMono-Regular')
+        kwargs.setdefault('font_size', '11sp')
+        kwargs.setdefault('size_hint', (None, None))
+        kwargs.setdefault('halign', 'left')
+        kwargs.setdefault('valign', 'top')
+        super(LatencyOverlay, self).__init__(**kwargs)
+        self.bind(texture_size=self.setter('size'))
+        with self.canvas.before:
+            Color(0, 0, 0, 0.6)
+            self.rect = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self.update_rect, size=self.update_rect)
+        self.update_event = Clock.schedule_interval(self.update_stats, LATENCY_OVERLAY_INTERVAL)
+
+    def update_rect(self, *args):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+
+    def update_stats(self, dt):
+        monitor = latency.monitor
+        if (monitor is None):
+            self.text = ''
+            return
+        self.text = monitor.format_stats()
+        if (self.parent is not None):
+            # Stay in the top right corner of the window
+            self.right = self.parent.width
+            self.top = self.parent.height